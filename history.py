@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""
+    History of the results of the tests, one ring buffer per (wlanid, testid).
+    Each ring has a fixed capacity: the numeric fields of the records are
+    stored in preallocated array.array columns, the text ones in preallocated
+    lists, and the oldest entries are
+    overwritten, so memory stays flat however long the sensor runs.
+"""
+
+import logging
+import math
+import threading
+import time
+from array import array
+
+from results import StatusResult, recordtypes
+
+
+class Ring:
+    """
+        Fixed capacity ring buffer for the results of ONE test.
+        Columns, all of them preallocated with <size> slots:
+            times:  epoch (seconds) when the result was stored
+            status: status of the result ("ok", "timeout", "wrong"...)
+            one array("d") per numeric field of the record type, NaN
+            when the result has no measurements (StatusResult)
+            one list per text field of the record type (the direction of
+            a bandwidth test, the BSSID of a connection), "" when the
+            result has no measurements
+        The other fields (the channel survey, the intervals) are not kept
+    """
+
+    def __init__(self, recordtype, size):
+        """
+            Initialize a ring for records of <recordtype> with <size> slots
+        """
+        self.recordtype = recordtype
+        self.size = size
+        self.fields = [field for field in recordtype._fields
+                       if field not in ("testid", "timestamp", "status") and recordtype.__annotations__[field] in (int, float)]
+        self.textfields = [field for field in recordtype._fields
+                           if field not in ("testid", "timestamp", "status") and recordtype.__annotations__[field] is str]
+        self.testid = 0
+        self.head = 0
+        self.count = 0
+        self.times = array("d", [0.0]) * size
+        self.status = [""] * size
+        self.columns = {}
+        for field in self.fields:
+            self.columns[field] = array("d", [math.nan]) * size
+        self.texts = {}
+        for field in self.textfields:
+            self.texts[field] = [""] * size
+
+    def append(self, record, when=None):
+        """
+            Store <record> in the ring, overwriting the oldest one when full
+            <when> is the epoch of the result, defaults to now
+        """
+        slot = self.head
+        self.testid = record.testid
+        self.times[slot] = time.time() if when is None else when
+        self.status[slot] = record.status
+        measured = isinstance(record, self.recordtype)
+        for field in self.fields:
+            self.columns[field][slot] = getattr(record, field) if measured else math.nan
+        for field in self.textfields:
+            self.texts[field][slot] = getattr(record, field) if measured else ""
+        self.head = (slot + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def slots(self, last=None, since=None):
+        """
+            Returns the LIST of slots, oldest first, of the last <last> entries
+            and/or the entries stored at or after epoch <since>
+        """
+        count = self.count if last is None else max(0, min(last, self.count))
+        first = (self.head - count) % self.size
+        slots = [(first + index) % self.size for index in range(count)]
+        if since is not None:
+            slots = [slot for slot in slots if self.times[slot] >= since]
+        return slots
+
+    def record(self, slot):
+        """
+            Rebuild the record stored in <slot>
+        """
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.times[slot]))
+        if math.isnan(self.columns[self.fields[0]][slot]):
+            return StatusResult(self.testid, timestamp, self.status[slot], self.recordtype.test)
+        values = {}
+        for field in self.fields:
+            values[field] = self.recordtype.__annotations__[field](self.columns[field][slot])
+        for field in self.textfields:
+            values[field] = self.texts[field][slot]
+        return self.recordtype(self.testid, timestamp, self.status[slot], **values)
+
+    def aggregate(self, field, last=None, since=None):
+        """
+            Rolling aggregate of <field> over the selected entries, see slots()
+            Entries without measurements are not taken into account
+            Returns a DICT {"count", "min", "max", "mean"}, None values when
+            there are no measurements
+        """
+        column = self.columns[field]
+        values = [column[slot] for slot in self.slots(last, since) if not math.isnan(column[slot])]
+        if not values:
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        return {"count": len(values), "min": min(values), "max": max(values), "mean": math.fsum(values) / len(values)}
+
+
+class History:
+    """
+        Results history of the sensor, a Ring per (wlanid, testid) created
+        the first time a result of that test is stored
+    """
+
+    # Default number of results kept per (wlanid, testid)
+    size = 1024
+
+    def __init__(self, logname="log", size=None):
+        """
+            Initialize
+        """
+        # Initialize the logging
+        self.logname = logname + ".History"
+        self.logger = logging.getLogger(self.logname)
+        self.logger.info("Logging initialization of History. Done.")
+        if size is not None:
+            self.size = int(size)
+        self.rings = {}
+        # Results are stored from several threads when the WLANs run in parallel
+        self.lock = threading.Lock()
+
+    def add(self, wlanid, record, when=None):
+        """
+            Store <record>, a result of the WLAN <wlanid>, in its ring
+            Returns True if stored, False if the kind of test is unknown
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        recordtype = recordtypes.get(record.test)
+        if recordtype is None:
+            logger.info("Unknown kind of test <" + str(record.test) + ">, result not stored in history.")
+            return False
+        key = (wlanid, record.testid)
+        with self.lock:
+            ring = self.rings.get(key)
+            if ring is None or ring.recordtype is not recordtype:
+                ring = Ring(recordtype, self.size)
+                self.rings[key] = ring
+            ring.append(record, when)
+        return True
+
+    def last(self, wlanid, testid, count=1):
+        """
+            Returns the LIST of the last <count> records of the test, oldest first
+        """
+        with self.lock:
+            ring = self.rings.get((wlanid, testid))
+            if ring is None:
+                return []
+            return [ring.record(slot) for slot in ring.slots(last=count)]
+
+    def since(self, wlanid, testid, since):
+        """
+            Returns the LIST of the records of the test stored at or after
+            epoch <since>, oldest first
+        """
+        with self.lock:
+            ring = self.rings.get((wlanid, testid))
+            if ring is None:
+                return []
+            return [ring.record(slot) for slot in ring.slots(since=since)]
+
+    def aggregate(self, wlanid, testid, field, last=None, since=None):
+        """
+            Rolling aggregate {"count", "min", "max", "mean"} of <field> of the
+            test, over the last <last> results and/or since epoch <since>
+            Returns None if there is no history for the test
+        """
+        with self.lock:
+            ring = self.rings.get((wlanid, testid))
+            if ring is None:
+                return None
+            return ring.aggregate(field, last, since)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+"""
+    Helpers for the iperf3 JSON output: the "intervals" array is turned into
+    compact column arrays (one array("d") per measurement, one slot per
+    interval), and summarized with stability metrics. The "end" summary is
+    aggregated over all the streams and directions of the test.
+    Iperf3Stream consumes the "--json-stream" output line by line, while
+    iperf3 runs.
+"""
+
+import logging
+import math
+from array import array
+from results import StreamResult
+
+# Columns kept of each interval, by protocol. Measurements that iperf3 does
+# not report for an interval (e.g. the UDP jitter on the sender side) are NaN
+columns = {
+    "TCP": ["start", "end", "bits_per_second", "retransmits", "snd_cwnd", "rtt"],
+    "UDP": ["start", "end", "bits_per_second", "packets", "jitter_ms", "lost_packets", "lost_percent"]
+}
+
+# Column added with the throughput of the reverse direction ("sum_bidir_reverse")
+# of bidirectional tests
+reverse_column = "reverse_bits_per_second"
+
+# An interval is out of slow start when its throughput reaches this fraction
+# of the median throughput of the test
+slowstart_fraction = 0.9
+
+
+def intervalvalues(interval, protocol, bidirectional=False):
+    """
+        Returns the DICT {column: value} of one iperf3 <interval>
+        The "sum" of the streams is used for the throughput, retransmits,
+        packets and loss; snd_cwnd is added over the streams, and the rtt and
+        jitter averaged over them. Plus reverse_column if <bidirectional>
+    """
+    total = interval.get("sum", {})
+    streams = interval.get("streams", [])
+    values = {}
+    for column in columns[protocol]:
+        if column in ("snd_cwnd", "rtt", "jitter_ms"):
+            found = [float(stream[column]) for stream in streams if column in stream]
+            if not found:
+                values[column] = float(total.get(column, math.nan))
+            elif column == "snd_cwnd":
+                values[column] = math.fsum(found)
+            else:
+                values[column] = math.fsum(found) / len(found)
+        else:
+            values[column] = float(total.get(column, math.nan))
+    if bidirectional:
+        values[reverse_column] = float(interval.get("sum_bidir_reverse", {}).get("bits_per_second", math.nan))
+    return values
+
+
+def intervalseries(intervals, protocol="TCP", bidirectional=False):
+    """
+        Returns the column arrays of the iperf3 <intervals> (the "intervals"
+        of the JSON output): DICT {column: array("d")}, see columns, plus
+        reverse_column if <bidirectional>
+    """
+    series = {column: array("d") for column in columns[protocol]}
+    if bidirectional:
+        series[reverse_column] = array("d")
+    for interval in intervals:
+        for column, value in intervalvalues(interval, protocol, bidirectional).items():
+            series[column].append(value)
+    return series
+
+
+def stability(series):
+    """
+        Returns the stability metrics of the throughput in <series> (see
+        intervalseries()), a DICT with:
+            "min_interval_bps": throughput of the worst interval
+            "cv_bps": coefficient of variation (stdev / mean) of the
+                      throughput of the intervals
+            "slowstart_s": time until the first interval reaching
+                           slowstart_fraction of the median throughput
+        All 0 when there are no intervals
+    """
+    throughput = [value for value in series.get("bits_per_second", []) if not math.isnan(value)]
+    if not throughput:
+        return {"min_interval_bps": 0.0, "cv_bps": 0.0, "slowstart_s": 0.0}
+    mean = math.fsum(throughput) / len(throughput)
+    variance = math.fsum((value - mean) ** 2 for value in throughput) / len(throughput)
+    ordered = sorted(throughput)
+    middle = len(ordered) // 2
+    median = ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+    slowstart = 0.0
+    for index, value in enumerate(series["bits_per_second"]):
+        if value >= slowstart_fraction * median:
+            slowstart = series["start"][index]
+            break
+    return {
+        "min_interval_bps": ordered[0],
+        "cv_bps": math.sqrt(variance) / mean if mean > 0 else 0.0,
+        "slowstart_s": slowstart
+    }
+
+
+def intervalfields(j1):
+    """
+        Returns the DICT with the interval fields of the result records
+        ("intervals" and the stability metrics, without "slowstart_s"
+        for UDP), from the iperf3 JSON output <j1>
+    """
+    test_start = j1.get("start", {}).get("test_start", {})
+    protocol = "UDP" if test_start.get("protocol") == "UDP" else "TCP"
+    series = intervalseries(j1.get("intervals", []), protocol, bool(test_start.get("bidir", 0)))
+    fields = stability(series)
+    if protocol == "UDP":
+        # Constant rate, no slow start
+        del fields["slowstart_s"]
+    fields["intervals"] = series
+    return fields
+
+
+def direction(j1):
+    """
+        Returns the direction of the test of the iperf3 JSON output <j1>:
+        "up" (the client sends), "down" (reverse) or "bidir"
+    """
+    test_start = j1.get("start", {}).get("test_start", {})
+    if test_start.get("bidir", 0):
+        return "bidir"
+    return "down" if test_start.get("reverse", 0) else "up"
+
+
+def streamresults(j1):
+    """
+        Returns the TUPLE of StreamResult of the streams in the "end" of the
+        iperf3 JSON output <j1>
+        The "sender" flag of the streams (iperf3 >= 3.7) tells whether the
+        client sent the stream, older versions follow the test direction
+    """
+    default = "down" if direction(j1) == "down" else "up"
+    streams = []
+    for stream in j1["end"].get("streams", []):
+        sender = stream.get("sender", {})
+        receiver = stream.get("receiver", sender)
+        if "sender" in sender:
+            way = "up" if sender["sender"] else "down"
+        else:
+            way = default
+        streams.append(StreamResult(
+            socket=int(sender.get("socket", 0)),
+            direction=way,
+            bytes=int(receiver.get("bytes", 0)),
+            bits_per_second=float(receiver.get("bits_per_second", 0.0)),
+            retransmits=int(sender.get("retransmits", 0)),
+            max_snd_cwnd=int(sender.get("max_snd_cwnd", 0)),
+            mean_rtt=int(sender.get("mean_rtt", 0))
+        ))
+    return tuple(streams)
+
+
+def summaryfields(j1):
+    """
+        Returns the DICT with the summary fields of a BandwidthResult, from
+        the "end" of the iperf3 JSON output <j1>: the totals of "sum_sent",
+        the cwnd and RTTs of all the sending streams (max of the max, min of
+        the min, mean of the means), the throughput received in each
+        direction and the per stream breakdown
+    """
+    end = j1["end"]
+    way = direction(j1)
+    # Very old iperf3 versions only have the summary of each stream
+    sent = end.get("sum_sent") or end["streams"][0]["sender"]
+    streams = [stream.get("sender", {}) for stream in end.get("streams", [])]
+    cwnds = [int(stream["max_snd_cwnd"]) for stream in streams if "max_snd_cwnd" in stream]
+    maxrtts = [int(stream["max_rtt"]) for stream in streams if "max_rtt" in stream]
+    minrtts = [int(stream["min_rtt"]) for stream in streams if "min_rtt" in stream]
+    meanrtts = [int(stream["mean_rtt"]) for stream in streams if "mean_rtt" in stream]
+    received = float(end.get("sum_received", {}).get("bits_per_second", 0.0))
+    reverse = float(end.get("sum_received_bidir_reverse", {}).get("bits_per_second", 0.0))
+    return {
+        "seconds": float(sent["seconds"]),
+        "bytes": int(sent["bytes"]),
+        "bits_per_second": float(sent["bits_per_second"]),
+        "retransmits": int(sent.get("retransmits", 0)),
+        "max_snd_cwnd": max(cwnds, default=0),
+        "max_rtt": max(maxrtts, default=0),
+        "min_rtt": min(minrtts, default=0),
+        "mean_rtt": sum(meanrtts) // len(meanrtts) if meanrtts else 0,
+        "direction": way,
+        "parallel_streams": int(j1.get("start", {}).get("test_start", {}).get("num_streams", 1)),
+        "uplink_bps": received if way != "down" else 0.0,
+        "downlink_bps": received if way == "down" else reverse,
+        "streams": streamresults(j1)
+    }
+
+
+class Iperf3Stream:
+    """
+        Runs iperf3 with "--json-stream" (iperf3 >= 3.17), that writes one
+        JSON event per line as the test runs: "start", one "interval" per
+        interval, then "end" (or "error"). Each line is parsed as it
+        arrives and only the start and end events are kept, so the memory
+        does not grow with the length of the test.
+        Iterating it (async for) runs the command and yields the record of
+        each interval, a DICT {column: value} (see intervalvalues()), so
+        the intervals received before a timeout or an abort are not lost.
+        After the iteration:
+            status:
+                0  -> not finished, the consumer stopped iterating
+                1  -> OK, "end" received
+                3  -> iperf3 failed or aborted ("error", or no "end")
+                20 -> problem calling the operating system
+                21 -> iperf3 killed after <timeout> seconds
+            start, end: "data" of the start and end events, None if missing
+            error: message of the error event, or of the failure
+            intervals: number of intervals received
+
+        Example:
+            stream = Iperf3Stream(["/usr/bin/iperf3", "--client", "192.168.1.5", "--json-stream"], 30)
+            async for record in stream:
+                print(record["end"], record["bits_per_second"])
+            -> 1.000214 302115541.097686
+               2.000407 330427786.880134 ...
+            stream.status, stream.end["sum_sent"]
+    """
+
+    def __init__(self, command_shell, timeout=None, logname="log"):
+        """
+            Initialize, <command_shell> is the iperf3 command LIST, with
+            "--json-stream", killed after <timeout> seconds
+        """
+        # Initialize the logging
+        self.logname = logname + ".Iperf3Stream"
+        self.logger = logging.getLogger(self.logname)
+        self.command_shell = command_shell
+        self.timeout = timeout
+        self.status = 0
+        self.start = None
+        self.end = None
+        self.error = ""
+        self.intervals = 0
+
+    def __aiter__(self):
+        return self.records()
+
+    async def records(self):
+        """
+            Run iperf3 and yield the record of each interval, see the class
+        """
+        import asyncio
+        import json
+        from osshell import OSshell
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        protocol = "TCP"
+        bidirectional = False
+        lines = OSshell(self.logname).astream(self.command_shell, self.timeout)
+        try:
+            async for line in lines:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logger.debug("Not an iperf3 event: <" + line.strip() + ">")
+                    continue
+                if event.get("event") == "interval":
+                    self.intervals += 1
+                    yield intervalvalues(event["data"], protocol, bidirectional)
+                elif event.get("event") == "start":
+                    self.start = event["data"]
+                    test_start = self.start.get("test_start", {})
+                    protocol = "UDP" if test_start.get("protocol") == "UDP" else "TCP"
+                    bidirectional = bool(test_start.get("bidir", 0))
+                elif event.get("event") == "end":
+                    self.end = event["data"]
+                elif event.get("event") == "error":
+                    self.error = str(event.get("data", ""))
+            self.status = 1 if self.end is not None else 3
+        except asyncio.TimeoutError:
+            self.status = 21
+            self.error = "timeout"
+        except ValueError as error:
+            # Line longer than the limit of astream()
+            self.status = 3
+            self.error = str(error)
+        except OSError as error:
+            self.status = 20
+            self.error = str(error)
+        finally:
+            await lines.aclose()
+        if self.status > 1:
+            logger.warning("iperf3 stream ended with status <" + str(self.status) + "> after <" + str(self.intervals) + "> intervals: " + self.error)
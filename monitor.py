@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import collections
+import logging
+import os
+import re
+import select
+import signal
+import subprocess
+import threading
+import time
+
+from osshell import OSshell
+from rtnetlink import Rtnetlink
+
+
+class Monitor:
+    """
+        Background monitor of the wireless interfaces: streams "iw event -t"
+        (association, roaming, channel switch) and the rtnetlink link and
+        address events (authorized, DHCP done, address lost), keeping a live
+        association state per interface and a timestamped log of events.
+
+        Example:
+            monitor = Monitor(wireless)
+            monitor.start()
+            monitor.state("wlp1s0")
+            -> {"connected": True, "bssid": "18:64:72:ea:f0:f2", "ssid": "Temp",
+                "freq": 5180, "since": 1514481797.2, "signal": -56.0}
+            monitor.events(since=t0, ifname="wlp1s0", kinds=["roam"])
+            monitor.stop()
+    """
+
+    # Events kept in the log, the oldest are dropped
+    maxevents = 1024
+
+    # Seconds after a disconnection where a connection to another BSSID
+    # is considered a roam
+    roam_window = 10
+
+    # Seconds to wait for "iw event" and the threads to finish when stopping
+    stop_timeout = 5
+
+    def __init__(self, wireless, logname="log"):
+        """
+            Initialize, <wireless> is the Wireless object of the sensor
+        """
+        # Initialize the logging
+        self.logname = logname + ".Monitor"
+        self.logger = logging.getLogger(self.logname)
+        self.logger.info("Logging initialization of Monitor. Done.")
+        self.wireless = wireless
+        self.states = {}
+        self.eventlog = collections.deque(maxlen=self.maxevents)
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.proc = None
+        self.threads = []
+
+    def start(self):
+        """
+            Start the monitor threads, returns True if running
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        if self.threads:
+            return True
+        self.stopping.clear()
+        for wlan_interface in self.wireless.wirelessinfo:
+            ifname = wlan_interface["logical name"]
+            self.refresh(ifname)
+            # Link state as last seen by netlink, see netlinkevent()
+            operstate = self.wireless.sysfs.operstate(ifname)
+            with self.lock:
+                self.states[ifname]["operstate"] = operstate
+        try:
+            self.proc = subprocess.Popen(["sudo", "/sbin/iw", "event", "-t"], stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL, start_new_session=True, bufsize=0)
+        except OSError as error:
+            logger.warning("Could NOT start <iw event>: " + str(error))
+            return False
+        self.threads = [threading.Thread(target=self.iwloop, args=(self.proc,), name="monitor-iw", daemon=True),
+                        threading.Thread(target=self.netlinkloop, name="monitor-netlink", daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        logger.info("Monitor started.")
+        return True
+
+    def stop(self):
+        """
+            Stop the monitor threads, waiting at most stop_timeout seconds
+            for each of them
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        self.stopping.set()
+        if self.proc is not None:
+            # sudo relays SIGTERM to iw, with SIGKILL only sudo would die
+            OSshell.killgroup(self.proc, signal.SIGTERM)
+            try:
+                self.proc.wait(self.stop_timeout)
+            except subprocess.TimeoutExpired:
+                OSshell.killgroup(self.proc)
+                try:
+                    self.proc.wait(self.stop_timeout)
+                except subprocess.TimeoutExpired:
+                    logger.warning("<iw event> did NOT finish, leaving it.")
+            self.proc = None
+        for thread in self.threads:
+            thread.join(self.stop_timeout)
+            if thread.is_alive():
+                logger.warning("Monitor thread <" + thread.name + "> did NOT finish, leaving it.")
+        self.threads = []
+        logger.info("Monitor stopped.")
+
+    def iwloop(self, proc):
+        """
+            Thread reading the output of "iw event -t" (<proc>) line by line
+            The pipe is polled every second, so the thread ends when the
+            monitor stops even if a root "iw" survives sudo and keeps the
+            pipe open
+        """
+        fd = proc.stdout.fileno()
+        pending = b""
+        try:
+            while not self.stopping.is_set():
+                ready, _, _ = select.select([fd], [], [], 1)
+                if not ready:
+                    continue
+                data = os.read(fd, 65536)
+                if not data:
+                    break
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    line = line.decode("utf-8", "replace")
+                    try:
+                        self.iwevent(line)
+                    except Exception as error:
+                        self.logger.warning("Could NOT process iw event <" + line.strip() + ">: " + str(error))
+        finally:
+            # Nobody else reads the pipe, closing it can't block
+            proc.stdout.close()
+        if not self.stopping.is_set():
+            self.logger.warning("iw event finished, no more association events.")
+
+    def netlinkloop(self):
+        """
+            Thread reading the rtnetlink link and address events
+        """
+        netlink = Rtnetlink(self.logname)
+        try:
+            netlink.subscribe()
+            while not self.stopping.is_set():
+                for event in netlink.event(1):
+                    self.netlinkevent(event)
+        except OSError as error:
+            self.logger.warning("Could NOT follow the address events with netlink: " + str(error))
+        finally:
+            netlink.unsubscribe()
+
+    def iwevent(self, line):
+        """
+            Process one <line> of "iw event -t":
+            1514481797.123456: wlp1s0 (phy #0): connected to 18:64:72:ea:f0:f2
+        """
+        match = re.match(r"(\d+\.\d+): (\S+) \(phy #\d+\): (.*)", line.strip())
+        if not match:
+            return
+        when = float(match.group(1))
+        ifname = match.group(2)
+        message = match.group(3)
+        if message.startswith("connected to "):
+            bssid = message.split()[2].lower()
+            with self.lock:
+                previous = dict(self.states.get(ifname, {}))
+            state = self.refresh(ifname, when)
+            lastbssid = previous.get("bssid", "")
+            if lastbssid not in ("", bssid) and (previous.get("connected") or when - previous.get("since", 0) <= self.roam_window):
+                self.record({"time": when, "ifname": ifname, "event": "roam", "from": lastbssid, "bssid": bssid,
+                             "ssid": state.get("ssid", "")})
+            else:
+                self.record({"time": when, "ifname": ifname, "event": "connect", "bssid": bssid,
+                             "ssid": state.get("ssid", "")})
+        elif message.startswith("disconnected"):
+            with self.lock:
+                state = self.states.setdefault(ifname, {})
+                state["connected"] = False
+                state["since"] = when
+            self.wireless.invalidateassociation(ifname)
+            self.record({"time": when, "ifname": ifname, "event": "disconnect", "reason": message,
+                         "bssid": state.get("bssid", "")})
+        elif message.startswith("ch_switch_notify"):
+            freq = re.search(r"freq (\d+)", message)
+            with self.lock:
+                state = self.states.setdefault(ifname, {})
+                if freq:
+                    state["freq"] = int(freq.group(1))
+            self.record({"time": when, "ifname": ifname, "event": "chswitch", "freq": state.get("freq", 0)})
+
+    def netlinkevent(self, event):
+        """
+            Process one rtnetlink link or address <event> of a wireless
+            interface
+        """
+        import socket
+
+        if event["event"] == "newlink":
+            with self.lock:
+                state = self.states.get(event["ifname"])
+                if state is None:
+                    return
+                # Wireless links are "dormant" until the 802.1X/PSK handshake
+                # ends. The transition is taken from the netlink events only:
+                # refresh() may already have seen the link up when handling
+                # the iw "connected" event
+                previous = state.get("operstate")
+                state["operstate"] = event["operstate"]
+                state["authorized"] = event["operstate"] == "up"
+                if event["operstate"] != "up" or previous == "up":
+                    return
+            self.record({"time": time.time(), "ifname": event["ifname"], "event": "authorized"})
+            return
+        with self.lock:
+            if event["ifname"] not in self.states or event["family"] != socket.AF_INET:
+                return
+            if event["event"] == "newaddr":
+                self.states[event["ifname"]]["ipaddress"] = event["address"]
+            elif event["event"] == "deladdr":
+                self.states[event["ifname"]].pop("ipaddress", None)
+            else:
+                return
+        kind = "dhcp" if event["event"] == "newaddr" else "addrlost"
+        self.record({"time": time.time(), "ifname": event["ifname"], "event": kind, "address": event["address"]})
+
+    def refresh(self, ifname, when=None):
+        """
+            Read the association state of <ifname> with "iw dev <ifname> link"
+            Returns the state
+        """
+        command_shell = self.wireless.associationcommands(ifname)["link"]
+        status,output,errors = self.wireless.os.runoscommand(command_shell, self.wireless.timeouts["iw"])
+        link = {"connected": False, "bssid": "", "ssid": "", "freq": 0}
+        for line in output.stdout.decode("utf-8").splitlines():
+            line = line.strip()
+            if line.startswith("Connected to"):
+                link["connected"] = True
+                link["bssid"] = line.split()[2].lower()
+            elif line.startswith("SSID:"):
+                link["ssid"] = line.partition(":")[2].strip()
+            elif line.startswith("freq:"):
+                link["freq"] = int(float(line.split()[1]))
+        with self.lock:
+            state = self.states.setdefault(ifname, {})
+            if not link["connected"]:
+                # Keep the last BSSID, to detect roams through a disconnection
+                link["bssid"] = state.get("bssid", "")
+            state.update(link)
+            state["authorized"] = self.wireless.sysfs.operstate(ifname) == "up"
+            state["since"] = time.time() if when is None else when
+            return dict(state)
+
+    def record(self, event):
+        """
+            Add <event> to the log of events
+        """
+        with self.lock:
+            self.eventlog.append(event)
+        self.logger.info("Event <" + event["event"] + "> on <" + event["ifname"] + ">: " + str(event))
+
+    def state(self, ifname):
+        """
+            Returns the live association state of <ifname>, a DICT
+            {"connected", "authorized", "bssid", "ssid", "freq", "since",
+             "ipaddress", "signal"}, signal (dBm) is read now from /proc/net/wireless
+        """
+        with self.lock:
+            state = dict(self.states.get(ifname, {}))
+        level = self.wireless.sysfs.wireless(ifname).get("level")
+        if level is not None:
+            state["signal"] = level
+        return state
+
+    def events(self, since=None, ifname="", kinds=None):
+        """
+            Returns the LIST of events, oldest first, after epoch <since>,
+            of <ifname> ("" all) and of the <kinds> ("roam", "connect",
+            "disconnect", "chswitch", "authorized", "dhcp", "addrlost",
+            None all)
+        """
+        with self.lock:
+            events = list(self.eventlog)
+        return [event for event in events
+                if (since is None or event["time"] >= since)
+                and ifname in ("", event["ifname"])
+                and (kinds is None or event["event"] in kinds)]
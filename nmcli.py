@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+import logging
+from typing import NamedTuple
+
+
+class NmcliConnection(NamedTuple):
+    """
+        A nmcli connection (profile), from "nmcli connection show"
+        device is "" when the connection is not active
+    """
+    name: str
+    uuid: str
+    type: str
+    device: str
+    active: bool
+
+
+class NmcliProfile(NamedTuple):
+    """
+        The settings of a wireless nmcli connection checked by the sensor,
+        "" when the setting is not set
+    """
+    name: str
+    uuid: str
+    ssid: str
+    interface: str
+    band: str
+    bssid: str
+    key_mgmt: str
+    eap: str
+    phase2_auth: str
+    phase2_autheap: str
+
+
+class NmcliClient:
+    """
+        Machine readable access to nmcli: every call uses the terse output
+        with escaping ("nmcli -t -e yes -f <fields>"), so values with ":"
+        (BSSIDs) are split right, and asks for all the needed fields at once.
+        The connections and the profiles of all of them are read with one
+        call each and cached until invalidate(), once per cycle and after
+        any change made through nmcli.
+
+        Example:
+            nmcli = NmcliClient(OSshell(), {"nmcli": 30})
+            nmcli.connections()
+            -> [1, {"Temp": NmcliConnection(name="Temp", uuid="...",
+                    type="802-11-wireless", device="wlp1s0", active=True)}]
+            nmcli.profile("Temp")
+            -> [1, NmcliProfile(name="Temp", ..., bssid="18:64:72:EA:F0:F2", ...)]
+    """
+
+    # Property of each NmcliProfile field
+    profile_properties = {
+        "name": "connection.id",
+        "uuid": "connection.uuid",
+        "interface": "connection.interface-name",
+        "ssid": "802-11-wireless.ssid",
+        "band": "802-11-wireless.band",
+        "bssid": "802-11-wireless.bssid",
+        "key_mgmt": "802-11-wireless-security.key-mgmt",
+        "eap": "802-1x.eap",
+        "phase2_auth": "802-1x.phase2-auth",
+        "phase2_autheap": "802-1x.phase2-autheap"
+    }
+
+    def __init__(self, os, timeouts, logname="log"):
+        """
+            Initialize, <os> is the OSshell to run nmcli, <timeouts> the
+            DICT of timeouts with the "nmcli" one
+        """
+        # Initialize the logging
+        self.logname = logname + ".NmcliClient"
+        self.logger = logging.getLogger(self.logname)
+        self.logger.info("Logging initialization of NmcliClient. Done.")
+        self.os = os
+        self.timeouts = timeouts
+        self.connectioncache = None
+        self.profilecache = None
+
+    def invalidate(self):
+        """
+            Forget the cached connections and profiles
+        """
+        self.connectioncache = None
+        self.profilecache = None
+
+    def terse(self, fields, arguments, timeout=None):
+        """
+            Run "nmcli -t -e yes -f <fields> <arguments>"
+            Returns [status, rows]
+                status:
+                    1 -> OK, rows is a LIST with the LIST of values of
+                         each line of the output
+                    2 -> Problem calling nmcli, or nmcli failed
+        """
+        command_shell = ["nmcli", "-t", "-e", "yes", "-f", ",".join(fields)] + arguments
+        status,output,errors = self.os.runoscommand(command_shell, self.timeouts["nmcli"] if timeout is None else timeout)
+        if status > 1 or output.returncode:
+            self.logger.warning("nmcli <" + " ".join(arguments) + "> failed.")
+            return [2, []]
+        return [1, [self.splitterse(line) for line in output.stdout.decode("utf-8").splitlines()]]
+
+    @staticmethod
+    def splitterse(line):
+        """
+            Split a <line> of nmcli terse output (-t), unescaping the
+            values: ":" and the backslash are escaped with a backslash
+        """
+        fields = [""]
+        escaped = False
+        for char in line:
+            if escaped:
+                fields[-1] += char
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == ":":
+                fields.append("")
+            else:
+                fields[-1] += char
+        return fields
+
+    @staticmethod
+    def value(text):
+        """
+            Returns the value of a setting, "" when it is not set
+        """
+        return "" if text.strip() == "--" else text.strip()
+
+    def connections(self):
+        """
+            Returns [status, {name: NmcliConnection}] with all the nmcli
+            connections, see terse() for status
+        """
+        if self.connectioncache is None:
+            status, rows = self.terse(["NAME", "UUID", "TYPE", "DEVICE", "ACTIVE"], ["connection", "show"])
+            if status > 1:
+                return [status, {}]
+            connections = {}
+            for row in rows:
+                if len(row) != 5:
+                    continue
+                name, uuid, kind, device, active = row
+                connections[name] = NmcliConnection(name, uuid, kind, self.value(device), active == "yes")
+            self.connectioncache = connections
+        return [1, self.connectioncache]
+
+    def active(self):
+        """
+            Returns [status, {name: device}] with the active connections
+        """
+        status, connections = self.connections()
+        return [status, {name: connection.device for name, connection in connections.items() if connection.active}]
+
+    def profiles(self):
+        """
+            Returns [status, {name: NmcliProfile}] with the settings of all
+            the wireless connections, read with one call
+        """
+        if self.profilecache is None:
+            status, connections = self.connections()
+            if status > 1:
+                return [status, {}]
+            uuids = [connection.uuid for connection in connections.values() if connection.type == "802-11-wireless"]
+            profiles = {}
+            if uuids:
+                arguments = ["connection", "show"]
+                for uuid in uuids:
+                    arguments += ["uuid", uuid]
+                status, rows = self.terse(list(self.profile_properties.values()), arguments)
+                if status > 1:
+                    return [status, {}]
+                names = {prop: field for field, prop in self.profile_properties.items()}
+                settings = None
+                for row in rows:
+                    # "setting.property:value", one connection after another
+                    if len(row) < 2 or row[0] not in names:
+                        continue
+                    # Join the rest, in case a value has a ":" that was not escaped
+                    value = self.value(":".join(row[1:]))
+                    if row[0] == "connection.id":
+                        settings = dict.fromkeys(self.profile_properties, "")
+                        profiles[value] = settings
+                    if settings is not None:
+                        settings[names[row[0]]] = value
+                profiles = {name: NmcliProfile(**settings) for name, settings in profiles.items()}
+            self.profilecache = profiles
+        return [1, self.profilecache]
+
+    def profile(self, name):
+        """
+            Returns [status, NmcliProfile] of the wireless connection <name>
+                status:
+                    1 -> OK
+                    2 -> Problem calling nmcli
+                    3 -> No wireless connection <name>, None
+        """
+        status, profiles = self.profiles()
+        if status > 1:
+            return [status, None]
+        if name not in profiles:
+            return [3, None]
+        return [1, profiles[name]]
+
+    def pprint(self):
+        import json
+        status, profiles = self.profiles()
+        return print(json.dumps({name: profile._asdict() for name, profile in profiles.items()}, indent=2))
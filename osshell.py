@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
+import weakref
 
 class OSshell:
     """
@@ -8,6 +9,20 @@ class OSshell:
         with a command shell, this Class execute the command
         and returns
     """
+
+    # Max number of commands running at the same time with arun(), shared by
+    # all the OSshell objects using the same event loop
+    concurrency = 8
+
+    # One semaphore per event loop, bounding the concurrency of arun()
+    semaphores = weakref.WeakKeyDictionary()
+
+    # Seconds waited for a killed command to finish, before abandoning it
+    kill_wait = 2
+
+    # timeout(1), run by sudo so root kills the privileged commands
+    timeout_command = "/usr/bin/timeout"
+
     def __init__(self, logname="log"):
         """
             Initialize
@@ -17,10 +32,13 @@ class OSshell:
         self.logger = logging.getLogger(self.logname)
         self.logger.info("Logging initialization of OSshell. Done.")
 
-    def runoscommand(self, command_shell):
+    def runoscommand(self, command_shell, timeout=None):
         """
             Run the OS command in <command_shell>, a LIST containing the
             command to run for subprocess
+            If <timeout> (seconds) expires, the command and all its children
+            (it runs in its own process group) are killed, see privileged()
+            for the commands run with sudo
             Return [status,
                     output,
                     [[msg],[errno],[strerror]]
@@ -28,6 +46,7 @@ class OSshell:
                 status:
                     1  -> OK, command successfully executed
                     20 -> NOK, problem calling the operating system
+                    21 -> NOK, command killed after <timeout> seconds
         """
         import subprocess
         import sys
@@ -37,13 +56,197 @@ class OSshell:
         strerror = ""
 
         try:
-            p1 = subprocess.run(command_shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            proc = subprocess.Popen(self.privileged(command_shell, timeout), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    start_new_session=True)
 
         except OSError as error:
             errno, strerror = error.args
-            logger.critical("Couldn't execute command <" + command_shell + ">")
+            logger.critical("Couldn't execute command <" + str(command_shell) + ">")
             logger.critical("Error number: " + str(errno))
             logger.critical("Error msg: " + strerror)
+            p1 = subprocess.CompletedProcess(command_shell, 127, b"", b"")
             return [20, p1, ["Couldn't execute command <" + str(command_shell) + ">", errno, strerror]]
 
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("Command <" + str(command_shell) + "> timed out after <" + str(timeout) + ">s, killed.")
+            self.killgroup(proc)
+            try:
+                stdout, stderr = proc.communicate(timeout=self.kill_wait)
+            except subprocess.TimeoutExpired:
+                # Some child (sudo) survived and keeps the pipes open
+                proc.stdout.close()
+                proc.stderr.close()
+                try:
+                    proc.wait(self.kill_wait)
+                except subprocess.TimeoutExpired:
+                    logger.error("Command <" + str(command_shell) + "> could NOT be killed, abandoned.")
+                stdout, stderr = b"", b""
+            p1 = subprocess.CompletedProcess(command_shell, proc.returncode, stdout, stderr)
+            return [21, p1, ["Command timed out <" + str(command_shell) + ">", errno, "timeout"]]
+
+        p1 = subprocess.CompletedProcess(command_shell, proc.returncode, stdout, stderr)
         return [1, p1, ["Command successfully executed", errno, strerror]]
+
+    @staticmethod
+    def killgroup(proc, signum=None):
+        """
+            Kill the process group of <proc>, with SIGKILL or <signum>
+        """
+        import os
+        import signal
+
+        if signum is None:
+            signum = signal.SIGKILL
+        try:
+            os.killpg(proc.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            # Already finished, or owned by root (sudo), kill the leader at least
+            try:
+                proc.send_signal(signum)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    @classmethod
+    def privileged(cls, command_shell, timeout=None):
+        """
+            Returns <command_shell>, run by sudo with timeout(1) when
+            <timeout> (seconds) is indicated:
+                ["sudo", "/usr/bin/timeout", "-s", "KILL", "<timeout>", ...]
+            The commands run as root can't be killed by the sensor, so the
+            limit is enforced by timeout(1) running as root
+            The other commands are returned as they are
+        """
+        import math
+
+        if timeout is None or not command_shell or command_shell[0] != "sudo":
+            return command_shell
+        return ["sudo", cls.timeout_command, "-s", "KILL", str(max(1, math.ceil(timeout)))] + list(command_shell[1:])
+
+    async def arun(self, command_shell, timeout=None):
+        """
+            asyncio version of runoscommand(), so several commands can run
+            at the same time in one event loop.
+            The command runs in its own process group, that is killed when
+            <timeout> (seconds) expires or the calling task is cancelled.
+            At most OSshell.concurrency commands run at the same time.
+            Return [status,
+                    output,
+                    [[msg],[errno],[strerror]]
+                   ]
+                output is a subprocess.CompletedProcess, as in runoscommand()
+                status:
+                    1  -> OK, command successfully executed
+                    20 -> NOK, problem calling the operating system
+                    21 -> NOK, command killed after <timeout> seconds
+        """
+        import asyncio
+        import subprocess
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        async with self.semaphore():
+            try:
+                proc = await asyncio.create_subprocess_exec(*self.privileged(command_shell, timeout),
+                                                            stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE,
+                                                            start_new_session=True)
+            except OSError as error:
+                errno, strerror = error.args
+                logger.critical("Couldn't execute command <" + str(command_shell) + ">")
+                logger.critical("Error number: " + str(errno))
+                logger.critical("Error msg: " + strerror)
+                p1 = subprocess.CompletedProcess(command_shell, 127, b"", b"")
+                return [20, p1, ["Couldn't execute command <" + str(command_shell) + ">", errno, strerror]]
+
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Command <" + str(command_shell) + "> timed out after <" + str(timeout) + ">s, killed.")
+                await self.akillgroup(proc)
+                p1 = subprocess.CompletedProcess(command_shell, proc.returncode, b"", b"")
+                return [21, p1, ["Command timed out <" + str(command_shell) + ">", 0, "timeout"]]
+            except asyncio.CancelledError:
+                logger.warning("Command <" + str(command_shell) + "> cancelled, killed.")
+                await self.akillgroup(proc)
+                raise
+
+        p1 = subprocess.CompletedProcess(command_shell, proc.returncode, stdout, stderr)
+        return [1, p1, ["Command successfully executed", 0, ""]]
+
+    def semaphore(self):
+        """
+            Returns the semaphore of the running event loop, bounding the
+            concurrency of arun() and astream()
+        """
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        semaphore = OSshell.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            OSshell.semaphores[loop] = semaphore
+        return semaphore
+
+    async def astream(self, command_shell, timeout=None, limit=2 ** 20):
+        """
+            asyncio version of runoscommand() yielding each line of the
+            output of the command as soon as it is written, instead of the
+            whole output at the end (async generator), lines up to <limit>
+            bytes. The errors of the command (stderr) are discarded.
+            The command runs in its own process group, that is killed when
+            <timeout> (seconds) expires, the calling task is cancelled or
+            the consumer stops iterating.
+            Raises:
+                OSError -> problem calling the operating system
+                asyncio.TimeoutError -> command killed after <timeout> seconds
+                ValueError -> a line longer than <limit>
+        """
+        import asyncio
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        async with self.semaphore():
+            loop = asyncio.get_event_loop()
+            try:
+                proc = await asyncio.create_subprocess_exec(*self.privileged(command_shell, timeout),
+                                                            stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.DEVNULL,
+                                                            start_new_session=True,
+                                                            limit=limit)
+            except OSError:
+                logger.critical("Couldn't execute command <" + str(command_shell) + ">")
+                raise
+            deadline = None if timeout is None else loop.time() + timeout
+            try:
+                while True:
+                    remaining = None if deadline is None else deadline - loop.time()
+                    line = await asyncio.wait_for(proc.stdout.readline(), remaining)
+                    if not line:
+                        break
+                    yield line.decode("utf-8")
+                await proc.wait()
+            except asyncio.TimeoutError:
+                logger.warning("Command <" + str(command_shell) + "> timed out after <" + str(timeout) + ">s, killed.")
+                raise
+            finally:
+                if proc.returncode is None:
+                    await self.akillgroup(proc)
+
+    async def akillgroup(self, proc):
+        """
+            Kill the process group of <proc> and wait for it to finish, at
+            most kill_wait seconds: then it is abandoned
+        """
+        import asyncio
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        self.killgroup(proc)
+        try:
+            await asyncio.wait_for(proc.wait(), self.kill_wait)
+        except asyncio.TimeoutError:
+            logger.error("Process <" + str(proc.pid) + "> could NOT be killed, abandoned.")
@@ -86,6 +86,63 @@ class Output:
         return outputs
 
 
+    def sendresults(self, wlanid, results):
+        """
+        Send the results of the tests of a WLAN to its enabled outputs
+        Currently only the syslog outputs are sent, one JSON message per result
+        without its interval series, plus one message with the series of all
+        the results, see sendseries()
+        :param wlanid: wlanid of the WLAN tested
+        :param results: LIST of result records (see results.py)
+        :return: number of messages sent
+        """
+        import json
+        from results import resultdict
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        sent = 0
+        for out in self.outputs["outputs"]:
+            if out["wlanid"] != wlanid or out["output"] != "syslog":
+                continue
+            for result in results:
+                data = resultdict(result)
+                data.pop("intervals", None)
+                data["wlanid"] = wlanid
+                out["handler"].info(json.dumps(data))
+                sent += 1
+            sent += self.sendseries(out, wlanid, results)
+        logger.info("Sent <" + str(sent) + "> results of wlanid <" + str(wlanid) + "> to the outputs.")
+        return sent
+
+    def sendseries(self, out, wlanid, results):
+        """
+        Send the interval series of the <results> of a WLAN to the output <out>
+        in one batched write: a single JSON message with the column arrays of
+        each result, {"wlanid", "series": [{"testid", "test", "timestamp",
+        "intervals": {column: LIST}}]}
+        :param out: DICT of the output, with its handler
+        :param wlanid: wlanid of the WLAN tested
+        :param results: LIST of result records (see results.py)
+        :return: number of messages sent, 0 if no result has a series
+        """
+        import json
+        from results import seriesdict
+
+        series = []
+        for result in results:
+            if getattr(result, "intervals", None):
+                series.append({
+                    "testid": result.testid,
+                    "test": result.test,
+                    "timestamp": result.timestamp,
+                    "intervals": seriesdict(result.intervals)
+                })
+        if not series:
+            return 0
+        out["handler"].info(json.dumps({"wlanid": wlanid, "series": series}))
+        return 1
+
     def checkipcconnectivity(self, ipaddress):
         """ Check IP connectovity with ipaddress
             returns True if connectivity with 'ipaddress' is ok
@@ -95,7 +152,7 @@ class Output:
         # /bin/ping will retun 0 if there is ICMP echo response
         # will return 1 if there is NO ICMP echo response
         command_shell = ["/bin/ping","-c2 -w1",ipaddress]
-        status, result, errors = os.runoscommand(command_shell)
+        status, result, errors = os.runoscommand(command_shell, 5)
         # in Python 0 is False, but it's OK for ping
         # in Python 1 is True, but it's NOK for ping
         # so let's change the rule...
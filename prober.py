@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import math
+import socket
+import struct
+import time
+
+# Marks the payload of the probes, to tell them from other traffic
+MAGIC = b"WLAN"
+PAYLOAD = struct.Struct("!4sIQ")
+ICMPHEADER = struct.Struct("!BBHHH")
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Upper edges (ms) of the buckets of the RTT histogram, powers of 2 from
+# 0.25ms to 1024ms, plus one last bucket for the RTTs over 1024ms
+RTT_BUCKETS_MS = tuple(2.0 ** exponent for exponent in range(-2, 11))
+
+
+def rttsummary(rtt_ms):
+    """
+        Returns a DICT with the distribution of the per probe RTTs in
+        <rtt_ms> (NaN for the lost probes), with the DelayResult fields:
+            "d_rtt_p50_ms", "d_rtt_p90_ms", "d_rtt_p99_ms", "d_rtt_p999_ms"
+            "d_rtt_histogram": count of RTTs in each bucket of RTT_BUCKETS_MS
+            "d_loss_bursts": length of each run of consecutive lost probes
+            "d_loss_burst_max": the longest one
+        Vectorized with NumPy when available
+    """
+    try:
+        import numpy
+    except ImportError:
+        return rttsummarypython(rtt_ms)
+    rtts = numpy.asarray(rtt_ms, dtype=float)
+    lost = numpy.isnan(rtts)
+    received = rtts[~lost]
+    summary = {}
+    percentiles = numpy.percentile(received, [50, 90, 99, 99.9]) if received.size else [0.0] * 4
+    for name, value in zip(["d_rtt_p50_ms", "d_rtt_p90_ms", "d_rtt_p99_ms", "d_rtt_p999_ms"], percentiles):
+        summary[name] = float(value)
+    buckets = numpy.searchsorted(numpy.asarray(RTT_BUCKETS_MS), received, side="left")
+    summary["d_rtt_histogram"] = tuple(int(count) for count in numpy.bincount(buckets, minlength=len(RTT_BUCKETS_MS) + 1))
+    # Bursts start where lost goes 0 -> 1, and end where it goes 1 -> 0
+    edges = numpy.diff(numpy.concatenate(([0], lost.astype(numpy.int8), [0])))
+    bursts = numpy.flatnonzero(edges == -1) - numpy.flatnonzero(edges == 1)
+    summary["d_loss_bursts"] = tuple(int(burst) for burst in bursts)
+    summary["d_loss_burst_max"] = int(bursts.max()) if bursts.size else 0
+    return summary
+
+
+def rttsummarypython(rtt_ms):
+    """
+        rttsummary() without NumPy
+    """
+    import bisect
+
+    received = sorted(rtt for rtt in rtt_ms if not math.isnan(rtt))
+    summary = {}
+    for name, percent in [["d_rtt_p50_ms", 50], ["d_rtt_p90_ms", 90], ["d_rtt_p99_ms", 99], ["d_rtt_p999_ms", 99.9]]:
+        if not received:
+            summary[name] = 0.0
+            continue
+        # Linear interpolation, as numpy.percentile
+        position = (len(received) - 1) * percent / 100.0
+        low = int(position)
+        high = min(low + 1, len(received) - 1)
+        summary[name] = received[low] + (received[high] - received[low]) * (position - low)
+    histogram = [0] * (len(RTT_BUCKETS_MS) + 1)
+    for rtt in received:
+        histogram[bisect.bisect_left(RTT_BUCKETS_MS, rtt)] += 1
+    summary["d_rtt_histogram"] = tuple(histogram)
+    bursts = []
+    run = 0
+    for rtt in list(rtt_ms) + [0.0]:
+        if math.isnan(rtt):
+            run += 1
+        elif run:
+            bursts.append(run)
+            run = 0
+    summary["d_loss_bursts"] = tuple(bursts)
+    summary["d_loss_burst_max"] = max(bursts) if bursts else 0
+    return summary
+
+
+class ProbeProtocol(asyncio.DatagramProtocol):
+    """
+        Receives the answers to the probes, stamping them with
+        time.perf_counter_ns() when they arrive
+    """
+
+    def __init__(self, received, count, offset, address):
+        """
+            <received> DICT {seq: ns} filled with the answers, <offset> of the
+            payload in the datagram (8 for ICMP, after the header), only the
+            answers from <address> are taken
+        """
+        self.received = received
+        self.count = count
+        self.offset = offset
+        self.address = address
+        self.done = asyncio.Event()
+
+    def datagram_received(self, data, addr):
+        stamp = time.perf_counter_ns()
+        if addr[0] != self.address or len(data) < self.offset + PAYLOAD.size:
+            return
+        if self.offset and data[0] != ICMP_ECHO_REPLY:
+            return
+        magic, seq, sent = PAYLOAD.unpack_from(data, self.offset)
+        if magic != MAGIC or seq >= self.count or seq in self.received:
+            return
+        self.received[seq] = stamp
+        if len(self.received) == self.count:
+            self.done.set()
+
+    def error_received(self, exc):
+        # ICMP errors (unreachable...), the probe is just lost
+        pass
+
+
+class Prober:
+    """
+        Latency prober running in the asyncio event loop, no subprocess:
+        sends ICMP echo requests with an unprivileged ICMP datagram socket
+        (SOCK_DGRAM/IPPROTO_ICMP, allowed by net.ipv4.ping_group_range),
+        or, when not allowed, UDP datagrams to an echo service (port 7) of
+        the target.
+        Probes are sent on a fixed schedule (every <interval> seconds from
+        the start, no drift) and stamped with time.perf_counter_ns() when
+        sent and when answered, so every RTT is available.
+        Several targets can be probed at the same time from one event loop,
+        see probemany().
+        As "ping -I", the probes can be forced out of an interface
+        (SO_BINDTODEVICE), binding the source address is not enough when
+        several radios are in the same subnet.
+
+        Example:
+            prober = Prober()
+            asyncio.run(prober.probe("127.0.0.1", 10, 0.01))
+            -> [1, {"target": "127.0.0.1", "address": "127.0.0.1",
+                    "method": "icmp", "sent": 10, "interval": 0.01,
+                    "duration_ms": 91.3, "ipg_ms": 10.0,
+                    "rtt_ms": [0.05, 0.04, nan, ...]}]
+    """
+
+    # Size of the payload of each probe, as ping
+    size = 56
+
+    # UDP port of the echo service, when ICMP sockets are not allowed
+    echo_port = 7
+
+    def __init__(self, logname="log"):
+        """
+            Initialize
+        """
+        # Initialize the logging
+        self.logname = logname + ".Prober"
+        self.logger = logging.getLogger(self.logname)
+        self.logger.info("Logging initialization of Prober. Done.")
+
+    def opensocket(self, bindaddress="", ifname=""):
+        """
+            Returns [socket, method], method "icmp" or "udp", the socket
+            bound to the interface <ifname> and to <bindaddress> if indicated
+            Kernels before 5.7 only allow binding to an interface with
+            CAP_NET_RAW, then the socket is only bound to <bindaddress>
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            method = "icmp"
+        except OSError as error:
+            # ICMP datagram sockets not allowed to this group
+            logger.warning("ICMP sockets not allowed <" + str(error) + ">, probing the UDP echo port instead. Add the group of the sensor to net.ipv4.ping_group_range to use ICMP.")
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            method = "udp"
+        try:
+            sock.setblocking(False)
+            if ifname != "":
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, ifname.encode("utf-8"))
+                except PermissionError:
+                    logger.warning("Not allowed to bind the probes to <" + ifname + ">, binding them to the address <" + bindaddress + "> only.")
+            if bindaddress != "":
+                sock.bind((bindaddress, 0))
+        except OSError:
+            sock.close()
+            raise
+        return [sock, method]
+
+    @staticmethod
+    def checksum(data):
+        """
+            Returns the Internet checksum (RFC 1071) of <data>
+        """
+        if len(data) % 2:
+            data += b"\0"
+        total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+        total = (total >> 16) + (total & 0xffff)
+        total += total >> 16
+        return ~total & 0xffff
+
+    def packet(self, method, seq):
+        """
+            Returns the datagram of the probe <seq>
+        """
+        payload = PAYLOAD.pack(MAGIC, seq, time.perf_counter_ns())
+        payload += b"\0" * (self.size - len(payload))
+        if method == "udp":
+            return payload
+        # The kernel sets the identifier of ICMP datagram sockets
+        header = ICMPHEADER.pack(ICMP_ECHO_REQUEST, 0, 0, 0, seq & 0xffff)
+        return ICMPHEADER.pack(ICMP_ECHO_REQUEST, 0, self.checksum(header + payload), 0, seq & 0xffff) + payload
+
+    async def probe(self, target, count, interval=0.2, wait=1.0, bindaddress="", ifname=""):
+        """
+            Send <count> probes to <target> (name or IPv4 address), one every
+            <interval> seconds, and wait up to <wait> seconds after the last
+            one for the answers, out of <ifname> and from <bindaddress> if
+            indicated
+            Returns [status, run]
+                status:
+                    1 -> OK
+                    2 -> Target could not be resolved or probed
+                run = {
+                    "target", "address", "method" ("icmp" or "udp"),
+                    "sent", "interval",
+                    "duration_ms": time from the first probe to the end,
+                    "ipg_ms": mean time between two probes,
+                    "rtt_ms": RTT of each probe, NaN if lost, see rttarray()
+                }
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(target, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        except OSError as error:
+            logger.error("Could NOT resolve <" + str(target) + ">: " + str(error))
+            return [2, "Could NOT resolve <" + str(target) + ">"]
+        address = infos[0][4][0]
+        try:
+            sock, method = self.opensocket(bindaddress, ifname)
+        except OSError as error:
+            logger.error("Could NOT open a socket to probe <" + address + ">: " + str(error))
+            return [2, "Could NOT open a socket to probe <" + address + ">"]
+        port = 0 if method == "icmp" else self.echo_port
+        received = {}
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: ProbeProtocol(received, count, 8 if method == "icmp" else 0, address), sock=sock)
+        sent = [0] * count
+        try:
+            start = loop.time()
+            for seq in range(count):
+                delay = start + seq * interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sent[seq] = time.perf_counter_ns()
+                transport.sendto(self.packet(method, seq), (address, port))
+            try:
+                await asyncio.wait_for(protocol.done.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            ended = time.perf_counter_ns()
+        finally:
+            transport.close()
+        rtts = self.rttarray(sent, received)
+        logger.info("Probed <" + address + "> with <" + method + ">: <" + str(len(received)) + "/" + str(count) + "> answered.")
+        return [1, {
+            "target": target,
+            "address": address,
+            "method": method,
+            "sent": count,
+            "interval": interval,
+            "duration_ms": (ended - sent[0]) / 1e6 if count else 0.0,
+            "ipg_ms": (sent[-1] - sent[0]) / 1e6 / (count - 1) if count > 1 else 0.0,
+            "rtt_ms": rtts
+        }]
+
+    @staticmethod
+    def rttarray(sent, received):
+        """
+            Returns the RTT (ms) of each probe, NaN if lost, from the LIST of
+            <sent> times and the DICT {seq: ns} of <received> times
+            A NumPy array when available, a LIST otherwise
+        """
+        try:
+            import numpy
+        except ImportError:
+            return [(received[seq] - sent[seq]) / 1e6 if seq in received else math.nan for seq in range(len(sent))]
+        rtts = numpy.full(len(sent), numpy.nan)
+        seqs = numpy.fromiter(received.keys(), dtype=numpy.int64, count=len(received))
+        stamps = numpy.fromiter(received.values(), dtype=numpy.int64, count=len(received))
+        rtts[seqs] = (stamps - numpy.asarray(sent, dtype=numpy.int64)[seqs]) / 1e6
+        return rtts
+
+    async def probemany(self, targets, count, interval=0.2, wait=1.0, bindaddress="", ifname=""):
+        """
+            Probe all the <targets> at the same time, see probe()
+            Returns a DICT {target: [status, run]}
+        """
+        runs = await asyncio.gather(*[self.probe(target, count, interval, wait, bindaddress, ifname) for target in targets])
+        return dict(zip(targets, runs))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""
+    Result records of the tests, one type per kind of test.
+    They are NamedTuples: no per-instance __dict__, numeric fields are
+    numbers (not strings), and _asdict() gives the DICT to send to the outputs.
+    "roams" is the number of roams of the interface while the test ran.
+    The station fields ("samples" to "beacon_loss") summarize the station
+    statistics sampled while the test ran (see sampler.py), 0 if not sampled.
+    The channel fields are the utilization of the channels while the test ran
+    (see Wireless.channelutilization()): "channel_*" of the channel in use,
+    "channels" a ChannelSurvey per surveyed channel.
+    The iperf3 results keep the measurements of every interval of the test in
+    "intervals", a DICT of column arrays (see iperf.py), summarized by the
+    stability fields "min_interval_bps", "cv_bps" and "slowstart_s".
+    The kind of test is available as the class attribute "test".
+"""
+
+from typing import NamedTuple
+
+
+class BandwidthResult(NamedTuple):
+    """
+        Result of a bandwidth test (iperf3 TCP), from the iperf3 "sum_sent"
+        summary of all the streams, see iperf.summaryfields()
+        direction: "up" (client sends), "down" (reverse) or "bidir"
+        uplink_bps/downlink_bps: throughput measured by the receiver in
+        each direction, 0 for the direction not tested
+        streams: a StreamResult per stream
+    """
+    testid: int
+    timestamp: str
+    status: str
+    seconds: float
+    bytes: int
+    bits_per_second: float
+    retransmits: int
+    max_snd_cwnd: int
+    max_rtt: int
+    min_rtt: int
+    mean_rtt: int
+    roams: int = 0
+    samples: int = 0
+    signal_p10: float = 0.0
+    signal_p50: float = 0.0
+    signal_p90: float = 0.0
+    txmcs_p10: float = 0.0
+    txmcs_p50: float = 0.0
+    txmcs_p90: float = 0.0
+    txbitrate_p50: float = 0.0
+    tx_retries: int = 0
+    tx_failed: int = 0
+    beacon_loss: int = 0
+    channel_freq: int = 0
+    channel_noise: int = 0
+    channel_busy: float = 0.0
+    channel_rx: float = 0.0
+    channel_tx: float = 0.0
+    channels: tuple = ()
+    min_interval_bps: float = 0.0
+    cv_bps: float = 0.0
+    slowstart_s: float = 0.0
+    direction: str = "up"
+    parallel_streams: int = 1
+    uplink_bps: float = 0.0
+    downlink_bps: float = 0.0
+    streams: tuple = ()
+    intervals: dict = None
+
+    test = "bandwidth"
+
+
+class DelayResult(NamedTuple):
+    """
+        Result of a delay test (ICMP echo), times in milliseconds
+        The percentiles, histogram and loss bursts come from the RTT of each
+        probe, see prober.rttsummary()
+    """
+    testid: int
+    timestamp: str
+    status: str
+    d_packets_sent: int
+    d_packets_received: int
+    d_packet_loss: int
+    d_packet_loss_percent: float
+    d_time: int
+    d_rtt_min_ms: float
+    d_rtt_avg_ms: float
+    d_rtt_max_ms: float
+    d_rtt_mdev_ms: float
+    d_ipg_ms: float
+    d_ewma_ms: float
+    d_rtt_p50_ms: float = 0.0
+    d_rtt_p90_ms: float = 0.0
+    d_rtt_p99_ms: float = 0.0
+    d_rtt_p999_ms: float = 0.0
+    d_loss_burst_max: int = 0
+    d_rtt_histogram: tuple = ()
+    d_loss_bursts: tuple = ()
+    roams: int = 0
+    channel_freq: int = 0
+    channel_noise: int = 0
+    channel_busy: float = 0.0
+    channel_rx: float = 0.0
+    channel_tx: float = 0.0
+    channels: tuple = ()
+
+    test = "delay"
+
+
+class UDPResult(NamedTuple):
+    """
+        Result of a packet loss and jitter test (iperf3 UDP)
+    """
+    testid: int
+    timestamp: str
+    status: str
+    seconds: float
+    bytes: int
+    bits_per_second: float
+    jitter_ms: float
+    lost_packets: int
+    packets: int
+    lost_percent: float
+    out_of_order: int
+    roams: int = 0
+    samples: int = 0
+    signal_p10: float = 0.0
+    signal_p50: float = 0.0
+    signal_p90: float = 0.0
+    txmcs_p10: float = 0.0
+    txmcs_p50: float = 0.0
+    txmcs_p90: float = 0.0
+    txbitrate_p50: float = 0.0
+    tx_retries: int = 0
+    tx_failed: int = 0
+    beacon_loss: int = 0
+    channel_freq: int = 0
+    channel_noise: int = 0
+    channel_busy: float = 0.0
+    channel_rx: float = 0.0
+    channel_tx: float = 0.0
+    channels: tuple = ()
+    min_interval_bps: float = 0.0
+    cv_bps: float = 0.0
+    intervals: dict = None
+
+    test = "packetloss"
+
+
+class ConnectResult(NamedTuple):
+    """
+        Time, in seconds, of each step of the connection to a WLAN, see
+        Sensor.connectresult(). The association, handshake and DHCP steps
+        come from the events of the Monitor, 0 when it's not running.
+        status: "ok", "associated" (already connected), "unreachable" (the
+        gateway did not answer) or "failed"
+    """
+    testid: int
+    timestamp: str
+    status: str
+    total_s: float = 0.0
+    check_s: float = 0.0
+    profile_s: float = 0.0
+    scan_s: float = 0.0
+    up_s: float = 0.0
+    association_s: float = 0.0
+    handshake_s: float = 0.0
+    dhcp_s: float = 0.0
+    reachability_s: float = 0.0
+    bssid: str = ""
+
+    test = "connect"
+
+
+class ChannelSurvey(NamedTuple):
+    """
+        Utilization of one channel between two surveys ("iw survey dump"),
+        busy/rx/tx are fractions of the time the radio was on the channel
+    """
+    freq: int
+    inuse: bool
+    noise: int
+    active_ms: int
+    busy: float
+    rx: float
+    tx: float
+
+
+class StreamResult(NamedTuple):
+    """
+        One stream of a bandwidth test: bytes and bits_per_second measured
+        by the receiver, retransmits, max_snd_cwnd and mean_rtt by the
+        sender (0 when the sender is the server and does not report them)
+    """
+    socket: int
+    direction: str
+    bytes: int
+    bits_per_second: float
+    retransmits: int
+    max_snd_cwnd: int
+    mean_rtt: int
+
+
+class StatusResult(NamedTuple):
+    """
+        Result of a test without measurements: "wrong", "disabled", "timeout"
+    """
+    testid: int
+    timestamp: str
+    status: str
+    test: str = ""
+
+
+# Record type of each kind of test, by the "test" name used in sensorconfig,
+# and of the connection to the WLAN (testid 0)
+recordtypes = {record.test: record for record in (BandwidthResult, DelayResult, UDPResult, ConnectResult)}
+
+
+def resultdict(record):
+    """
+        Returns a DICT with the fields of <record>, plus the kind of test
+        Plain DICTs are returned as they are
+    """
+    if isinstance(record, dict):
+        return record
+    data = dict(record._asdict())
+    if data.get("channels"):
+        data["channels"] = [channel._asdict() for channel in data["channels"]]
+    if data.get("streams"):
+        data["streams"] = [stream._asdict() for stream in data["streams"]]
+    if data.get("intervals"):
+        data["intervals"] = seriesdict(data["intervals"])
+    data["test"] = record.test
+    return data
+
+
+def seriesdict(series):
+    """
+        Returns the column arrays of <series> as LISTs, NaN as None, ready
+        for JSON
+    """
+    import math
+
+    return {column: [None if math.isnan(value) else value for value in values] for column, values in series.items()}
+
+
+def statusresult(testinfo, status):
+    """
+        Returns a StatusResult for the test in <testinfo> with <status>,
+        timestamped now
+    """
+    import time
+
+    return StatusResult(testinfo["testid"], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()), status, testinfo["test"])
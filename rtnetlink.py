@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+import logging
+import socket
+import struct
+
+# Netlink message types and flags (linux/netlink.h, linux/rtnetlink.h)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+
+# Attributes of the link, address and route messages
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+
+# Multicast groups for the change events
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+# Operational states of a link (RFC 2863), "up" is authorized for wireless
+OPERSTATES = {0: "unknown", 1: "notpresent", 2: "down", 3: "lowerlayerdown", 4: "testing", 5: "dormant", 6: "up"}
+
+# Main routing table
+RT_TABLE_MAIN = 254
+
+NLMSGHDR = struct.Struct("=LHHLL")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTMSG = struct.Struct("=BBBBBBBBI")
+RTATTR = struct.Struct("=HH")
+
+EVENTS = {
+    RTM_NEWLINK: "newlink",
+    RTM_DELLINK: "dellink",
+    RTM_NEWADDR: "newaddr",
+    RTM_DELADDR: "deladdr",
+    RTM_NEWROUTE: "newroute",
+    RTM_DELROUTE: "delroute"
+}
+
+
+class Rtnetlinkerror(Exception):
+    """Base class for exceptions in this Class"""
+    pass
+
+
+class Rtnetlink:
+    """
+        Minimal rtnetlink (AF_NETLINK, NETLINK_ROUTE) client, to read the
+        addresses and routes of the interfaces from the kernel with no
+        subprocess, and to follow their changes (DHCP done, address lost...)
+
+        Example:
+            netlink = Rtnetlink()
+            netlink.association("wlp1s0")
+            -> {"ipaddress": "192.168.1.4", "mask": "24", "ipv6": "...",
+                "mask6": "64", "gateway": "192.168.1.1"}
+    """
+
+    def __init__(self, logname="log"):
+        """
+            Initialize
+        """
+        # Initialize the logging
+        self.logname = logname + ".Rtnetlink"
+        self.logger = logging.getLogger(self.logname)
+        self.logger.info("Logging initialization of Rtnetlink. Done.")
+        self.seq = 0
+        self.events = None
+
+    def dump(self, msgtype, payload):
+        """
+            Send a dump request <msgtype> with <payload>, and return the
+            LIST of [type, message payload] received until NLMSG_DONE
+        """
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as sock:
+            sock.bind((0, 0))
+            self.seq += 1
+            seq = self.seq
+            sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(payload), msgtype, NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + payload)
+            messages = []
+            while True:
+                data = sock.recv(65536)
+                for nltype, nlseq, body in self.messages(data):
+                    if nlseq != seq:
+                        continue
+                    if nltype == NLMSG_DONE:
+                        return messages
+                    if nltype == NLMSG_ERROR:
+                        errno = -struct.unpack_from("=i", body)[0]
+                        if errno == 0:
+                            continue
+                        raise Rtnetlinkerror("netlink error <" + str(errno) + ">")
+                    messages.append([nltype, body])
+
+    @staticmethod
+    def messages(data):
+        """
+            Split the datagram <data> in netlink messages
+            Returns a LIST of [type, seq, payload]
+        """
+        messages = []
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            length, nltype, flags, seq, pid = NLMSGHDR.unpack_from(data, offset)
+            if length < NLMSGHDR.size:
+                break
+            messages.append([nltype, seq, data[offset + NLMSGHDR.size:offset + length]])
+            offset += (length + 3) & ~3
+        return messages
+
+    @staticmethod
+    def attributes(data, offset):
+        """
+            Returns a DICT {type: value bytes} with the attributes in <data>
+            starting at <offset>
+        """
+        attributes = {}
+        while offset + RTATTR.size <= len(data):
+            length, attrtype = RTATTR.unpack_from(data, offset)
+            if length < RTATTR.size:
+                break
+            attributes[attrtype] = data[offset + RTATTR.size:offset + length]
+            offset += (length + 3) & ~3
+        return attributes
+
+    @staticmethod
+    def ifname(index):
+        """
+            Returns the name of the interface with <index>, "" if gone
+        """
+        try:
+            return socket.if_indextoname(index)
+        except OSError:
+            return ""
+
+    def parselink(self, body):
+        """
+            Returns the DICT of a link message <body>:
+            {"ifindex", "ifname", "family", "operstate"}
+        """
+        family, linktype, index, flags, change = IFINFOMSG.unpack_from(body)
+        attributes = self.attributes(body, IFINFOMSG.size)
+        operstate = attributes[IFLA_OPERSTATE][0] if IFLA_OPERSTATE in attributes else 0
+        return {
+            "ifindex": index,
+            "ifname": attributes[IFLA_IFNAME].rstrip(b"\0").decode("utf-8") if IFLA_IFNAME in attributes else self.ifname(index),
+            "family": family,
+            "operstate": OPERSTATES.get(operstate, "unknown")
+        }
+
+    def parseaddress(self, body):
+        """
+            Returns the DICT of an address message <body>:
+            {"ifindex", "ifname", "family", "address", "prefixlen", "scope"}
+        """
+        family, prefixlen, flags, scope, index = IFADDRMSG.unpack_from(body)
+        attributes = self.attributes(body, IFADDRMSG.size)
+        # For IPv4 IFA_LOCAL is the address of the interface, IFA_ADDRESS
+        # the peer in point to point links
+        raw = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS, b""))
+        address = socket.inet_ntop(family, raw) if raw else ""
+        return {
+            "ifindex": index,
+            "ifname": self.ifname(index),
+            "family": family,
+            "address": address,
+            "prefixlen": prefixlen,
+            "scope": scope
+        }
+
+    def parseroute(self, body):
+        """
+            Returns the DICT of a route message <body>:
+            {"ifindex", "ifname", "family", "dst", "dst_len", "gateway",
+             "table", "priority"}
+        """
+        family, dst_len, src_len, tos, table, protocol, scope, rttype, flags = RTMSG.unpack_from(body)
+        attributes = self.attributes(body, RTMSG.size)
+        index = struct.unpack("=I", attributes[RTA_OIF])[0] if RTA_OIF in attributes else 0
+        if RTA_TABLE in attributes:
+            table = struct.unpack("=I", attributes[RTA_TABLE])[0]
+        return {
+            "ifindex": index,
+            "ifname": self.ifname(index) if index else "",
+            "family": family,
+            "dst": socket.inet_ntop(family, attributes[RTA_DST]) if RTA_DST in attributes else "",
+            "dst_len": dst_len,
+            "gateway": socket.inet_ntop(family, attributes[RTA_GATEWAY]) if RTA_GATEWAY in attributes else "",
+            "table": table,
+            "priority": struct.unpack("=I", attributes[RTA_PRIORITY])[0] if RTA_PRIORITY in attributes else 0
+        }
+
+    def addresses(self, ifname=""):
+        """
+            Returns the LIST of addresses (see parseaddress()) of all the
+            interfaces, or only of <ifname>
+        """
+        messages = self.dump(RTM_GETADDR, IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+        addresses = [self.parseaddress(body) for nltype, body in messages if nltype == RTM_NEWADDR]
+        return [address for address in addresses if ifname in ("", address["ifname"])]
+
+    def routes(self, ifname=""):
+        """
+            Returns the LIST of routes (see parseroute()) of the main table,
+            of all the interfaces, or only of <ifname>
+        """
+        messages = self.dump(RTM_GETROUTE, RTMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0, 0))
+        routes = [self.parseroute(body) for nltype, body in messages if nltype == RTM_NEWROUTE]
+        return [route for route in routes if route["table"] == RT_TABLE_MAIN and ifname in ("", route["ifname"])]
+
+    def association(self, ifname):
+        """
+            Returns a DICT with the IP information of <ifname>, with the same
+            keys and format used in Wireless.parseassociation():
+                "ipaddress", "mask", "ipv6", "mask6", "gateway"
+            Fields that are not available are not in the DICT
+        """
+        info = {}
+        for address in sorted(self.addresses(ifname), key=lambda address: address["scope"], reverse=True):
+            # Sorted by scope, so the global (0) addresses are the last ones
+            if address["family"] == socket.AF_INET:
+                info["ipaddress"] = address["address"]
+                info["mask"] = str(address["prefixlen"])
+            elif address["family"] == socket.AF_INET6:
+                info["ipv6"] = address["address"]
+                info["mask6"] = str(address["prefixlen"])
+        defaults = [route for route in self.routes(ifname)
+                    if route["family"] == socket.AF_INET and route["dst_len"] == 0 and route["gateway"] != ""]
+        if defaults:
+            info["gateway"] = min(defaults, key=lambda route: route["priority"])["gateway"]
+        return info
+
+    @staticmethod
+    def subscription():
+        """
+            Returns a new socket subscribed to the link, address and route
+            change events, for the caller only, see event()
+        """
+        groups = RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_ROUTE
+        events = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            events.bind((0, groups))
+        except OSError:
+            events.close()
+            raise
+        return events
+
+    def subscribe(self):
+        """
+            Subscribe to the link, address and route change events, see event()
+            One subscription per Rtnetlink, to be read by one thread only
+        """
+        if self.events is None:
+            self.events = self.subscription()
+            self.logger.info("Subscribed to link, address and route events.")
+
+    def unsubscribe(self):
+        """
+            Stop receiving events
+        """
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
+    def event(self, timeout=None, events=None):
+        """
+            Wait up to <timeout> seconds (None forever) for the next change
+            events, from the <events> socket (see subscription()), or from
+            the subscription of subscribe(), that must be called before.
+            Returns the LIST of events, [] if <timeout> expired:
+                event = link, address or route DICT (see parselink(),
+                        parseaddress() and parseroute()) plus "event":
+                        "newlink", "dellink", "newaddr", "deladdr",
+                        "newroute" or "delroute"
+        """
+        if events is None:
+            events = self.events
+        events.settimeout(timeout)
+        try:
+            data = events.recv(65536)
+        except socket.timeout:
+            return []
+        events = []
+        for nltype, seq, body in self.messages(data):
+            if nltype in (RTM_NEWLINK, RTM_DELLINK):
+                event = self.parselink(body)
+            elif nltype in (RTM_NEWADDR, RTM_DELADDR):
+                event = self.parseaddress(body)
+            elif nltype in (RTM_NEWROUTE, RTM_DELROUTE):
+                event = self.parseroute(body)
+            else:
+                continue
+            event["event"] = EVENTS[nltype]
+            events.append(event)
+        return events
+
+    def waitaddress(self, ifname, timeout, family=socket.AF_INET):
+        """
+            Wait up to <timeout> seconds until <ifname> has an address of
+            <family>, as when DHCP finishes.
+            Each call has its own subscription, so several threads can wait
+            at the same time (one per radio)
+            Returns the address, or "" if <timeout> expired
+        """
+        import time
+
+        deadline = time.monotonic() + timeout
+        with self.subscription() as events:
+            # Subscribed before looking, so no event can be lost in between
+            for address in self.addresses(ifname):
+                if address["family"] == family:
+                    return address["address"]
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return ""
+                for event in self.event(remaining, events):
+                    if event["event"] == "newaddr" and event["ifname"] == ifname and event["family"] == family:
+                        return event["address"]
+
+    def pprint(self):
+        import json
+        return print(json.dumps({"addresses": self.addresses(), "routes": self.routes()}, indent=2))
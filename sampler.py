@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+import re
+import threading
+import time
+
+
+class StationSampler:
+    """
+        Samples "iw dev <ifname> station dump" at <rate> Hz in a background
+        thread while a test runs, storing signal, bitrates, MCS and the
+        retry/failure/beacon loss counters in preallocated arrays (NumPy
+        when available, array.array otherwise), and summarizes the test
+        window with percentiles, see summary().
+
+        Example:
+            sampler = StationSampler(wireless, "wlp1s0", rate=2, window=60)
+            sampler.start()
+            ... run the test ...
+            summary = sampler.stop()
+    """
+
+    # Columns of the time series, the counters are cumulative
+    columns = ["time", "signal", "txbitrate", "rxbitrate", "txmcs", "txretries", "txfailed", "beaconloss"]
+
+    def __init__(self, wireless, ifname, rate=2, window=60, logname="log"):
+        """
+            Initialize the sampler of <ifname> at <rate> Hz, with room for a
+            test window of <window> seconds
+        """
+        # Initialize the logging
+        self.logname = logname + ".StationSampler"
+        self.logger = logging.getLogger(self.logname)
+        self.wireless = wireless
+        self.ifname = ifname
+        self.rate = float(rate)
+        self.capacity = int(self.rate * window) + 1
+        self.count = 0
+        self.series = self.allocate(self.capacity)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def allocate(self, capacity):
+        """
+            Returns a DICT {column: preallocated array of <capacity> NaN}
+        """
+        try:
+            import numpy
+        except ImportError:
+            from array import array
+            return {column: array("d", [math.nan]) * capacity for column in self.columns}
+        return {column: numpy.full(capacity, numpy.nan) for column in self.columns}
+
+    def start(self):
+        """
+            Start sampling
+        """
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.loop, name="sampler-" + self.ifname, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+            Stop sampling, and return the summary of the window
+        """
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        return self.summary()
+
+    def loop(self):
+        """
+            Thread taking a sample every 1/rate seconds, on a fixed grid,
+            until stopped or the arrays are full
+        """
+        start = time.monotonic()
+        tick = 0
+        while self.count < self.capacity:
+            self.sample()
+            tick += 1
+            if self.stopping.wait(max(0.0, start + tick / self.rate - time.monotonic())):
+                break
+
+    def sample(self):
+        """
+            Take one sample with "iw dev <ifname> station dump"
+        """
+        command_shell = ["sudo", "/sbin/iw", "dev", self.ifname, "station", "dump"]
+        status,output,errors = self.wireless.os.runoscommand(command_shell, self.wireless.timeouts["iw"])
+        if status > 1:
+            return
+        values = self.parsestation(output.stdout.decode("utf-8"))
+        if not values:
+            # Not associated
+            return
+        index = self.count
+        self.series["time"][index] = time.monotonic()
+        for column, value in values.items():
+            self.series[column][index] = value
+        self.count += 1
+
+    @staticmethod
+    def parsestation(text):
+        """
+            Parse the first station (the AP for a managed interface) in the
+            output of "iw dev <ifname> station dump"
+            Returns a DICT {column: value}, {} if there is no station
+        """
+        values = {}
+        for line in text.splitlines():
+            if line.startswith("Station ") and values:
+                break
+            key, _, value = line.strip().partition(":")
+            value = value.strip()
+            if line.startswith("Station "):
+                values["signal"] = math.nan
+            elif key == "signal":
+                values["signal"] = float(value.split()[0])
+            elif key == "tx bitrate":
+                values["txbitrate"] = float(value.split()[0])
+                mcs = re.search(r"MCS (\d+)", value)
+                if mcs:
+                    values["txmcs"] = float(mcs.group(1))
+            elif key == "rx bitrate":
+                values["rxbitrate"] = float(value.split()[0])
+            elif key == "tx retries":
+                values["txretries"] = float(value)
+            elif key == "tx failed":
+                values["txfailed"] = float(value)
+            elif key == "beacon loss":
+                values["beaconloss"] = float(value)
+        return values
+
+    def window(self, column):
+        """
+            Returns the samples of <column> taken, without NaN
+        """
+        return [value for value in self.series[column][:self.count] if not math.isnan(value)]
+
+    @staticmethod
+    def percentiles(values, percents):
+        """
+            Returns the LIST of <percents> percentiles of <values>, with
+            linear interpolation (as numpy.percentile), NaN if no values
+        """
+        if len(values) == 0:
+            return [math.nan] * len(percents)
+        try:
+            import numpy
+        except ImportError:
+            values = sorted(values)
+            result = []
+            for percent in percents:
+                position = (len(values) - 1) * percent / 100.0
+                low = int(math.floor(position))
+                high = min(low + 1, len(values) - 1)
+                result.append(values[low] + (values[high] - values[low]) * (position - low))
+            return result
+        return [float(value) for value in numpy.percentile(values, percents)]
+
+    def summary(self):
+        """
+            Returns the summary of the window, a DICT with the fields of the
+            result records (see results.py), 0 when there are no samples:
+                "samples", "signal_p10", "signal_p50", "signal_p90",
+                "txmcs_p10", "txmcs_p50", "txmcs_p90", "txbitrate_p50",
+                "tx_retries", "tx_failed", "beacon_loss"
+            The counters are the increment during the window
+        """
+        summary = {"samples": self.count}
+        for column, names in [["signal", ["signal_p10", "signal_p50", "signal_p90"]],
+                              ["txmcs", ["txmcs_p10", "txmcs_p50", "txmcs_p90"]]]:
+            for name, value in zip(names, self.percentiles(self.window(column), [10, 50, 90])):
+                summary[name] = 0.0 if math.isnan(value) else value
+        summary["txbitrate_p50"] = self.percentiles(self.window("txbitrate"), [50])[0]
+        if math.isnan(summary["txbitrate_p50"]):
+            summary["txbitrate_p50"] = 0.0
+        for column, name in [["txretries", "tx_retries"], ["txfailed", "tx_failed"], ["beaconloss", "beacon_loss"]]:
+            counter = self.window(column)
+            # Counters restart when the station reassociates, never negative
+            summary[name] = int(max(0.0, counter[-1] - counter[0])) if counter else 0
+        return summary
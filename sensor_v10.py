@@ -4,9 +4,14 @@
 # import logging
 # from logging.handlers import SysLogHandler
 
+import threading
+
 from wireless import Wireless
 from tests import Test
 from outputs import Output
+from results import ConnectResult, resultdict, statusresult
+from history import History
+from monitor import Monitor
 
 # Connectivity Failures File
 failures_file = "/home/ale/sensor/sensorwatchdog.json"
@@ -44,6 +49,27 @@ class Sensor:
     # Configuration file
     configuration_file = "/home/ale/sensor/sensorconfig.json"
 
+    # Daemon mode defaults, used when sensorinfo does not define them
+    # timer: seconds between the start of two test cycles
+    # jitter: max random offset (seconds) added to each cycle start, so a
+    #         fleet of sensors does not hit the test servers at the same time
+    daemon_timer = 600
+    daemon_jitter = 0
+
+    # Results kept per (wlanid, testid) in the history, when sensorinfo
+    # does not define "history_size"
+    history_size = 1024
+
+    # Max seconds to wait for the IPv4 address (DHCP) after connecting
+    address_wait = 30
+
+    # Max seconds to wait for the first answer of the gateway after connecting
+    reach_timeout = 5
+
+    # Tests sampling the station statistics (signal, MCS...) while they run,
+    # when bound to an interface
+    sampled_tests = ["bandwidth", "packetloss"]
+
     def __init__(self,
                  config_file=configuration_file,
                  logname=logname,
@@ -66,8 +92,21 @@ class Sensor:
         # the tests to run
         self.test = Test(self.logname)
 
-        # Read the sensor configuration
+        # Read the sensor configuration, and index it for fast lookups
         self.sensor = self.readconfigfile(config_file)
+        self.buildindexes()
+
+        # Timeouts (seconds) of the OS commands, by kind of test or command
+        timeouts = self.sensor["sensorinfo"].get("timeouts", {})
+        self.test.timeouts.update(timeouts)
+        self.wlan.timeouts.update(timeouts)
+        # Association fields read from sysfs/procfs instead of iw/ip
+        self.wlan.association_sources.update(self.sensor["sensorinfo"].get("association_sources", {}))
+        # Samples per second of the station statistics during the tests
+        self.wlan.sample_rate = self.sensor["sensorinfo"].get("sample_rate", self.wlan.sample_rate)
+
+        # Bounded history of the results, one ring buffer per (wlanid, testid)
+        self.history = History(self.logname, self.sensor["sensorinfo"].get("history_size", self.history_size))
 
         # Initialize the Main variable to use, a LIST with all the WLAN
         # networks to test, with their connection information. Each WLAN OBJECT
@@ -150,6 +189,15 @@ class Sensor:
         # Init the output part of the sensor
         self.output = Output(self)
 
+        # Daemon mode control: the event stops the scheduler loop, the lock
+        # guarantees that only one test cycle runs at a time
+        self.daemonstop = threading.Event()
+        self.cyclelock = threading.Lock()
+
+        # Monitor of the association events (roams, DHCP...), started by
+        # the daemon mode
+        self.monitor = Monitor(self.wlan, self.logname)
+
 
     @staticmethod
     def localsysloginitialization(logname, logging_config_file):
@@ -280,70 +328,349 @@ class Sensor:
 
         return testresult
 
-    def runalltestwlan(self, wlanid):
+    def runalltestwlan(self, wlanid, ifname="", deadline=None):
         """
         run all tests for the specified wlanid
         :param wlanid: Identifies the WLAN where all tests will be run
+        :param ifname: wireless interface to use, defaults to "" (any)
+        :param deadline: time.monotonic() value when the tests must be done,
+            tests that can't start before it get a "timeout" status, and
+            running tests are killed when it expires. Defaults to None (no limit)
         :return: [status, results]
         """
+        import time
+
         # Attach to LOCAL SYSLOG
         logger = self.logger
         # Let's run all tests
         logger.info("Running all tests on all wlans...")
         # Let's search for the wlanid in the list of WLANs
-        for wlan in self.sensor["wlans"]:
-            if wlan["wlanid"] == wlanid:
-                # Found the right wlanid
-                # Let's see if it's enabled
-                if wlan["configuration"]["status"] == "enable":
-                    # WLAN is enabled for testing
-                    # connect to the ssid of this wlan
-                    status, reason = self.connectWLAN(wlan["wlanid"])
-                    # Check if connection was right
-                    if status > 1:
-                        # Something went wrong and could not connect with the ssid
-                        logger.info("ERROR: Could not connect with the ssid <" + str(wlan["configuration"]["ssid"]) + ">. Skipping this ssid from tests...")
-                        return [2, "ERROR: Could not connect with the ssid <" + str(wlan["configuration"]["ssid"]) + ">. Can't run tests..."]
-                    # Successfully connected with the SSID
-                    # Iterate over tests
-                    wlansindex = self.sensor["wlans"].index(wlan)
-                    self.sensor["wlans"][wlansindex]["results"] = []
-                    results = []
-                    for test in wlan["tests"]:
-                        # Let's check if the test is enabled
-                        if test["status"] == "enable":
-                            # Test is enabled and must be run
-                            status, testresult = self.test.runtest(test)
-                            if status > 1:
-                                # Something went wrong running the test
-                                logger.info("ERROR: Problem running the test [" + str(testresult) + "]. Skipping this test")
-                                testresult = {}
-                                testresult["status"] = "wrong"
-                                testresult["testid"] = test["testid"]
-                                self.sensor["wlans"][wlansindex]["results"].append(testresult)
-                                results.append(testresult)
-                            else:
-                                # SUCCESS with test
-                                logger.info("SUCCESS!! test <" + str(test["test"]) + "> completed.")
-                                self.sensor["wlans"][wlansindex]["results"].append(testresult)
-                                results.append(testresult)
-                        else:
-                            # Test is disabled
-                            logger.info("Test <" + str(test["test"]) + "> is disabled in configuration. Skipping this test...")
-                            testresult = {}
-                            testresult["status"] = "disabled"
-                            testresult["testid"] = test["testid"]
-                            self.sensor["wlans"][wlansindex]["results"].append(testresult)
-                            results.append(testresult)
-                    # Finish to run the tests
-                    return [1, results]
+        wlan = self.wlanbyid.get(wlanid)
+        if wlan is None:
+            # WLAN not found
+            logger.info("ERROR: WLAN with wlanid <" + str(wlanid) + "> NOT found in the list of configured WLANs.")
+            return [4, "ERROR: WLAN with wlanid <" + str(wlanid) + "> NOT found in the list of configured WLANs."]
+        # Found the right wlanid
+        # Let's see if it's enabled
+        if wlan["configuration"]["status"] != "enable":
+            # WLAN is disabled...
+            logger.info("ERROR: WLAN with wlanid <" + str(wlanid) + "> is disabled by configuration. Can't run tests on it.")
+            return [3, "ERROR: WLAN with wlanid <" + str(wlanid) + "> is disabled by configuration. Can't run tests on it."]
+        # WLAN is enabled for testing
+        # connect to the ssid of this wlan, unless there is no time left
+        expired = deadline is not None and time.monotonic() >= deadline
+        if expired:
+            logger.info("Cycle deadline reached, not connecting to the ssid <" + str(wlan["configuration"]["ssid"]) + ">.")
+            status, reason = 1, "Cycle deadline reached"
+        else:
+            timing = {}
+            # The connection (scans included) must end by the deadline too
+            timeout = None if deadline is None else deadline - time.monotonic()
+            status, reason = self.connectWLAN(wlan["wlanid"], ifname=ifname, timing=timing, timeout=timeout)
+        # Check if connection was right
+        if status > 1:
+            # Something went wrong and could not connect with the ssid
+            if timing:
+                self.history.add(wlanid, self.connectresult(timing, status))
+            logger.info("ERROR: Could not connect with the ssid <" + str(wlan["configuration"]["ssid"]) + ">. Skipping this ssid from tests...")
+            return [2, "ERROR: Could not connect with the ssid <" + str(wlan["configuration"]["ssid"]) + ">. Can't run tests..."]
+        # Source address for the tests, when bound to an interface
+        bindaddress = ""
+        if ifname != "" and not expired:
+            bindaddress = self.wlan.getinterfaceinfo(ifname).get("connection", {}).get("ipaddress", "")
+            if bindaddress == "":
+                # DHCP not finished yet, the kernel tells us when it is
+                wait = self.address_wait
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                logger.info("No IPv4 address yet on <" + ifname + ">, waiting up to <" + str(int(wait)) + ">s...")
+                bindaddress = self.wlan.waitaddress(ifname, wait)
+        # Successfully connected with the SSID
+        # Radio in use, also when not bound to one (single radio, sequential
+        # cycle): the interface nmcli connected
+        radio = ifname
+        if radio == "" and not expired:
+            radio = timing.get("ifname", "") or (self.wlan.activeconnections() or {}).get(wlan["configuration"]["ssid"], "")
+        # Time of each step of the connection, a result of the WLAN too
+        connectresult = None
+        if not expired:
+            connectresult = self.connectresult(timing, status)
+        # Baseline of the channel utilization of the tests
+        if radio != "" and not expired:
+            self.wlan.channelutilization(radio)
+        # Iterate over tests
+        wlan["results"] = []
+        results = []
+        if connectresult is not None:
+            wlan["results"].append(connectresult)
+            self.history.add(wlanid, connectresult)
+            results.append(connectresult)
+        for test in wlan["tests"]:
+            # Let's check if the test is enabled
+            if test["status"] == "enable":
+                # Test is enabled and must be run, if there is time left
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    logger.info("Cycle deadline reached, test <" + str(test["test"]) + "> not run.")
+                    status = 4
+                else:
+                    started = time.time()
+                    sampler = None
+                    if radio != "" and test["test"] in self.sampled_tests:
+                        sampler = self.wlan.stationsampler(radio, self.test.testtimeout(test, timeout) or 60)
+                        sampler.start()
+                    status, testresult = self.test.runtest(test, ifname, bindaddress, timeout)
+                    station = sampler.stop() if sampler is not None else None
+                    # Utilization of the channels during this test
+                    channels = self.wlan.channelutilization(radio) if radio != "" else {}
+                if status == 4:
+                    # Test not run or killed, out of time
+                    testresult = statusresult(test, "timeout")
+                elif status > 1:
+                    # Something went wrong running the test
+                    logger.info("ERROR: Problem running the test [" + str(testresult) + "]. Skipping this test")
+                    testresult = statusresult(test, "wrong")
+                else:
+                    # SUCCESS with test
+                    logger.info("SUCCESS!! test <" + str(test["test"]) + "> completed.")
+                    testresult = self.recordroams(testresult, ifname, started)
+                    if station is not None:
+                        # Signal and MCS of the exact window of the test
+                        testresult = testresult._replace(**station)
+                    testresult = testresult._replace(**channels)
+            else:
+                # Test is disabled
+                logger.info("Test <" + str(test["test"]) + "> is disabled in configuration. Skipping this test...")
+                testresult = statusresult(test, "disabled")
+            wlan["results"].append(testresult)
+            self.history.add(wlanid, testresult)
+            results.append(testresult)
+        # Finish to run the tests
+        return [1, results]
+
+    def runcycle(self, deadline=None):
+        """
+        Run one test cycle: all the tests of all the enabled WLANs.
+        Only one cycle can run at a time, if a cycle is already running
+        the call returns immediately instead of waiting for it.
+        :param deadline: time.monotonic() value when the cycle must be done,
+            see runalltestwlan(). Defaults to None (no limit)
+        :return: [status, results]
+            status:
+                1 -> Cycle done, results is a DICT {wlanid: [status, results]}
+                2 -> Cycle skipped, another cycle is still running
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        if not self.cyclelock.acquire(blocking=False):
+            # Previous cycle still running, do not stack a new one
+            logger.warning("Test cycle still running, skipping this cycle...")
+            return [2, "Test cycle still running, cycle skipped."]
+        try:
+            logger.info("Starting test cycle on all enabled wlans...")
+            wlans = [wlan for wlan in self.sensor["wlans"] if wlan["configuration"]["status"] == "enable"]
+            # The WLANs share the scan table: a rescan is only asked when
+            # an SSID is missing from it, see Wireless.checkSSIDair()
+            # nmcli connections are read again once per cycle
+            self.wlan.nmcli.invalidate()
+            if len(self.wlan.wirelessinfo) > 1 and len(wlans) > 1:
+                # Several radios, test the WLANs at the same time
+                results = self.runparallelwlans(wlans, deadline)
+            else:
+                results = {}
+                for wlan in wlans:
+                    results[wlan["wlanid"]] = self.runalltestwlan(wlan["wlanid"], deadline=deadline)
+            for wlanid, (status, wlanresults) in results.items():
+                if status == 1:
+                    self.output.sendresults(wlanid, wlanresults)
+            logger.info("Test cycle finished.")
+            return [1, results]
+        finally:
+            self.cyclelock.release()
+
+    def runparallelwlans(self, wlans, deadline=None):
+        """
+        Run all tests of <wlans> at the same time, each WLAN bound to its own
+        wireless interface. WLANs sharing an interface (more WLANs than radios)
+        are run one after another on that interface.
+        :param wlans: LIST of WLANs from self.sensor["wlans"]
+        :param deadline: time.monotonic() value when all tests must be done
+        :return: DICT {wlanid: [status, results]}
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        # Group the WLANs by assigned interface
+        interfaces = self.wlan.assigninterfaces([wlan["configuration"] for wlan in wlans])
+        groups = {}
+        for wlan, ifname in zip(wlans, interfaces):
+            groups.setdefault(ifname, []).append(wlan["wlanid"])
+
+        def rungroup(ifname, wlanids):
+            return [(wlanid, self.runalltestwlan(wlanid, ifname=ifname, deadline=deadline)) for wlanid in wlanids]
+
+        logger.info("Running tests on <" + str(len(wlans)) + "> wlans using <" + str(len(groups)) + "> interfaces at the same time...")
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [executor.submit(rungroup, ifname, wlanids) for ifname, wlanids in groups.items()]
+            for future in futures:
+                results.update(future.result())
+        return results
+
+    def rundaemon(self, cycles=-1):
+        """
+        Resident mode: run a test cycle every sensorinfo["timer"] seconds until
+        stopdaemon() is called (or SIGTERM/SIGINT when running in the main thread).
+        The Wireless, Test and Output objects are created once in __init__ and
+        reused by all the cycles, so there is no cold start per cycle.
+        - Cycles are scheduled on a fixed grid (start + n * timer), so the time
+          spent running the tests does not accumulate as drift.
+        - A random offset up to sensorinfo["jitter"] seconds is added to each
+          cycle start, it's never accumulated from one cycle to the next.
+        - If a cycle runs longer than the timer, the missed cycles are skipped
+          instead of being run back to back.
+        - Each cycle must finish before the next slot starts (or after
+          sensorinfo["cycle_deadline"] seconds, if shorter), the tests
+          that don't fit get a "timeout" status.
+        :param cycles: number of cycles to run, -1 means forever
+        :return: number of cycles run
+        """
+        import random
+        import signal
+        import time
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        timer = float(self.sensor["sensorinfo"].get("timer", self.daemon_timer))
+        jitter = float(self.sensor["sensorinfo"].get("jitter", self.daemon_jitter))
+        cycledeadline = float(self.sensor["sensorinfo"].get("cycle_deadline", timer))
+        if timer <= 0:
+            logger.critical("Invalid timer <" + str(timer) + ">, can NOT run in daemon mode.")
+            return 0
+        # Jitter can't move a cycle into the next slot
+        jitter = min(max(jitter, 0.0), timer / 2)
+
+        if threading.current_thread() is threading.main_thread():
+            # Stop gracefully, finishing the running cycle
+            def handler(signum, frame):
+                logger.info("Signal <" + str(signum) + "> received, stopping daemon...")
+                self.daemonstop.set()
+            signal.signal(signal.SIGTERM, handler)
+            signal.signal(signal.SIGINT, handler)
+
+        logger.info("Starting daemon mode, timer <" + str(timer) + ">s, jitter <" + str(jitter) + ">s.")
+        self.daemonstop.clear()
+        # Follow the association changes while the daemon runs
+        if self.sensor["sensorinfo"].get("monitor", "enable") == "enable":
+            self.monitor.start()
+        start = time.monotonic()
+        slot = 0
+        done = 0
+        try:
+            while not self.daemonstop.is_set() and (cycles < 0 or done < cycles):
+                # Wait until the start of the slot, plus jitter
+                wait = start + slot * timer + random.uniform(0, jitter) - time.monotonic()
+                if wait > 0 and self.daemonstop.wait(wait):
+                    break
+                deadline = min(start + (slot + 1) * timer, time.monotonic() + cycledeadline)
+                status, results = self.runcycle(deadline)
+                if status == 1:
+                    done += 1
+                # Next slot in the grid after now, skipping the overrun ones
+                elapsed = time.monotonic() - start
+                nextslot = int(elapsed // timer) + 1
+                if nextslot > slot + 1:
+                    logger.warning("Test cycle took longer than timer, skipping <" + str(nextslot - slot - 1) + "> cycles.")
+                slot = nextslot
+        finally:
+            self.monitor.stop()
+        logger.info("Daemon mode stopped after <" + str(done) + "> cycles.")
+        return done
+
+    def recordroams(self, testresult, ifname, started):
+        """
+        Returns <testresult> with the number of roams of <ifname> ("" any)
+        seen by the monitor since epoch <started>, when the monitor runs
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        roams = self.monitor.events(since=started, ifname=ifname, kinds=["roam"])
+        if not roams:
+            return testresult
+        logger.warning("<" + str(len(roams)) + "> roams during test <" + str(testresult.testid) + ">: " + str(roams))
+        return testresult._replace(roams=len(roams))
+
+    def connectresult(self, timing, status):
+        """
+        Returns the ConnectResult with the time of each step of a connection
+        The association (iw "connected"), the end of the 802.1X/PSK handshake
+        (link authorized) and the DHCP lease (address added) are taken from
+        the events of the monitor, with their kernel timestamps when it runs.
+        Then, the gateway is pinged until it answers (first packet)
+        :param timing: DICT filled by Wireless.connectWLAN()
+        :param status: status returned by connectWLAN
+        :return: ConnectResult
+        """
+        import time
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        def span(first, last):
+            if first not in timing or last not in timing:
+                return 0.0
+            return max(0.0, timing[last] - timing[first])
+
+        ifname = timing.get("ifname", "")
+        end = max(timing[step] for step in ("start", "checked", "profiled", "scanned", "upstart", "upend") if step in timing)
+        steps = {
+            "total_s": max(0.0, end - timing["start"]),
+            "check_s": span("start", "checked"),
+            "profile_s": span("checked", "profiled"),
+            "scan_s": span("profiled", "scanned"),
+            "up_s": span("upstart", "upend")
+        }
+        if "upstart" in timing and ifname != "":
+            # First event of each kind since nmcli started the connection
+            seen = {"connect": None, "authorized": None, "dhcp": None}
+            for event in self.monitor.events(since=timing["upstart"], ifname=ifname, kinds=["connect", "roam", "authorized", "dhcp"]):
+                kind = "connect" if event["event"] == "roam" else event["event"]
+                if seen[kind] is None:
+                    seen[kind] = event["time"]
+                    if kind == "connect":
+                        steps["bssid"] = event["bssid"]
+            if seen["connect"] is not None:
+                steps["association_s"] = max(0.0, seen["connect"] - timing["upstart"])
+                if seen["authorized"] is not None:
+                    steps["handshake_s"] = max(0.0, seen["authorized"] - seen["connect"])
+                if seen["dhcp"] is not None:
+                    steps["dhcp_s"] = max(0.0, seen["dhcp"] - (seen["authorized"] or seen["connect"]))
+        if status > 1:
+            result = "failed"
+        elif "upstart" not in timing:
+            result = "associated"
+        else:
+            result = "ok"
+            if ifname != "":
+                pinged = time.time()
+                reach = self.wlan.reachable(ifname, self.reach_timeout)
+                if reach is None:
+                    result = "unreachable"
                 else:
-                    # WLAN is disabled...
-                    logger.info("ERROR: WLAN with wlanid <" + str(wlanid) + "> is disabled by configuration. Can't run tests on it.")
-                    return [3, "ERROR: WLAN with wlanid <" + str(wlanid) + "> is disabled by configuration. Can't run tests on it."]
-        # WLAN not found
-        logger.info("ERROR: WLAN with wlanid <" + str(wlanid) + "> NOT found in the list of configured WLANs.")
-        return [4, "ERROR: WLAN with wlanid <" + str(wlanid) + "> NOT found in the list of configured WLANs."]
+                    steps["reachability_s"] = pinged - timing["upend"] + reach
+        logger.info("Connection steps on <" + ifname + ">: " + str(steps))
+        return ConnectResult(0, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()), result, **steps)
+
+    def stopdaemon(self):
+        """
+        Stop the daemon mode, the running cycle (if any) finishes first
+        """
+        self.daemonstop.set()
 
 
     def runsingletest(self, wlanid, testinfo):
@@ -358,19 +685,11 @@ class Sensor:
         # Let's run all tests
         logger.info("Running a single test on specific wlan...")
         # Search for the right WLAN according to wlanid
-        found = False
-        for wlanitem in self.sensor["wlans"]:
-            if wlanitem["wlanid"] == wlanid:
-                # Found the WLAN indicated by wlanid
-                wlan = wlanitem.copy()
-                found = True
-                break
-        if not found:
+        wlan = self.wlanbyid.get(wlanid)
+        if wlan is None:
             # The WLAN is not in sensor information
             return [2, "There is no WLAN associated with wlanid: <" + str(wlanid) + ">. Test not done."]
         # Found... let's continue
-        # Find the index or position of WLAN in self.sensor["wlans"]
-        wlansindex = self.sensor["wlans"].index(wlan)
         if wlan["configuration"]["status"] == "enable":
             # WLAN is enabled for testing
             # connect to the ssid of this wlan
@@ -382,36 +701,40 @@ class Sensor:
                 logger.debug(str(reason))
                 return [3, "ERROR, could NOT connect with the ssid <" + str(wlan["configuration"]["ssid"]) + ">. Can NOT run the test."]
             # Successfully connected with the SSID
-            # Iterate over tests searching for testinfo
-            for test in wlan["tests"]:
-                # Let's search
-                if test["testid"] == testinfo["testid"]:
-                    # Found!!! Let's check if the test is enabled
-                    if test["status"] == "enable":
-                        # Test is enabled and must be run
-                        # get the testindex
-                        status, testresult = self.test.runtest(test)
-                        if status > 1:
-                            # Something was WRONG with testing
-                            return [6, testresult]
-                        else:
-                            # SUCCESS running the test
-                            # update information
-                            self.sensor["wlans"][wlansindex]["results"] = []
-                            self.sensor["wlans"][wlansindex]["results"].append(testresult)
-                            return [1, testresult]
+            # Search for testinfo in the tests of the WLAN
+            test = self.testbyid.get((wlanid, testinfo["testid"]))
+            if test is not None:
+                # Found!!! Let's check if the test is enabled
+                if test["status"] == "enable":
+                    # Test is enabled and must be run
+                    status, testresult = self.test.runtest(test)
+                    if status > 1:
+                        # Something was WRONG with testing
+                        return [6, testresult]
                     else:
-                        # Test NOT enabled, skip
-                        logger.info("Test specified in <" + str(testinfo) + ">, is NOT enable in configuration. Skipping test.")
-                        return [4, "Test specified in <" + str(testinfo) + ">, is NOT enable in configuration. Skipping test."]
+                        # SUCCESS running the test
+                        # update information
+                        wlan["results"] = []
+                        wlan["results"].append(testresult)
+                        self.history.add(wlanid, testresult)
+                        return [1, testresult]
+                else:
+                    # Test NOT enabled, skip
+                    logger.info("Test specified in <" + str(testinfo) + ">, is NOT enable in configuration. Skipping test.")
+                    return [4, "Test specified in <" + str(testinfo) + ">, is NOT enable in configuration. Skipping test."]
 
             # NOT found... test is not in the list of test for this WLAN
             logger.info("Test specified in <" + str(testinfo) + ">, is NOT in the list of available tests for WLAN <" + str(wlan["configuration"]["ssid"]) + ">. Can NOT run the test.")
             return [5, "Test specified in <" + str(testinfo) + ">, is NOT in the list of available tests for WLAN <" + str(wlan["configuration"]["ssid"]) + ">. Can NOT run the test."]
 
-    def connectWLAN(self, wlanid=-1, ssid=""):
+    def connectWLAN(self, wlanid=-1, ssid="", ifname="", timing=None, timeout=None):
         """
             Try to connect with the wlanid or ssid.
+            If <ifname> is indicated, connect using that wireless interface.
+            If <timing> (a DICT) is indicated, it's filled with the time of
+            each step, see Wireless.connectWLAN()
+            If <timeout> is indicated, the connection ends within <timeout>
+            seconds
             
             Call the method with:
                 self.connectWLAN(wlanid=2)
@@ -443,24 +766,20 @@ class Sensor:
 
         elif wlanid == -1 and ssid != "":
             # receive the information using the ssid
-            for wlan in self.sensor["wlans"]:
-                if wlan["configuration"]["ssid"] == ssid:
-                    # SSID found !!
-                    logger.info("Connecting using the SSID <" + str(ssid) + ">...")
-                    connectinfo = wlan["configuration"]
-                    break
+            if ssid in self.wlanbyssid:
+                # SSID found !!
+                logger.info("Connecting using the SSID <" + str(ssid) + ">...")
+                connectinfo = self.wlanbyssid[ssid]["configuration"]
             if len(connectinfo) == 0:
                 # connectinfo={}... so SSID NOT found
                 logger.info("Could NOT find the SSID <" + str(ssid) + "in the SENSOR information...")
                 return [4, "SSID not present in the SENSOR information..."]
         elif wlanid > -1:
             # we receive the information using the wlanid
-            for wlan in self.sensor["wlans"]:
-                if wlan["wlanid"] == wlanid:
-                    # wlan ID is ok
-                    logger.info("Connecting using the wlanid to select the WLAN connection information...")
-                    connectinfo = wlan["configuration"]
-                    break
+            if wlanid in self.wlanbyid:
+                # wlan ID is ok
+                logger.info("Connecting using the wlanid to select the WLAN connection information...")
+                connectinfo = self.wlanbyid[wlanid]["configuration"]
             if len(connectinfo) == 0:
                 # connectinfo={}... so wlanid is NO OK
                 logger.info("WLAN ID (wlanid) not matching with a valid wlanid in the SENSOR information.")
@@ -468,7 +787,7 @@ class Sensor:
 
         # Call wireless method with the right information to connect to wlan
         logger.info("Calling wlan.connectWLAN for connecting to SSID <" + str(connectinfo["ssid"]) + ">...")
-        status, output = self.wlan.connectWLAN(connectinfo)
+        status, output = self.wlan.connectWLAN(connectinfo, ifname, timing, timeout)
 
         if status > 1:
             # something went wrong
@@ -478,7 +797,7 @@ class Sensor:
             # SUCCESS!!! Connected to the right SSID
             logger.info("SUCCESS!!! Successfully connected to the SSID <" + str(connectinfo["ssid"]) + ">.")
             # update wlan information
-            self.wlan.getAssociationInfo()
+            self.wlan.getAssociationInfo(ifname)
             return [1, "SUCCESS!!! Successfully connected to the SSID <" + str(connectinfo["ssid"]) + ">."]
 
 
@@ -521,48 +840,34 @@ class Sensor:
         # Let's see what is used to identify the test
         if testid!=-1:
             # Call using testid
-            for wlan in self.sensor["wlans"]:
-                if wlan["wlanid"] == wlanid:
-                    # Found the WLAN
-                    for test in wlan["tests"]:
-                        if test["testid"] == testid:
-                            # Found the test
-                            return [1, test]
-                    # Test not found in the list of configured tests for the WLAN
-                    return [2, "Test ID <"+str(testid)+">, NOT found in the list of configured tests for WLAN <" + str(wlanid) + ">"]
-            # WLAN not found
-            return [3, "WLAN ID <" + str(wlanid) + ">, NOT found in the list of configured WLAN networks"]
+            index = self.testbyid
+            key = testid
+            msg = "Test ID <"+str(testid)+">"
         elif testid == -1 and testservername!="":
             # Call using testservername
-            for wlan in self.sensor["wlans"]:
-                if wlan["wlanid"] == wlanid:
-                    # Found the WLAN
-                    for test in wlan["tests"]:
-                        if test["test_server_name"] == testservername:
-                            # Found the test
-                            return [1, test]
-                    # Test not found in the list of configured tests for the WLAN
-                    return [2, "Test Server Name <"+str(testservername)+">, NOT found in the list of configured tests for WLAN <" + str(wlanid) + ">"]
-            # WLAN not found
-            return [3, "WLAN ID <" + str(wlanid) + ">, NOT found in the list of configured WLAN networks"]
+            index = self.testbyserver
+            key = testservername
+            msg = "Test Server Name <"+str(testservername)+">"
         elif testid==-1 and testservername=="" and testname != "":
             # Call using testname
-            for wlan in self.sensor["wlans"]:
-                if wlan["wlanid"] == wlanid:
-                    # Found the WLAN
-                    for test in wlan["tests"]:
-                        if test["test"] == testname:
-                            # Found the test
-                            return [1, test]
-                    # Test not found in the list of configured tests for the WLAN
-                    return [2, "Test Name <"+str(testname)+">, NOT found in the list of configured tests for WLAN <" + str(wlanid) + ">"]
-            # WLAN not found
-            return [3, "WLAN ID <" + str(wlanid) + ">, NOT found in the list of configured WLAN networks"]
+            index = self.testbyname
+            key = testname
+            msg = "Test Name <"+str(testname)+">"
         else:
             # Empty Call
             logger.info("Empty call... no results can be retrieved.")
             return [2, "Empty call... no results can be retrieved."]
 
+        if wlanid not in self.wlanbyid:
+            # WLAN not found
+            return [3, "WLAN ID <" + str(wlanid) + ">, NOT found in the list of configured WLAN networks"]
+        test = index.get((wlanid, key))
+        if test is None:
+            # Test not found in the list of configured tests for the WLAN
+            return [2, msg + ", NOT found in the list of configured tests for WLAN <" + str(wlanid) + ">"]
+        # Found the test
+        return [1, test]
+
     def getindexwlans(self, wlanid=-1):
         """
         Returns the position of the wlan in the list of WLANs in self.sensor, using wlanid
@@ -577,15 +882,13 @@ class Sensor:
             logger.info("Empty call to function...")
             return -1
         # Let's search for the idex
-        for wlan in self.sensor["wlans"]:
-            if wlan["wlanid"] == wlanid:
-                # found !!
-                index = self.sensor["wlans"].index(wlan)
-                logger.info("WLAN with wlanid <" + str(wlanid) + "> found in position <" + str(index) + ">")
-                return index
-        # Not found
-        logger.info("No WLAN in the list has wlanid = " + str(wlanid))
-        return -1
+        index = self.wlanposition.get(wlanid, -1)
+        if index == -1:
+            # Not found
+            logger.info("No WLAN in the list has wlanid = " + str(wlanid))
+        else:
+            logger.info("WLAN with wlanid <" + str(wlanid) + "> found in position <" + str(index) + ">")
+        return index
 
     def getindextests(self, wlanid=-1, testid=-1):
         """
@@ -606,24 +909,61 @@ class Sensor:
             logger.info("Bad call, need TWO parameters")
             return -1
         # Let's search for the index
-        for wlan in self.sensor["wlans"]:
-            if wlan["wlanid"] == wlanid:
-                # found !!
-                wlanindex = self.sensor["wlans"].index(wlan)
-                logger.info("WLAN with wlanid <" + str(wlanid) + "> found in position <" + str(wlanindex) + ">")
-                # Let's search for the testid
-                for test in wlan["tests"]:
-                    if test["testid"] == testid:
-                        # Found !!
-                        testindex = wlan["tests"].index(test)
-                        logger.info("TEST with testid <" + str(testid) + "> found in position <" + str(testindex) + ">")
-                        return testindex
-                # testid not found
-                logger.info("No TEST in the list has testid = " + str(testid))
-        # wlanid Not found
-        logger.info("No WLAN in the list has wlanid = " + str(wlanid))
-        return -1
+        if wlanid not in self.wlanposition:
+            # wlanid Not found
+            logger.info("No WLAN in the list has wlanid = " + str(wlanid))
+            return -1
+        testindex = self.testposition.get((wlanid, testid), -1)
+        if testindex == -1:
+            # testid not found
+            logger.info("No TEST in the list has testid = " + str(testid))
+        else:
+            logger.info("TEST with testid <" + str(testid) + "> found in position <" + str(testindex) + ">")
+        return testindex
+
+    def buildindexes(self):
+        """
+        Builds the lookup tables over self.sensor["wlans"], so finding a WLAN
+        or a test doesn't need to walk the lists. Must be called again if
+        self.sensor is changed. When several entries share a key, the first
+        one in the list wins, as a linear search would do.
+            self.wlanbyid:      wlanid -> wlan
+            self.wlanbyssid:    ssid -> wlan
+            self.wlanposition:  wlanid -> position in self.sensor["wlans"]
+            self.testbyid:      (wlanid, testid) -> test
+            self.testbyserver:  (wlanid, test_server_name) -> test
+            self.testbyname:    (wlanid, test) -> test
+            self.testposition:  (wlanid, testid) -> position in wlan["tests"]
+        """
+        self.wlanbyid = {}
+        self.wlanbyssid = {}
+        self.wlanposition = {}
+        self.testbyid = {}
+        self.testbyserver = {}
+        self.testbyname = {}
+        self.testposition = {}
+        for wlanindex, wlan in enumerate(self.sensor["wlans"]):
+            wlanid = wlan["wlanid"]
+            if wlanid in self.wlanbyid:
+                # Duplicated wlanid, only the first one can be reached
+                continue
+            self.wlanbyid[wlanid] = wlan
+            self.wlanposition[wlanid] = wlanindex
+            self.wlanbyssid.setdefault(wlan["configuration"]["ssid"], wlan)
+            for testindex, test in enumerate(wlan["tests"]):
+                self.testbyid.setdefault((wlanid, test["testid"]), test)
+                self.testposition.setdefault((wlanid, test["testid"]), testindex)
+                if "test_server_name" in test:
+                    self.testbyserver.setdefault((wlanid, test["test_server_name"]), test)
+                self.testbyname.setdefault((wlanid, test["test"]), test)
 
     def pprint(self):
         import json
-        return print(json.dumps(self.sensor, indent=2))
\ No newline at end of file
+        sensor = dict(self.sensor)
+        sensor["wlans"] = []
+        for wlan in self.sensor["wlans"]:
+            wlan = dict(wlan)
+            if "results" in wlan:
+                wlan["results"] = [resultdict(result) for result in wlan["results"]]
+            sensor["wlans"].append(wlan)
+        return print(json.dumps(sensor, indent=2, default=str))
\ No newline at end of file
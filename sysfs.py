@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import ipaddress
+import logging
+import os
+import socket
+import struct
+
+
+class Sysfs:
+    """
+        This Class reads the state of the network interfaces directly from
+        sysfs and procfs, no subprocess and no sudo:
+            /sys/class/net/<ifname>/operstate, address
+            /proc/sys/kernel/random/boot_id
+            /proc/net/wireless
+            /proc/net/route
+            /proc/net/if_inet6
+        All paths are relative to <root>, so it can be used with a fake
+        sysfs/procfs tree.
+        The 802.11 information (SSID, BSSID, channel, bitrate...) is not in
+        these files, it needs iw, see Wireless.getAssociationInfo()
+        Neither is the IPv4 address of each interface (/proc/net/fib_trie
+        does not tell the interface), see Wireless.nativeassociation()
+    """
+
+    def __init__(self, logname="log", root="/"):
+        """
+            Initialize
+        """
+        # Initialize the logging
+        self.logname = logname + ".Sysfs"
+        self.logger = logging.getLogger(self.logname)
+        self.logger.info("Logging initialization of Sysfs. Done.")
+        self.root = root
+
+    def readfile(self, path):
+        """
+            Returns the text of the file <path> (relative to root), or ""
+            if it can't be read
+        """
+        try:
+            with open(os.path.join(self.root, path.lstrip("/"))) as file:
+                return file.read()
+        except OSError:
+            return ""
+
+    def bootid(self):
+        """
+            Returns the id of the current boot of the kernel, "" if unknown
+        """
+        return self.readfile("/proc/sys/kernel/random/boot_id").strip()
+
+    def netdevices(self):
+        """
+            Returns the sorted LIST of names of the network devices
+        """
+        try:
+            return sorted(os.listdir(os.path.join(self.root, "sys/class/net")))
+        except OSError:
+            return []
+
+    def operstate(self, ifname):
+        """
+            Returns the operational state of <ifname>: "up", "down",
+            "dormant"... For a wireless interface "up" means associated
+            (and authorized)
+        """
+        return self.readfile("/sys/class/net/" + ifname + "/operstate").strip()
+
+    def macaddress(self, ifname):
+        """
+            Returns the MAC address of <ifname>
+        """
+        return self.readfile("/sys/class/net/" + ifname + "/address").strip()
+
+    def wireless(self, ifname):
+        """
+            Returns a DICT {"link", "level", "noise"} with the link quality
+            and the signal and noise levels (dBm) of <ifname>, from
+            /proc/net/wireless, or {} if the interface is not listed
+        """
+        for line in self.readfile("/proc/net/wireless").splitlines()[2:]:
+            name, _, values = line.partition(":")
+            if name.strip() != ifname:
+                continue
+            values = values.split()
+            try:
+                return {
+                    "link": float(values[1].rstrip(".")),
+                    "level": float(values[2].rstrip(".")),
+                    "noise": float(values[3].rstrip("."))
+                }
+            except (IndexError, ValueError):
+                return {}
+        return {}
+
+    def routes(self, ifname):
+        """
+            Returns the LIST of IPv4 routes of <ifname>, from /proc/net/route
+            route = {"destination", "gateway", "mask", "metric"}
+        """
+        routes = []
+        for line in self.readfile("/proc/net/route").splitlines()[1:]:
+            fields = line.split()
+            if len(fields) < 8 or fields[0] != ifname:
+                continue
+            try:
+                routes.append({
+                    "destination": self.hexaddress(fields[1]),
+                    "gateway": self.hexaddress(fields[2]),
+                    "mask": self.hexaddress(fields[7]),
+                    "metric": int(fields[6])
+                })
+            except (ValueError, struct.error):
+                continue
+        return routes
+
+    def gateway(self, ifname):
+        """
+            Returns the default gateway through <ifname>, or "" if none
+        """
+        defaults = [route for route in self.routes(ifname) if route["destination"] == "0.0.0.0" and route["mask"] == "0.0.0.0"]
+        if not defaults:
+            return ""
+        return min(defaults, key=lambda route: route["metric"])["gateway"]
+
+    def ipv6(self, ifname):
+        """
+            Returns [address, prefix length] of <ifname> from
+            /proc/net/if_inet6, global scope preferred over link scope,
+            or ["", ""]
+        """
+        found = ["", ""]
+        for line in self.readfile("/proc/net/if_inet6").splitlines():
+            fields = line.split()
+            if len(fields) < 6 or fields[5] != ifname:
+                continue
+            address = str(ipaddress.IPv6Address(bytes.fromhex(fields[0])))
+            prefix = str(int(fields[2], 16))
+            if int(fields[3], 16) == 0:
+                # Global scope
+                return [address, prefix]
+            if found[0] == "":
+                found = [address, prefix]
+        return found
+
+    def association(self, ifname):
+        """
+            Returns a DICT with the association information of <ifname> that
+            can be read from sysfs/procfs, with the same keys and format
+            used in Wireless.parseassociation():
+                "connected", "signal", "ipv6", "mask6", "gateway"
+            Fields that are not available are not in the DICT
+        """
+        info = {"connected": self.operstate(ifname) == "up"}
+        wireless = self.wireless(ifname)
+        if "level" in wireless:
+            info["signal"] = str(int(wireless["level"]))
+        address, prefix = self.ipv6(ifname)
+        if address != "":
+            info["ipv6"] = address
+            info["mask6"] = prefix
+        gateway = self.gateway(ifname)
+        if gateway != "":
+            info["gateway"] = gateway
+        return info
+
+    @staticmethod
+    def hexaddress(value):
+        """
+            Returns the IPv4 address in dotted notation of <value>, as written
+            in /proc/net/route (hex, host byte order)
+        """
+        return socket.inet_ntoa(struct.pack("=L", int(value, 16)))
@@ -1,7 +1,10 @@
  #!/usr/bin/env python3
 
 import logging
+from iperf import Iperf3Stream, direction, intervalfields, reverse_column, stability, summaryfields
 from osshell import OSshell
+from prober import Prober, rttsummary
+from results import BandwidthResult, DelayResult, UDPResult, resultdict
 
 class Test:
 
@@ -13,6 +16,25 @@ class Test:
         to the outputs
         Will be in-charge of running the tests.
     """
+
+    # Default max time (seconds) for each kind of test, the command running
+    # the test is killed when expired. Can be changed per test with the
+    # "timeout" key in testinfo
+    timeouts = {
+        "connectivity": 5,
+        "bandwidth": 60,
+        "delay": 60,
+        "packetloss": 60
+    }
+
+    # Seconds between two probes of the delay test, and seconds to wait for
+    # the answers after the last one
+    delay_interval = 0.2
+    delay_wait = 1.0
+
+    # Max number of intervals kept in the series of a streamed bandwidth
+    # test ("stream" in testinfo), the totals go on after that
+    stream_intervals = 3600
     
     def __init__(self, logname="log"):
         """
@@ -23,10 +45,23 @@ class Test:
         self.logger = logging.getLogger(self.logname)
         self.logger.info("Logging initialization of Test... Done.")
         self.results = {}
+        self.timeouts = dict(Test.timeouts)
+        self.prober = Prober(self.logname)
 
-    def runtest(self, testinfo):
+    def runtest(self, testinfo, ifname="", bindaddress="", timeout=None):
         """
             Run a test in wlanid with the information from testinfo
+            <ifname> and <bindaddress> force the test traffic through a given
+            wireless interface and source IP address, needed when several
+            interfaces are testing at the same time
+            <timeout> (seconds) limits the test time, on top of the
+            timeout of the kind of test (see testtimeout())
+            return [status, result]
+                status:
+                1 -> OK
+                2 -> Test not supported
+                3 -> Test failed
+                4 -> Test killed, timed out
             testinfo could be any of the following forms... and future (dns performance, dhcp performance, etc.)
             {
                 "test":"bandwidth",
@@ -68,66 +103,154 @@ class Test:
         # Let's run a test
         logger.info("Running a single test and return results...")
 
+        # Max time for the test
+        timeout = self.testtimeout(testinfo, timeout)
+
         # Let's call the right method, depending on the test
         if testinfo["test"] == "bandwidth":
             # Bandwidth test
             logger.info("Call to run a <" + str(testinfo["test"]) + "> test...")
-            status,self.results = self.runbandwidthtest(testinfo)
+            status,results = self.runbandwidthtest(testinfo, ifname, bindaddress, timeout)
         elif testinfo["test"] == "delay":
             # Delay test
             logger.info("Call to run a <" + str(testinfo["test"]) + "> test...")
-            status,self.results = self.rundelaytest(testinfo)
+            status,results = self.rundelaytest(testinfo, ifname, bindaddress, timeout)
         elif testinfo["test"] == "packetloss":
             # Packet Loss test
             logger.info("Call to run a <" + str(testinfo["test"]) + "> test...")
-            status,self.results = self.runudptest(testinfo)
+            status,results = self.runudptest(testinfo, ifname, bindaddress, timeout)
         else:
             # Non supported test
             logger.info("ERROR: <" + str(testinfo["test"]) + "> test is not supported yet...")
             return [2, testinfo["test"]+" test is not supported yet..."]
 
+        # Keep the last results, but return the local ones, as several
+        # tests may be running at the same time on different interfaces
+        self.results = results
+
         # Let's check the return status and return
-        if status > 1:
+        if status == 4:
+            # The test did not finish in time
+            logger.info("ERROR: test timed out...")
+            return [4, results]
+        elif status > 1:
             # Something was WRONG with the test
             logger.info("ERROR: something was wrong running the test...")
-            logger.info("ERROR: " + str(self.results))
-            return [3, self.results]
+            logger.info("ERROR: " + str(results))
+            return [3, results]
         else:
             # SUCCESS !!!!
             logger.info("SUCCESS!!! Test done successfully.")
-            return [1, self.results]
+            return [1, results]
+
+    async def aruntest(self, testinfo, ifname="", bindaddress="", timeout=None):
+        """
+            asyncio version of runtest(), so several tests (e.g. delay tests
+            against different servers) can run at the same time in one
+            event loop
+            return [status, result], as runtest()
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        logger.info("Running a single test (asyncio) and return results...")
+        timeout = self.testtimeout(testinfo, timeout)
+
+        # Let's call the right method, depending on the test
+        if testinfo["test"] == "bandwidth":
+            status, results = await self.arunbandwidthtest(testinfo, ifname, bindaddress, timeout)
+        elif testinfo["test"] == "delay":
+            status, results = await self.arundelaytest(testinfo, ifname, bindaddress, timeout)
+        elif testinfo["test"] == "packetloss":
+            status, results = await self.arunudptest(testinfo, ifname, bindaddress, timeout)
+        else:
+            # Non supported test
+            logger.info("ERROR: <" + str(testinfo["test"]) + "> test is not supported yet...")
+            return [2, testinfo["test"]+" test is not supported yet..."]
+
+        self.results = results
+        if status == 4:
+            # The test did not finish in time
+            logger.info("ERROR: test timed out...")
+            return [4, results]
+        elif status > 1:
+            # Something was WRONG with the test
+            logger.info("ERROR: " + str(results))
+            return [3, results]
+        logger.info("SUCCESS!!! Test done successfully.")
+        return [1, results]
+
+    def testtimeout(self, testinfo, timeout=None):
+        """
+            Returns the max time (seconds) for the test in testinfo: the
+            "timeout" in testinfo, or the default for this kind of test,
+            never longer than <timeout> (if not None)
+        """
+        testtimeout = testinfo.get("timeout", self.timeouts.get(testinfo["test"]))
+        if testtimeout is None:
+            return timeout
+        if timeout is None:
+            return float(testtimeout)
+        return min(float(testtimeout), timeout)
 
-    def checkipcconnectivity(self, ipaddress):
+    def connectivitycommand(self, ipaddress, ifname=""):
+        """
+            Returns the ping command LIST used to check IP connectivity
+        """
+        command_shell = ["/bin/ping","-c2","-w1"]
+        if ifname != "":
+            command_shell += ["-I", ifname]
+        command_shell += [ipaddress]
+        return command_shell
+
+    async def acheckipcconnectivity(self, ipaddress, ifname=""):
+        """
+            asyncio version of checkipcconnectivity()
+        """
+        os = OSshell(self.logname)
+        status, result, errors = await os.arun(self.connectivitycommand(ipaddress, ifname), self.timeouts["connectivity"])
+        return not result.returncode
+
+    def checkipcconnectivity(self, ipaddress, ifname=""):
         """ Check IP connectovity with ipaddress
             returns True if connectivity with 'ipaddress' is ok
             returns False if connectivity with 'ipaddress' is impossible
+            If <ifname> is indicated, ping goes out through that interface
         """
         os = OSshell(self.logname)
         # /bin/ping will retun 0 if there is ICMP echo response
         # will return 1 if there is NO ICMP echo response
-        command_shell = ["/bin/ping","-c2 -w1",ipaddress]
-        status, result, errors = os.runoscommand(command_shell)
+        command_shell = self.connectivitycommand(ipaddress, ifname)
+        status, result, errors = os.runoscommand(command_shell, self.timeouts["connectivity"])
         # in Python 0 is False, but it's OK for ping
         # in Python 1 is True, but it's NOK for ping
         # so let's change the rule...
         return not result.returncode
 
-    def runbandwidthtest(self, testinfo):
+    def runbandwidthtest(self, testinfo, ifname="", bindaddress="", timeout=None):
         """
             Let's run the iperf3 Bandwidth tests with the info in testinfo
+            Optional keys: "parallel_streams" (default 1), "reverse" (the
+            server sends, downlink) and "bidirectional" (both at the same
+            time, iperf3 >= 3.7), see bandwidthcommand(), and "stream" (the
+            output is read while iperf3 runs, iperf3 >= 3.17, see
+            arunbandwidthstream())
             {
                 "test":"bandwidth",
                 "testid":1
                 "status":"enable",
                 "test_server_ip":"192.168.1.5",
                 "test_server_port":"5201",
-                "test_server_name":"Local - iperf3 Local"
+                "test_server_name":"Local - iperf3 Local",
+                "parallel_streams":"4",
+                "reverse":true,
+                "bidirectional":false
             }
             return [status, result]
                 status:
                 1 -> OK
                 2 -> Test server NOT IP reachable
                 3 -> Iperf3 service not ready in the server when running the test
+                4 -> Test killed, not finished in <timeout> seconds
                 result:
                 {
                     "timestamp": "2017-12-28 18:43:17",
@@ -145,9 +268,6 @@ class Test:
                     "mean_rtt": 9152
                 }
         """
-        import time
-        import json
-
         # Attach to LOCAL SYSLOG
         logger = self.logger
         logger.info("Starting BANDWIDTH test with <" +str(testinfo["test_server_name"]) + "> server [" + str(testinfo["test_server_ip"]) + ":" + str(testinfo["test_server_port"]) + "]")
@@ -155,7 +275,7 @@ class Test:
         os = OSshell(self.logname)
         # Let's PING the TEST SERVERS, for ARP and DNS resolution and cache
         logger.info("Will now ping test server for caching MAC and DNS... (avoiding false results)")
-        if not self.checkipcconnectivity(testinfo["test_server_ip"]):
+        if not self.checkipcconnectivity(testinfo["test_server_ip"], ifname):
             # Server NOT reachable... skip this test
             logger.error("ERROR: Test Server: <" + str(testinfo["test_server_ip"]) + "> is NOT IP reachable... Will skip this TCP Bandwidth Test.")
             return [2, "Test Server not IP reachable..."]
@@ -163,49 +283,228 @@ class Test:
             # Ping success, now it must be in ARP table
             logger.info("Test Server: <" + str(testinfo["test_server_ip"]) + "> is now in ARP/DNS cache.")
             logger.info("Running the TCP Bandwidth test...")
+            if self.testflag(testinfo, "stream"):
+                import asyncio
+                return asyncio.run(self.arunbandwidthstream(testinfo, bindaddress, timeout))
             # Call iperf3
-            command_shell = ["/usr/bin/iperf3", "--client", testinfo["test_server_ip"]]
-            command_shell += ["--port", testinfo["test_server_port"], "--json"]
-            status, result, errors = os.runoscommand(command_shell)
-            # Get timestamp when test finished
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            # Check test result
-            if result.returncode:
-                # Server down, unreachable
-                logger.error("ERROR: TCP Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">. Not reachable for testing...")
-                logger.debug("ERROR: " + result.stdout.decode("utf-8"))
-                logger.debug("ERROR: " + str(errors))
-                return [3, "Iperf3 service was NOT ready in Server when running the test..."]
-            else:
-                # TCP Test SUCCESS !!!!
-                logger.info("SUCCESS!!! TCP Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
-                # Adapt the output, so only contains relevant information
-                # and add Timestamp
-                j1 = json.loads(result.stdout.decode("utf-8"))
-                output = j1["end"]["streams"][0]["sender"]
-                output["timestamp"] = timestamp
-                output["testid"] = testinfo["testid"]
-                output["status"] = "ok"
-                """
-                    output = {
-                                "timestamp": "2017-12-28 18:43:17",
-                                "testid":1,
-                                "status": "ok",
-                                "socket": 4,
-                                "start": 0,
-                                "end": 10.000525,
-                                "seconds": 10.000525,
-                                "bytes": 444473728,
-                                "bits_per_second": 355560315.564814,
-                                "retransmits": 0,
-                                "max_snd_cwnd": 3075552,
-                                "max_rtt": 14185,
-                                "min_rtt": 5595,
-                                "mean_rtt": 9152
-                            }
-                """
-                logger.info("TCP measurements: <" + str(output) + ">")
-                return [1, output]
+            command_shell = self.bandwidthcommand(testinfo, bindaddress)
+            status, result, errors = os.runoscommand(command_shell, timeout)
+            return self.parsebandwidthresult(testinfo, status, result, errors)
+
+    async def arunbandwidthtest(self, testinfo, ifname="", bindaddress="", timeout=None):
+        """
+            asyncio version of runbandwidthtest()
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        logger.info("Starting BANDWIDTH test with <" +str(testinfo["test_server_name"]) + "> server [" + str(testinfo["test_server_ip"]) + ":" + str(testinfo["test_server_port"]) + "]")
+        # Instantiate an OSshell for calling the OS
+        os = OSshell(self.logname)
+        if not await self.acheckipcconnectivity(testinfo["test_server_ip"], ifname):
+            # Server NOT reachable... skip this test
+            logger.error("ERROR: Test Server: <" + str(testinfo["test_server_ip"]) + "> is NOT IP reachable... Will skip this TCP Bandwidth Test.")
+            return [2, "Test Server not IP reachable..."]
+        logger.info("Running the TCP Bandwidth test...")
+        if self.testflag(testinfo, "stream"):
+            return await self.arunbandwidthstream(testinfo, bindaddress, timeout)
+        status, result, errors = await os.arun(self.bandwidthcommand(testinfo, bindaddress), timeout)
+        return self.parsebandwidthresult(testinfo, status, result, errors)
+
+    def bandwidthcommand(self, testinfo, bindaddress="", stream=False):
+        """
+            Returns the iperf3 command LIST for the bandwidth test in testinfo
+            "parallel_streams" -> --parallel, "reverse" -> --reverse,
+            "bidirectional" -> --bidir (wins over "reverse")
+            With --json-stream instead of --json if <stream>
+        """
+        command_shell = ["/usr/bin/iperf3", "--client", testinfo["test_server_ip"]]
+        command_shell += ["--port", testinfo["test_server_port"], "--json-stream" if stream else "--json"]
+        streams = int(testinfo.get("parallel_streams", 1))
+        if streams > 1:
+            command_shell += ["--parallel", str(streams)]
+        if self.testflag(testinfo, "bidirectional"):
+            command_shell += ["--bidir"]
+        elif self.testflag(testinfo, "reverse"):
+            command_shell += ["--reverse"]
+        if bindaddress != "":
+            command_shell += ["--bind", bindaddress]
+        return command_shell
+
+    @staticmethod
+    def testflag(testinfo, key):
+        """
+            Returns True if the option <key> of testinfo is set: true, 1,
+            "true", "yes" or "enable"
+        """
+        value = testinfo.get(key, False)
+        if isinstance(value, str):
+            return value.strip().lower() in ("true", "yes", "enable", "1")
+        return bool(value)
+
+    def bandwidthstream(self, testinfo, bindaddress="", timeout=None):
+        """
+            Returns the Iperf3Stream of the bandwidth test in testinfo, an
+            async iterator of the records of its intervals
+        """
+        return Iperf3Stream(self.bandwidthcommand(testinfo, bindaddress, True), timeout, self.logname)
+
+    async def arunbandwidthstream(self, testinfo, bindaddress="", timeout=None):
+        """
+            Run the bandwidth test in testinfo reading the intervals while
+            iperf3 runs, see Iperf3Stream. The series keeps the first
+            stream_intervals intervals, and the totals are kept on the fly,
+            so the memory is bounded however long the test is.
+            If iperf3 is killed (<timeout>) or aborts after some intervals,
+            the result has status "partial", with the totals of the
+            intervals received
+            return [status, result], as runbandwidthtest()
+        """
+        import math
+        import time
+        from array import array
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        stream = self.bandwidthstream(testinfo, bindaddress, timeout)
+        series = None
+        sent = 0.0
+        reverse = 0.0
+        retransmits = 0
+        seconds = 0.0
+        async for record in stream:
+            if series is None:
+                series = {column: array("d") for column in record}
+            if stream.intervals <= self.stream_intervals:
+                for column, value in record.items():
+                    series[column].append(value)
+            elif stream.intervals == self.stream_intervals + 1:
+                logger.info("Bandwidth test series full, keeping only the totals from now on.")
+            sent += record["bits_per_second"] * (record["end"] - record["start"]) / 8
+            if not math.isnan(record.get(reverse_column, math.nan)):
+                reverse += record[reverse_column] * (record["end"] - record["start"]) / 8
+            if not math.isnan(record["retransmits"]):
+                retransmits += int(record["retransmits"])
+            seconds = record["end"]
+        # Get timestamp when test finished
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        if series is not None:
+            fields = stability(series)
+            fields["intervals"] = series
+        if stream.status == 1:
+            # TCP Test SUCCESS !!!!
+            logger.info("SUCCESS!!! TCP Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
+            output = BandwidthResult(
+                testid=testinfo["testid"],
+                timestamp=timestamp,
+                status="ok",
+                **summaryfields({"start": stream.start or {}, "end": stream.end}),
+                **(fields if series is not None else {})
+            )
+            logger.info("TCP measurements: <" + str(output) + ">")
+            return [1, output]
+        if series is None:
+            if stream.status == 21:
+                # Test killed, did not finish in time
+                logger.error("ERROR: TCP Test with Test Server <" + testinfo["test_server_ip"] + "> timed out, killed.")
+                return [4, "Test timed out, killed..."]
+            logger.error("ERROR: TCP Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">: " + stream.error)
+            return [3, "Iperf3 service was NOT ready in Server when running the test..."]
+        # Killed or aborted after some intervals, keep what was measured
+        logger.warning("TCP Test with Test Server <" + testinfo["test_server_ip"] + "> not finished (" + stream.error + "), partial result of <" + str(stream.intervals) + "> intervals.")
+        j1 = {"start": stream.start or {}}
+        way = direction(j1)
+        cwnds = [int(cwnd) for cwnd in series["snd_cwnd"] if not math.isnan(cwnd)]
+        rtts = [int(rtt) for rtt in series["rtt"] if not math.isnan(rtt)]
+        bits_per_second = sent * 8 / seconds if seconds > 0 else 0.0
+        output = BandwidthResult(
+            testid=testinfo["testid"],
+            timestamp=timestamp,
+            status="partial",
+            seconds=seconds,
+            bytes=int(sent),
+            bits_per_second=bits_per_second,
+            retransmits=retransmits,
+            max_snd_cwnd=max(cwnds, default=0),
+            max_rtt=max(rtts, default=0),
+            min_rtt=min(rtts, default=0),
+            mean_rtt=sum(rtts) // len(rtts) if rtts else 0,
+            direction=way,
+            parallel_streams=int(j1["start"].get("test_start", {}).get("num_streams", 1)),
+            # Throughput of the intervals received, as summaryfields()
+            uplink_bps=bits_per_second if way != "down" else 0.0,
+            downlink_bps=bits_per_second if way == "down" else reverse * 8 / seconds if seconds > 0 else 0.0,
+            **fields
+        )
+        logger.info("TCP measurements: <" + str(output) + ">")
+        return [1, output]
+
+    def parsebandwidthresult(self, testinfo, status, result, errors):
+        """
+            Parses the iperf3 output in <result> (CompletedProcess) of a
+            bandwidth test
+            return [status, result], as runbandwidthtest()
+        """
+        import time
+        import json
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        # Get timestamp when test finished
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        # Check test result
+        if status == 21:
+            # Test killed, did not finish in time
+            logger.error("ERROR: TCP Test with Test Server <" + testinfo["test_server_ip"] + "> timed out, killed.")
+            return [4, "Test timed out, killed..."]
+        elif result.returncode:
+            # Server down, unreachable
+            logger.error("ERROR: TCP Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">. Not reachable for testing...")
+            logger.debug("ERROR: " + result.stdout.decode("utf-8"))
+            logger.debug("ERROR: " + str(errors))
+            return [3, "Iperf3 service was NOT ready in Server when running the test..."]
+        else:
+            # TCP Test SUCCESS !!!!
+            logger.info("SUCCESS!!! TCP Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
+            # Adapt the output, so only contains relevant information
+            # and add Timestamp
+            j1 = json.loads(result.stdout.decode("utf-8"))
+            output = BandwidthResult(
+                testid=testinfo["testid"],
+                timestamp=timestamp,
+                status="ok",
+                **summaryfields(j1),
+                **intervalfields(j1)
+            )
+            """
+                output = BandwidthResult(
+                            testid=1,
+                            timestamp="2017-12-28 18:43:17",
+                            status="ok",
+                            seconds=10.000525,
+                            bytes=444473728,
+                            bits_per_second=355560315.564814,
+                            retransmits=0,
+                            max_snd_cwnd=3075552,
+                            max_rtt=14185,
+                            min_rtt=5595,
+                            mean_rtt=9152,
+                            min_interval_bps=302115541.097686,
+                            cv_bps=0.061,
+                            slowstart_s=0.0,
+                            direction="up",
+                            parallel_streams=1,
+                            uplink_bps=352499983.431551,
+                            downlink_bps=0.0,
+                            streams=(StreamResult(socket=4, direction="up", bytes=440648112,
+                                                  bits_per_second=352499983.431551, retransmits=0,
+                                                  max_snd_cwnd=3075552, mean_rtt=9152),),
+                            intervals={"start": array("d", [0.0, 1.000214, ...]),
+                                       "bits_per_second": array("d", [302115541.097686, ...]),
+                                       "snd_cwnd": ..., "rtt": ..., ...}
+                        )
+            """
+            logger.info("TCP measurements: <" + str(output) + ">")
+            return [1, output]
     """
     iperf3 TCP output
     {
@@ -547,31 +846,31 @@ class Test:
     }
     """
 
-    def rundelaytest(self, testinfo):
+    def rundelaytest(self, testinfo, ifname="", bindaddress="", timeout=None):
         """
             Let's run the delay test with the information in testinfo
-            Using ping for round-trip time delay
+            Using the in-process prober for round-trip time delay, see
+            prober.py, one probe every "test_server_delay_interval" seconds
+            (default delay_interval)
             {
                 "test":"delay",
                 "testid":2,
                 "status":"enable",
                 "test_server_ip":"192.168.1.5",
                 "test_server_name":"Delay Test Server",
-                "test_server_delay_packets_to_send":"50"
+                "test_server_delay_packets_to_send":"50",
+                "test_server_delay_interval":"0.2"
             }
         """
-        import time
-        import json
+        import asyncio
 
         # Attach to LOCAL SYSLOG
         logger = self.logger
         logger.info("Starting DELAY test with <" +str(testinfo["test_server_name"]) + "> server [" + str(testinfo["test_server_ip"]) + "]")
-        # Instantiate an OSshell for calling the OS
-        os = OSshell(self.logname)
 
         # Let's PING the TEST SERVERS, for ARP and DNS resolution and cache
         logger.info("Will now ping test server for caching MAC and DNS... (avoiding false results)")
-        if not self.checkipcconnectivity(testinfo["test_server_ip"]):
+        if not self.checkipcconnectivity(testinfo["test_server_ip"], ifname):
             # Server NOT reachable... skip this test
             logger.error("ERROR: Test Server: <" + str(testinfo["test_server_ip"]) + "> is NOT IP reachable... Will skip this DELAY Test.")
             return [2, "Test Server not IP reachable..."]
@@ -579,80 +878,93 @@ class Test:
             # Ping success, now it must be in ARP table
             logger.info("Test Server: <" + str(testinfo["test_server_ip"]) + "> is now in ARP/DNS cache.")
             logger.info("Running the DELAY test...")
-            """
-            # Now let's run the delay test...
-            # using regular ping tool
-            # For better accuracy, a NTP timestamped TCP flow, avoiding IP fragmentation, is preferred... 
-            # but for now let's use ping
-            # ping -A -q -c 20 <IPADDRESS>
-                # -A        -> wait for echo response and send new packet, instead of default 1 second between packets
-                # -q        -> run in quiet mode, reporting the statistics at the end
-                # -c 20    -> send 20 echo request
-            # Adding the results to the output:
-            """
-            command_shell = ["/bin/ping", "-A", "-q", "-c", testinfo["test_server_delay_packets_to_send"], testinfo["test_server_ip"]]
-            status, result, errors = os.runoscommand(command_shell)
-            # Get timestamp when test finished
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            # Check test result
-            if result.returncode:
-                # Server down, unreachable
-                logger.error("ERROR: DELAY Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">. Not reachable for testing...")
-                logger.debug("ERROR: " + result.stdout.decode("utf-8"))
-                logger.debug("ERROR: " + str(errors))
-                return [3, "DELAY server was NOT ready when running the test..."]
-            else:
-                # Delay test SUCCESS !!
-                logger.info("SUCCESS!!! DELAY Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
-                # Adapt the output, so only contains relevant information
-                # and add Timestamp
-                """
-                    Content of ping output  - p1.stdout.decode("utf-8")
-                    [0]PING 192.168.1.54 (192.168.1.54) 56(84) bytes of data.
-                    [1]
-                    [2]--- 192.168.1.54 ping statistics ---
-                    [3]20 packets transmitted, 20 received, 0% packet loss, time 3812ms
-                    [4]rtt min/avg/max/mdev = 2.804/42.068/202.262/47.512 ms, pipe 2, ipg/ewma 200.652/32.505 ms
-                """
-                output={}
-                p2 = result.stdout.decode("utf-8").splitlines()
-                output["timestamp"] = timestamp
-                output["testid"] = testinfo["testid"]
-                output["status"] = "ok"
-                output["d_packets_sent"] = p2[3].split()[0]
-                output["d_packets_received"] = p2[3].split()[3]
-                output["d_packet_loss"] = str(int(p2[3].split()[0]) - int(p2[3].split()[3]))
-                output["d_packet_loss_percent"] = float(p2[3].split()[5].strip("%"))
-                output["d_time"] = p2[3].split()[9].strip("ms")
-                output["d_rtt_min_ms"] = float(p2[4].split()[3].split("/")[0])
-                output["d_rtt_avg_ms"] = float(p2[4].split()[3].split("/")[1])
-                output["d_rtt_max_ms"] = float(p2[4].split()[3].split("/")[2])
-                output["d_rtt_mdev_ms"] = float(p2[4].split()[3].split("/")[3])
-                output["d_ipg_ms"] = float(p2[4].split()[len(p2[4].split()) - 2].split("/")[0])
-                output["d_ewma_ms"] = float(p2[4].split()[len(p2[4].split()) - 2].split("/")[1])
-
-                """
-                output = {
-                            "timestamp": "Thu, 28 Dec 2017 16:16:52 GMT",
-                            "testid":2,
-                            "status": "ok",
-                            "d_packets_sent": "20",
-                            "d_packets_received": "20",
-                            "d_packet_loss": "0",
-                            "d_packet_loss_percent": "0",
-                            "d_time": "3812",
-                            "d_rtt_min_ms": "2.804",
-                            "d_rtt_avg_ms": "42.068",
-                            "d_rtt_max_ms": "202.262",
-                            "d_rtt_mdev_ms": "47.512",
-                            "d_ipg_ms": "200.652",
-                            "d_ewma_ms": "32.505"
-                        }
-                """
-                logger.info("Delay measurements: <" + str(output) + ">")
-                return [1, output]
+            return asyncio.run(self.arundelayprobes(testinfo, bindaddress, timeout, ifname))
+
+    async def arundelaytest(self, testinfo, ifname="", bindaddress="", timeout=None):
+        """
+            asyncio version of rundelaytest()
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        logger.info("Starting DELAY test with <" +str(testinfo["test_server_name"]) + "> server [" + str(testinfo["test_server_ip"]) + "]")
+        if not await self.acheckipcconnectivity(testinfo["test_server_ip"], ifname):
+            # Server NOT reachable... skip this test
+            logger.error("ERROR: Test Server: <" + str(testinfo["test_server_ip"]) + "> is NOT IP reachable... Will skip this DELAY Test.")
+            return [2, "Test Server not IP reachable..."]
+        logger.info("Running the DELAY test...")
+        return await self.arundelayprobes(testinfo, bindaddress, timeout, ifname)
+
+    async def arundelayprobes(self, testinfo, bindaddress="", timeout=None, ifname=""):
+        """
+            Send the probes of the delay test in testinfo, out of <ifname>
+            and from <bindaddress> if indicated, in at most <timeout> seconds
+            return [status, result], as rundelaytest()
+        """
+        import asyncio
 
-    def runudptest(self, testinfo):
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        count = int(testinfo["test_server_delay_packets_to_send"])
+        interval = float(testinfo.get("test_server_delay_interval", self.delay_interval))
+        try:
+            status, run = await asyncio.wait_for(
+                self.prober.probe(testinfo["test_server_ip"], count, interval, self.delay_wait, bindaddress, ifname), timeout)
+        except asyncio.TimeoutError:
+            # Test killed, did not finish in time
+            logger.error("ERROR: DELAY Test with Test Server <" + testinfo["test_server_ip"] + "> timed out, killed.")
+            return [4, "Test timed out, killed..."]
+        if status > 1:
+            logger.error("ERROR: DELAY Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">: " + str(run))
+            return [3, "DELAY server was NOT ready when running the test..."]
+        return self.delayresult(testinfo, run)
+
+    def delayresult(self, testinfo, run):
+        """
+            Summarizes the per probe RTTs in <run> (see Prober.probe()) of a
+            delay test, with the same statistics as ping:
+            min/avg/max/mdev of the RTTs, and their EWMA (weight 1/8), plus
+            their percentiles, histogram and loss bursts (see rttsummary())
+            return [status, result], as rundelaytest()
+        """
+        import math
+        import time
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        # Get timestamp when test finished
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        rtts = [rtt for rtt in run["rtt_ms"] if not math.isnan(rtt)]
+        if not rtts:
+            # Server down, unreachable
+            logger.error("ERROR: DELAY Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">. Not reachable for testing...")
+            return [3, "DELAY server was NOT ready when running the test..."]
+        # Delay test SUCCESS !!
+        logger.info("SUCCESS!!! DELAY Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
+        avg = math.fsum(rtts) / len(rtts)
+        ewma = rtts[0]
+        for rtt in rtts[1:]:
+            ewma += (rtt - ewma) / 8
+        output = DelayResult(
+            testid=testinfo["testid"],
+            timestamp=timestamp,
+            status="ok",
+            d_packets_sent=run["sent"],
+            d_packets_received=len(rtts),
+            d_packet_loss=run["sent"] - len(rtts),
+            d_packet_loss_percent=100.0 * (run["sent"] - len(rtts)) / run["sent"],
+            d_time=int(run["duration_ms"]),
+            d_rtt_min_ms=min(rtts),
+            d_rtt_avg_ms=avg,
+            d_rtt_max_ms=max(rtts),
+            d_rtt_mdev_ms=math.sqrt(max(0.0, math.fsum(rtt * rtt for rtt in rtts) / len(rtts) - avg * avg)),
+            d_ipg_ms=run["ipg_ms"],
+            d_ewma_ms=ewma,
+            **rttsummary(run["rtt_ms"])
+        )
+        logger.info("Delay measurements (" + run["method"] + "): <" + str(output) + ">")
+        return [1, output]
+
+    def runudptest(self, testinfo, ifname="", bindaddress="", timeout=None):
         """
             Let's run the UDP tests with the servers from testinfo
             Using iperf3 for jitter and packet loss
@@ -668,9 +980,6 @@ class Test:
                 "test_server_udp_interval": "10"
             }
         """
-        import time
-        import json
-
         # Attach to LOCAL SYSLOG
         logger = self.logger
         logger.info("Starting Packet Loss and Jitter test with <" +str(testinfo["test_server_name"]) + "> server [" + str(testinfo["test_server_ip"]) + ":" + str(testinfo["test_server_port"]) + "]")
@@ -678,7 +987,7 @@ class Test:
         os = OSshell(self.logname)
         # Let's PING the TEST SERVERS, for ARP and DNS resolution and cache
         logger.info("Will now ping test server for caching MAC and DNS... (avoiding false results)")
-        if not self.checkipcconnectivity(testinfo["test_server_ip"]):
+        if not self.checkipcconnectivity(testinfo["test_server_ip"], ifname):
             # Server NOT reachable... skip this test
             logger.error("ERROR: Test Server: <" + str(testinfo["test_server_ip"]) + "> is NOT IP reachable... Will skip this Packet Loss and Jitter Test.")
             return [2, "Test Server not IP reachable..."]
@@ -687,55 +996,105 @@ class Test:
             logger.info("Test Server: <" + str(testinfo["test_server_ip"]) + "> is now in ARP/DNS cache.")
             logger.info("Running the Packet Loss and Jitter test...")
             # Call iperf3
-            command_shell = ["/usr/bin/iperf3",
-                             "--client", testinfo["test_server_ip"],
-                             "--udp",
-                             "--interval", testinfo["test_server_udp_interval"],
-                             "--time", testinfo["test_server_udp_time"],
-                             "--bandwidth", testinfo["test_server_udp_bandwidth"],
-                             "--json"
-                             ]
-            status, result, errors = os.runoscommand(command_shell)
-            # Get timestamp when test finished
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            # Check test result
-            if result.returncode:
-                # Server down, unreachable
-                logger.error("ERROR: UDP (Packet Loss and Jitter) Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">. Not reachable for testing...")
-                logger.debug("ERROR: " + result.stdout.decode("utf-8"))
-                logger.debug("ERROR: " + str(errors))
-                return [3, "Iperf3 service was NOT ready in Server when running the test..."]
-            else:
-                # UDP Test SUCCESS !!!!
-                logger.info("SUCCESS!!! UDP Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
-                # Adapt the output, so only contains relevant information
-                # and add Timestamp
-                output = {}
-                j1 = json.loads(result.stdout.decode("utf-8"))
-                output = j1["end"]["streams"][0]["udp"]
-                output["timestamp"] = timestamp
-                output["testid"] = testinfo["testid"]
-                output["status"] = "ok"
-                """
-                output =    {
-                            "timestamp": "Thu, 28 Dec 2017 16:16:52 GMT",
-                            "testid":3,
-                            "status": "ok"
-                            "socket": 4,
-                            "start": 0,
-                            "end": 10.000331,
-                            "seconds": 10.000331,
-                            "bytes": 12386304,
-                            "bits_per_second": 9908715.059617,
-                            "jitter_ms": 0.171,
-                            "lost_packets": 2,
-                            "packets": 1512,
-                            "lost_percent": 0.132275,
-                            "out_of_order": 0
-                        }
-                """
-                logger.info("UDP (Packet Loss and Jitter) measurements: <" + str(output) + ">")
-                return [1, output]
+            command_shell = self.udpcommand(testinfo, bindaddress)
+            status, result, errors = os.runoscommand(command_shell, timeout)
+            return self.parseudpresult(testinfo, status, result, errors)
+
+    async def arunudptest(self, testinfo, ifname="", bindaddress="", timeout=None):
+        """
+            asyncio version of runudptest()
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        logger.info("Starting Packet Loss and Jitter test with <" +str(testinfo["test_server_name"]) + "> server [" + str(testinfo["test_server_ip"]) + ":" + str(testinfo["test_server_port"]) + "]")
+        # Instantiate an OSshell for calling the OS
+        os = OSshell(self.logname)
+        if not await self.acheckipcconnectivity(testinfo["test_server_ip"], ifname):
+            # Server NOT reachable... skip this test
+            logger.error("ERROR: Test Server: <" + str(testinfo["test_server_ip"]) + "> is NOT IP reachable... Will skip this Packet Loss and Jitter Test.")
+            return [2, "Test Server not IP reachable..."]
+        logger.info("Running the Packet Loss and Jitter test...")
+        status, result, errors = await os.arun(self.udpcommand(testinfo, bindaddress), timeout)
+        return self.parseudpresult(testinfo, status, result, errors)
+
+    def udpcommand(self, testinfo, bindaddress=""):
+        """
+            Returns the iperf3 command LIST for the UDP test in testinfo
+        """
+        command_shell = ["/usr/bin/iperf3",
+                         "--client", testinfo["test_server_ip"],
+                         "--udp",
+                         "--interval", testinfo["test_server_udp_interval"],
+                         "--time", testinfo["test_server_udp_time"],
+                         "--bandwidth", testinfo["test_server_udp_bandwidth"],
+                         "--json"
+                         ]
+        if bindaddress != "":
+            command_shell += ["--bind", bindaddress]
+        return command_shell
+
+    def parseudpresult(self, testinfo, status, result, errors):
+        """
+            Parses the iperf3 output in <result> (CompletedProcess) of a
+            UDP test
+            return [status, result], as runudptest()
+        """
+        import time
+        import json
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+        # Get timestamp when test finished
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        # Check test result
+        if status == 21:
+            # Test killed, did not finish in time
+            logger.error("ERROR: UDP (Packet Loss and Jitter) Test with Test Server <" + testinfo["test_server_ip"] + "> timed out, killed.")
+            return [4, "Test timed out, killed..."]
+        elif result.returncode:
+            # Server down, unreachable
+            logger.error("ERROR: UDP (Packet Loss and Jitter) Test FAILURE with Test Server <" + testinfo["test_server_ip"] + ">. Not reachable for testing...")
+            logger.debug("ERROR: " + result.stdout.decode("utf-8"))
+            logger.debug("ERROR: " + str(errors))
+            return [3, "Iperf3 service was NOT ready in Server when running the test..."]
+        else:
+            # UDP Test SUCCESS !!!!
+            logger.info("SUCCESS!!! UDP Test with server <" + testinfo["test_server_ip"] + "> successfully done.")
+            # Adapt the output, so only contains relevant information
+            # and add Timestamp
+            j1 = json.loads(result.stdout.decode("utf-8"))
+            udp = j1["end"]["streams"][0]["udp"]
+            output = UDPResult(
+                testid=testinfo["testid"],
+                timestamp=timestamp,
+                status="ok",
+                seconds=float(udp["seconds"]),
+                bytes=int(udp["bytes"]),
+                bits_per_second=float(udp["bits_per_second"]),
+                jitter_ms=float(udp["jitter_ms"]),
+                lost_packets=int(udp["lost_packets"]),
+                packets=int(udp["packets"]),
+                lost_percent=float(udp["lost_percent"]),
+                out_of_order=int(udp.get("out_of_order", 0)),
+                **intervalfields(j1)
+            )
+            """
+            output = UDPResult(
+                        testid=3,
+                        timestamp="2017-12-28 16:16:52",
+                        status="ok",
+                        seconds=10.000331,
+                        bytes=12386304,
+                        bits_per_second=9908715.059617,
+                        jitter_ms=0.171,
+                        lost_packets=2,
+                        packets=1512,
+                        lost_percent=0.132275,
+                        out_of_order=0
+                    )
+            """
+            logger.info("UDP (Packet Loss and Jitter) measurements: <" + str(output) + ">")
+            return [1, output]
 
     """
         Content of iperf3 udp
@@ -840,5 +1199,5 @@ class Test:
 
     def pprint(self):
         import json
-        return print(json.dumps(self.results, indent=2))
+        return print(json.dumps(resultdict(self.results), indent=2))
 
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
 import logging
+import threading
 from osshell import OSshell
+from sysfs import Sysfs
+from rtnetlink import Rtnetlink, Rtnetlinkerror
+from sampler import StationSampler
+from results import ChannelSurvey
+from nmcli import NmcliClient
 
 class Wireless:
 
@@ -11,12 +17,75 @@ class Wireless:
         NO PASSWORD IS REQUESTED:
         $ sudo visudo
         -> Add AT THE END OF THE FILE:
-        <user>  ALL=(root) NOPASSWD: /sbin/iw, /usr/bin/nmcli, /usr/bin/lshw
+        <user>  ALL=(root) NOPASSWD: /sbin/iw, /usr/bin/nmcli, /usr/bin/lshw, /usr/bin/timeout
         
         Example:
-        bartolo     ALL=(root) NOPASSWD: /sbin/iw, /usr/bin/nmcli, /usr/bin/lshw
+        bartolo     ALL=(root) NOPASSWD: /sbin/iw, /usr/bin/nmcli, /usr/bin/lshw, /usr/bin/timeout
+        
+        The commands run as root are wrapped in timeout(1), so they are
+        killed by root when they expire, see OSshell.privileged()
     """
     
+    # Max time (seconds) for each kind of OS command, the command is killed
+    # when expired so a stuck nmcli/iw can't freeze the sensor
+    timeouts = {
+        "lshw": 30,
+        "iw": 10,
+        "nmcli": 30,
+        "scan": 30,
+        "connect": 90
+    }
+
+    # Seconds a cached association (see checkcurrentwlan) is trusted
+    # before checking the nmcli profile again, the link is always checked
+    association_ttl = 300
+
+    # Fingerprints of the nmcli connections written by the sensor, so they
+    # are only rewritten when their configuration changes
+    profiles_file = "/home/ale/sensor/nmcliprofiles.json"
+
+    # Scan table (see scan()): seconds the table is used before reading it
+    # again from nmcli, min seconds between two rescans, and seconds to
+    # wait for the results of a rescan
+    scan_maxage = 30
+    rescan_interval = 60
+    rescan_wait = 3
+
+    # Source of the association fields that can be read both with the OS
+    # commands ("iw", that is iw and ip) and from sysfs/procfs ("sysfs"),
+    # the IP ones also from the kernel with rtnetlink ("netlink"),
+    # and the command of associationcommands() that gives each of them
+    # The IPv4 address and mask are not in sysfs/procfs, "sysfs" takes them
+    # from netlink too
+    association_sources = {
+        "connected": "iw",
+        "signal": "iw",
+        "ipaddress": "netlink",
+        "mask": "netlink",
+        "ipv6": "netlink",
+        "mask6": "netlink",
+        "gateway": "netlink"
+    }
+    association_commandfields = {
+        "connected": "link",
+        "signal": "link",
+        "ipaddress": "address",
+        "mask": "address",
+        "ipv6": "address",
+        "mask6": "address",
+        "gateway": "route"
+    }
+
+    # Root of sysfs and procfs, "/" but for testing
+    sysfs_root = "/"
+
+    # Cache of the hardware inventory (getSystemWLANInfo()), valid while
+    # the boot and the network devices are the same
+    inventory_file = "/home/ale/sensor/wlaninventory.json"
+
+    # Samples per second of the station statistics during the tests (1-10)
+    sample_rate = 2
+    
     def __init__(self, logname="log"):
         """
             Initializate wireless
@@ -24,8 +93,36 @@ class Wireless:
         self.logname = logname + ".Wireless"
         self.logger = logging.getLogger(self.logname)
         self.logger.info("Logging initialization of Wireless. Done.")
+        self.timeouts = dict(Wireless.timeouts)
+        self.association_sources = dict(Wireless.association_sources)
+        self.sysfs = Sysfs(self.logname, self.sysfs_root)
+        self.netlink = Rtnetlink(self.logname)
+        self.sample_rate = Wireless.sample_rate
+        # Last channel survey of each interface {ifname: {freq: counters}}
+        self.surveys = {}
+        # Association cache {ifname: {"ssid", "wlaninfo", "time"}}
+        self.associations = {}
+        # Fingerprints of the nmcli connections written by the sensor,
+        # changed (and stored) by several WLAN threads
+        self.profiles = self.loadprofiles()
+        self.profilelock = threading.Lock()
+        # Scan table, shared by all the WLANs (and threads) of a cycle
+        self.scanlock = threading.Lock()
+        self.scanentries = []
+        self.scanbyssid = {}
+        self.scanbybssid = {}
+        self.scantime = None
+        self.lastrescan = None
         self.os = OSshell()
-        self.wirelessinfo = self.getSystemWLANInfo()
+        # nmcli connections and profiles, cached within a cycle
+        self.nmcli = NmcliClient(self.os, self.timeouts, self.logname)
+        # Capabilities of the phys and regulatory domains (iw list, iw reg get)
+        self.phys = {}
+        self.regulatory = {}
+        # Hardware inventory, from the cache when it's of this same boot
+        self.wirelessinfo = self.loadinventory()
+        if self.wirelessinfo is None:
+            self.refreshinventory()
 
         
     def getSystemWLANInfo(self):
@@ -39,22 +136,25 @@ class Wireless:
             Returns a list of dict/json object with RELEVANT information
             Each entry is a Wireless Interface, most probably will be just one
         """
+        import sys
+
         # Attach to LOCAL SYSLOG
         logger = self.logger
         
         wlaninfo = []
+        hw_wlan_interfaces = []
         
         # Let's get Hardware and Drivers information about wireless system
         # with the output of lshw
         command_shell = ["sudo", "/usr/bin/lshw", "-C", "network"]
-        status,p1,errors = self.os.runoscommand(command_shell)
+        status,p1,errors = self.os.runoscommand(command_shell, self.timeouts["lshw"])
         
         if p1.returncode:
             # Pretty strange something was wrong with the call to lshw
             # so we can't get information... most probably is a Linux issue
             lshw_ok = False
         else:
-            
+            lshw_ok = True
             p2 = p1.stdout.decode("utf-8").strip().split("*-network")
             del p2[0]
             hw_wlan_interfaces = []
@@ -112,132 +212,452 @@ class Wireless:
         
         
         
-        # Let' get current information about the wireless phys
-        for wlan_interface in wlaninfo:
-            
-            command_shell = ["sudo", "/sbin/iw", "phy", wlan_interface["phy"], "info"]
-            
-            status,p1,errors = self.os.runoscommand(command_shell)
-            
-            p2 = p1.stdout.decode("utf-8").strip()
-            
-            wlan_interface["Bands"] = p2.count("Band ")
-            phy_info = p2
-        
-        # Let's get current regulatory domain
+        # Let's get the capabilities of all the wireless phys, and the
+        # regulatory domains, once for all the interfaces
+        command_shell = ["sudo", "/sbin/iw", "list"]
+        status,p1,errors = self.os.runoscommand(command_shell, self.timeouts["iw"])
+        self.phys = self.parsephys(p1.stdout.decode("utf-8"))
+        iw_ok = status == 1 and p1.returncode == 0 and len(self.phys) > 0
+
+        command_shell = ["sudo", "/sbin/iw", "reg", "get"]
+        status,p1,errors = self.os.runoscommand(command_shell, self.timeouts["iw"])
+        self.regulatory = self.parseregulatory(p1.stdout.decode("utf-8"))
+
         for wlan_interface in wlaninfo:
-            
-            command_shell = ["sudo", "/sbin/iw", "reg", "get"]
-            status,p1,errors = self.os.runoscommand(command_shell)
-        
-            p2 = p1.stdout.decode("utf-8").strip()
-            
-            control = False
-            for line in p2.splitlines():
-                
-                if line.strip().startswith("phy#" + wlan_interface["physical id"]):
-                    control = True
-                
-                if control:
-                    if line.strip().startswith("country"):
-                        wlan_interface["Country"] = line.strip().split("country ")[1].split(": ")[0]
-                        wlan_interface["DFS"] = line.strip().split("country ")[1].split(": ")[1]
-        
-        
+            phy = self.phys.get(wlan_interface["phy"], {"bands": {}})
+            wlan_interface["Bands"] = len(phy["bands"])
+            wlan_interface["phyinfo"] = phy
+            # Self managed phys have their own regulatory domain
+            domain = self.regulatory.get("phy#" + wlan_interface["physical id"], self.regulatory.get("global"))
+            if domain is not None:
+                wlan_interface["Country"] = domain["country"]
+                wlan_interface["DFS"] = domain["dfs"]
+
+
         self.wirelessinfo = wlaninfo.copy()
-                
+        # Only a complete inventory can be cached, see refreshinventory()
+        self.inventorycomplete = lshw_ok and len(self.wirelessinfo) > 0 and iw_ok
+
         return self.wirelessinfo
+
+    @staticmethod
+    def parsephys(text):
+        """
+            Parse the output of "iw list", the capabilities of all the phys
+            Returns a DICT {phy name: phy}
+                phy = {
+                    "bands": {band name: band},
+                    "maxpower": max TX power (dBm) of all the channels
+                }
+                band = {
+                    "ht": True/False, "vht": True/False, "he": True/False,
+                    "htcapabilities": "0x..", "vhtcapabilities": "0x..",
+                    "channels": [{"channel", "freq", "maxpower",
+                                  "disabled", "noir", "radar"}],
+                    "maxpower": max TX power (dBm) of the band
+                }
+                band name: "bg" (2.4GHz), "a" (5GHz), "6g", "60g"
+        """
+        import re
+
+        phys = {}
+        phy = None
+        band = None
+        for line in text.splitlines():
+            stripped = line.strip()
+            if line.startswith("Wiphy "):
+                phy = {"bands": {}, "maxpower": None}
+                phys[stripped.split()[1]] = phy
+                band = None
+                continue
+            if phy is None:
+                continue
+            depth = len(line) - len(line.lstrip("\t"))
+            if depth == 1:
+                if re.match(r"Band \d+:", stripped):
+                    band = {"ht": False, "vht": False, "he": False, "htcapabilities": "", "vhtcapabilities": "",
+                            "channels": [], "maxpower": None}
+                    phy["bands"][stripped.rstrip(":")] = band
+                else:
+                    band = None
+                continue
+            if band is None:
+                continue
+            if depth == 2 and stripped.startswith("Capabilities: 0x"):
+                band["ht"] = True
+                band["htcapabilities"] = stripped.split()[1]
+            elif stripped.startswith("HT TX/RX MCS"):
+                band["ht"] = True
+            elif stripped.startswith("VHT Capabilities"):
+                band["vht"] = True
+                match = re.search(r"\((0x[0-9a-fA-F]+)\)", stripped)
+                if match:
+                    band["vhtcapabilities"] = match.group(1)
+            elif stripped.startswith("HE Iftypes") or stripped.startswith("HE MAC Capabilities"):
+                band["he"] = True
+            else:
+                match = re.match(r"\* (\d+)(?:\.\d+)? MHz \[(\d+)\](.*)", stripped)
+                if match:
+                    extra = match.group(3)
+                    power = re.search(r"\(([\d.]+) dBm\)", extra)
+                    channel = {
+                        "channel": int(match.group(2)),
+                        "freq": int(match.group(1)),
+                        "maxpower": float(power.group(1)) if power else None,
+                        "disabled": "disabled" in extra,
+                        "noir": "no IR" in extra or "passive scanning" in extra,
+                        "radar": "radar detection" in extra
+                    }
+                    band["channels"].append(channel)
+                    if channel["maxpower"] is not None and not channel["disabled"]:
+                        band["maxpower"] = max(band["maxpower"] or channel["maxpower"], channel["maxpower"])
+                        phy["maxpower"] = max(phy["maxpower"] or channel["maxpower"], channel["maxpower"])
+
+        # Name the bands by their frequencies, "Band N" numbers are internal
+        for phy in phys.values():
+            bands = {}
+            for band in phy["bands"].values():
+                freqs = [channel["freq"] for channel in band["channels"]]
+                if freqs:
+                    bands[Wireless.freqband(freqs[0])] = band
+            phy["bands"] = bands
+        return phys
+
+    @staticmethod
+    def freqband(freq):
+        """
+            Returns the band of the frequency <freq> (MHz): "bg" (2.4GHz),
+            "a" (5GHz), "6g" (6GHz) or "60g"
+        """
+        if freq < 3000:
+            return "bg"
+        if freq < 5925:
+            return "a"
+        if freq < 7200:
+            return "6g"
+        return "60g"
+
+    @staticmethod
+    def parseregulatory(text):
+        """
+            Parse the output of "iw reg get"
+            Returns a DICT {"global" or "phy#N": domain}
+                domain = {
+                    "country": "ES", "dfs": "DFS-ETSI",
+                    "rules": [{"start", "end", "maxbw" (MHz),
+                               "maxeirp" (dBm), "flags": [..]}]
+                }
+        """
+        import re
+
+        regulatory = {}
+        name = "global"
+        domain = None
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped == "global":
+                name = "global"
+            elif stripped.startswith("phy#"):
+                name = stripped.split()[0]
+            elif stripped.startswith("country "):
+                country, _, dfs = stripped[len("country "):].partition(":")
+                domain = {"country": country.strip(), "dfs": dfs.strip(), "rules": []}
+                regulatory[name] = domain
+            elif domain is not None and stripped.startswith("("):
+                match = re.match(r"\(([\d.]+) - ([\d.]+) @ ([\d.]+)\), \(([^,]+), ([^)]+)\)(.*)", stripped)
+                if not match:
+                    continue
+                try:
+                    maxeirp = float(match.group(5).split()[0])
+                except ValueError:
+                    maxeirp = None
+                flags = [flag.strip() for flag in match.group(6).split(",") if flag.strip() and not flag.strip().startswith("(")]
+                domain["rules"].append({
+                    "start": float(match.group(1)),
+                    "end": float(match.group(2)),
+                    "maxbw": float(match.group(3)),
+                    "maxeirp": maxeirp,
+                    "flags": flags
+                })
+        return regulatory
         
             
             
             
-    def getAssociationInfo(self):
+    def inventorykey(self):
+        """
+            Returns the DICT identifying the hardware inventory: the boot id
+            and the network devices. Radios don't change within a boot,
+            unless a device is plugged or unplugged
+        """
+        return {"boot_id": self.sysfs.bootid(), "netdevices": self.sysfs.netdevices()}
+
+    def loadinventory(self):
+        """
+            Returns the hardware inventory (see getSystemWLANInfo()) from
+            inventory_file, or None if there is no cache or it's of another
+            boot or set of network devices
+        """
+        import json
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        key = self.inventorykey()
+        if key["boot_id"] == "":
+            return None
+        try:
+            with open(self.inventory_file) as inventory:
+                cached = json.load(inventory)
+        except (OSError, ValueError):
+            logger.info("No hardware inventory cached in <" + str(self.inventory_file) + ">.")
+            return None
+        if cached.get("key") != key:
+            logger.info("Hardware inventory cached in <" + str(self.inventory_file) + "> is outdated.")
+            return None
+        logger.info("Hardware inventory loaded from <" + str(self.inventory_file) + ">.")
+        self.phys = cached.get("phys", {})
+        self.regulatory = cached.get("regulatory", {})
+        return cached["wirelessinfo"]
+
+    def refreshinventory(self):
+        """
+            Get the hardware inventory from the system (lshw, iw), and cache
+            it in inventory_file, when complete: lshw and "iw list" worked
+            and found at least one wireless interface
+            Returns the inventory, self.wirelessinfo
+        """
+        import json
+        import os
+
+        self.getSystemWLANInfo()
+        if not self.inventorycomplete:
+            self.logger.warning("Hardware inventory incomplete, NOT cached in <" + str(self.inventory_file) + ">.")
+            return self.wirelessinfo
+        key = self.inventorykey()
+        if key["boot_id"] == "":
+            return self.wirelessinfo
+        try:
+            with open(self.inventory_file + ".tmp", "w") as inventory:
+                json.dump({"key": key, "wirelessinfo": self.wirelessinfo, "phys": self.phys,
+                           "regulatory": self.regulatory}, inventory, indent=2)
+            os.replace(self.inventory_file + ".tmp", self.inventory_file)
+        except OSError as error:
+            self.logger.warning("Could NOT cache the hardware inventory in <" + str(self.inventory_file) + ">: " + str(error))
+        return self.wirelessinfo
+
+    def invalidateinventory(self):
+        """
+            Remove the cached hardware inventory, next Wireless() will get it
+            from the system. Use refreshinventory() to get it now
+        """
+        import os
+
+        try:
+            os.remove(self.inventory_file)
+        except FileNotFoundError:
+            pass
+
+    def getAssociationInfo(self, ifname=""):
         """
             Return information about the association status
+            If <ifname> is indicated, only that interface is updated
+            The fields in association_sources set to "sysfs" are read from
+            sysfs/procfs, only the commands needed for the rest are run
         """     
         # Attach to LOCAL SYSLOG
         logger = self.logger
                 
+        needed = self.associationneeded()
         # Let's get current association status
         for wlan_interface in self.wirelessinfo:
             
-            command_shell = ["sudo", "/sbin/iw", "dev", wlan_interface["logical name"], "link"]
-            status,p1,errors = self.os.runoscommand(command_shell)
-        
-            p2 = p1.stdout.decode("utf-8").strip()
+            if ifname != "" and wlan_interface["logical name"] != ifname:
+                continue
+            
+            commands = self.associationcommands(wlan_interface["logical name"])
+            native = self.nativeassociation(wlan_interface["logical name"])
+            outputs = {}
             
-            if p2.startswith("Not"):
-                # Not connected to WLAN
-                wlan_interface["connected"] = False
+            if self.association_sources["connected"] == "sysfs" and not native["sysfs"]["connected"]:
+                # Interface down, no need to ask iw
+                outputs["link"] = "Not connected."
             else:
-                # Connected to WLAN
-                wlan_interface["connected"] = True
-                wlan_interface["connection"] = {}
-                
-                for line in p2.splitlines():
-                    if line.lstrip('\t').startswith("Connected"):
-                        wlan_interface["connection"]["bssid"] = line.split()[2]
-                    elif line.lstrip('\t').startswith("SSID"):
-                        wlan_interface["connection"]["SSID"] = line.split()[1]
-                    elif line.lstrip('\t').startswith("signal"):
-                        wlan_interface["connection"]["signal"] = line.split()[1]
-                    elif line.lstrip('\t').startswith("tx"):
-                        wlan_interface["connection"]["tx_bitrate"] = line.split()[2]
-                        try:
-                            wlan_interface["connection"]["MCS"] = line.split()[5]
-                        except:
-                            wlan_interface["connection"]["MCS"] = "undefined"
-                    elif line.lstrip('\t').startswith("dtim"):
-                        wlan_interface["connection"]["dtim"] = line.split()[2]
-                    elif line.lstrip('\t').startswith("beacon"):
-                        wlan_interface["connection"]["beacon"] = line.split()[2]
-                
-                command_shell = ["sudo", "/sbin/iw", "dev", wlan_interface["logical name"], "info"]
-                status,p1,errors = self.os.runoscommand(command_shell)
-        
-                p2 = p1.stdout.decode("utf-8").strip()
-                
-                for line in p2.splitlines():
-                    if line.strip().startswith("channel"):
-                        wlan_interface["connection"]["channel"] = line.split()[1].strip()
-                        wlan_interface["connection"]["width"] = line.split()[5].strip()
-                        wlan_interface["connection"]["Freq"] = line.split()[2].strip("(")
-                        wlan_interface["connection"]["CenterFreq"] = line.split()[8].strip()
-                        if wlan_interface["connection"]["Freq"].startswith("2"):
-                            wlan_interface["connection"]["Band"] = "2G"
-                        elif wlan_interface["connection"]["Freq"].startswith("5"):
-                            wlan_interface["connection"]["Band"] = "5G"
-                    elif line.lstrip('\t').startswith("txpower"):
-                        wlan_interface["connection"]["txpower"] = line.split()[1].strip()
+                status,p1,errors = self.os.runoscommand(commands["link"], self.timeouts["iw"])
+                outputs["link"] = p1.stdout.decode("utf-8").strip()
+            
+            if not outputs["link"].startswith("Not"):
+                # Connected to WLAN, let's get the rest of information
+                for command in ["info", "address", "route"]:
+                    if command in needed:
+                        status,p1,errors = self.os.runoscommand(commands[command], self.timeouts["iw"])
+                        outputs[command] = p1.stdout.decode("utf-8").strip()
             
+            self.parseassociation(wlan_interface, outputs)
+            self.applynative(wlan_interface, native)
+
+        return self.wirelessinfo
+
+    async def agetAssociationInfo(self, ifname=""):
+        """
+            asyncio version of getAssociationInfo(), all the commands of all
+            the interfaces run at the same time
+        """
+        import asyncio
+
+        needed = self.associationneeded()
+
+        async def getinterface(wlan_interface):
+            commands = self.associationcommands(wlan_interface["logical name"])
+            native = self.nativeassociation(wlan_interface["logical name"])
+            names = [name for name in commands if name in needed]
+            results = await asyncio.gather(*[self.os.arun(commands[name], self.timeouts["iw"]) for name in names])
+            outputs = {}
+            for name, (status, p1, errors) in zip(names, results):
+                outputs[name] = p1.stdout.decode("utf-8").strip()
+            self.parseassociation(wlan_interface, outputs)
+            self.applynative(wlan_interface, native)
+
+        await asyncio.gather(*[getinterface(wlan_interface) for wlan_interface in self.wirelessinfo
+                               if ifname == "" or wlan_interface["logical name"] == ifname])
+        return self.wirelessinfo
+
+    @staticmethod
+    def associationcommands(ifname):
+        """
+            Returns a DICT with the command LISTs used to get the association
+            information of interface <ifname>
+        """
+        return {
+            "link": ["sudo", "/sbin/iw", "dev", ifname, "link"],
+            "info": ["sudo", "/sbin/iw", "dev", ifname, "info"],
+            "address": ["ip", "a", "show", ifname],
+            "route": ["ip", "route", "list", "dev", ifname]
+        }
+
+    def associationneeded(self):
+        """
+            Returns the set of names of the commands in associationcommands()
+            needed for the fields whose source is "iw" in association_sources
+            "link" and "info" are always needed, the 802.11 information is
+            only available with iw
+        """
+        needed = {"link", "info"}
+        for field, source in self.association_sources.items():
+            if source == "iw":
+                needed.add(self.association_commandfields[field])
+        return needed
+
+    def nativeassociation(self, ifname):
+        """
+            Returns a DICT {source: fields} with the association fields of
+            <ifname> read without commands: "sysfs" (see Sysfs.association())
+            always, "netlink" (see Rtnetlink.association()) when used in
+            association_sources
+            The IPv4 address and mask of "sysfs" are the ones of "netlink"
+        """
+        native = {"sysfs": self.sysfs.association(ifname), "netlink": {}}
+        ipv4 = ("ipaddress", "mask")
+        if "netlink" in self.association_sources.values() or any(self.association_sources[field] == "sysfs" for field in ipv4):
+            try:
+                native["netlink"] = self.netlink.association(ifname)
+            except OSError as error:
+                self.logger.warning("Could NOT read the addresses of <" + ifname + "> with netlink: " + str(error))
+        for field in ipv4:
+            if field in native["netlink"]:
+                native["sysfs"][field] = native["netlink"][field]
+        return native
+
+    def applynative(self, wlan_interface, native):
+        """
+            Updates <wlan_interface>, already parsed by parseassociation(),
+            with the fields in <native> (see nativeassociation()) whose
+            source is "sysfs" or "netlink"
+        """
+        if not wlan_interface.get("connected", False):
+            return
+        for field, source in self.association_sources.items():
+            if source not in native or field == "connected":
+                continue
+            if field in native[source]:
+                wlan_interface["connection"][field] = native[source][field]
+            else:
+                wlan_interface["connection"].pop(field, None)
+
+    def waitaddress(self, ifname, timeout):
+        """
+            Wait up to <timeout> seconds until <ifname> gets an IPv4 address
+            (DHCP done), notified by the kernel through netlink
+            Returns the address, or "" if <timeout> expired
+        """
+        try:
+            return self.netlink.waitaddress(ifname, timeout)
+        except (OSError, Rtnetlinkerror) as error:
+            self.logger.warning("Could NOT wait for the address of <" + ifname + "> with netlink: " + str(error))
+            return ""
+
+    @staticmethod
+    def parseassociation(wlan_interface, outputs):
+        """
+            Updates <wlan_interface> with the association information parsed
+            from <outputs>, a DICT with the text output of the commands in
+            associationcommands()
+        """
+        p2 = outputs["link"]
         
-                command_shell = ["ip", "a", "show", wlan_interface["logical name"]]
-                status,p1,errors = self.os.runoscommand(command_shell)
+        if p2.startswith("Not"):
+            # Not connected to WLAN
+            wlan_interface["connected"] = False
+            return
         
-                p2 = p1.stdout.decode("utf-8").strip()
-                
-                for line in p2.splitlines():
-                    if line.strip().startswith("inet "):
-                        wlan_interface["connection"]["ipaddress"] = line.split()[1].split("/")[0]
-                        wlan_interface["connection"]["mask"] = line.split()[1].split("/")[1]
-                    elif line.strip().startswith("inet6 "):
-                        wlan_interface["connection"]["ipv6"] = line.split()[1].split("/")[0]
-                        wlan_interface["connection"]["mask6"] = line.split()[1].split("/")[1]
-                
-                command_shell = ["ip", "route", "list"]
-                status,p1,errors = self.os.runoscommand(command_shell)
+        # Connected to WLAN
+        wlan_interface["connected"] = True
+        wlan_interface["connection"] = {}
         
-                p2 = p1.stdout.decode("utf-8").strip()
-                
-                for line in p2.splitlines():
-                    if line.strip().startswith("default "):
-                        wlan_interface["connection"]["gateway"] = line.split()[2]
-
-        return self.wirelessinfo
+        for line in p2.splitlines():
+            if line.lstrip('\t').startswith("Connected"):
+                wlan_interface["connection"]["bssid"] = line.split()[2]
+            elif line.lstrip('\t').startswith("SSID"):
+                wlan_interface["connection"]["SSID"] = line.split()[1]
+            elif line.lstrip('\t').startswith("signal"):
+                wlan_interface["connection"]["signal"] = line.split()[1]
+            elif line.lstrip('\t').startswith("tx"):
+                wlan_interface["connection"]["tx_bitrate"] = line.split()[2]
+                try:
+                    wlan_interface["connection"]["MCS"] = line.split()[5]
+                except:
+                    wlan_interface["connection"]["MCS"] = "undefined"
+            elif line.lstrip('\t').startswith("dtim"):
+                wlan_interface["connection"]["dtim"] = line.split()[2]
+            elif line.lstrip('\t').startswith("beacon"):
+                wlan_interface["connection"]["beacon"] = line.split()[2]
         
+        for line in outputs.get("info", "").splitlines():
+            if line.strip().startswith("channel"):
+                wlan_interface["connection"]["channel"] = line.split()[1].strip()
+                wlan_interface["connection"]["width"] = line.split()[5].strip()
+                wlan_interface["connection"]["Freq"] = line.split()[2].strip("(")
+                wlan_interface["connection"]["CenterFreq"] = line.split()[8].strip()
+                if wlan_interface["connection"]["Freq"].startswith("2"):
+                    wlan_interface["connection"]["Band"] = "2G"
+                elif wlan_interface["connection"]["Freq"].startswith("5"):
+                    wlan_interface["connection"]["Band"] = "5G"
+            elif line.lstrip('\t').startswith("txpower"):
+                wlan_interface["connection"]["txpower"] = line.split()[1].strip()
+        
+        for line in outputs.get("address", "").splitlines():
+            if line.strip().startswith("inet "):
+                wlan_interface["connection"]["ipaddress"] = line.split()[1].split("/")[0]
+                wlan_interface["connection"]["mask"] = line.split()[1].split("/")[1]
+            elif line.strip().startswith("inet6 "):
+                wlan_interface["connection"]["ipv6"] = line.split()[1].split("/")[0]
+                wlan_interface["connection"]["mask6"] = line.split()[1].split("/")[1]
+        
+        for line in outputs.get("route", "").splitlines():
+            if line.strip().startswith("default "):
+                wlan_interface["connection"]["gateway"] = line.split()[2]
 
-
-    def checkSSIDnmcli(self, wlaninfo):
+    def checkSSIDnmcli(self, wlaninfo, ifname=""):
         """
             Check if all values from <wlaninfo> are setup in nmcli configured connections
             -> ssid
@@ -246,6 +666,7 @@ class Wireless:
             -> auth_method
             -> eap
             -> phase2-auth
+            -> interface, only if <ifname> is indicated
             
             return [status, True/False, message, [error number], [error message] ]
             
@@ -258,6 +679,7 @@ class Wireless:
                  6  -> SSID present, phase2-auth wrong
                  7  -> OPEN auth_method, connect from scratch
                  8  -> SSID not found
+                 9  -> SSID present, bound to a different interface
                  20 -> error calling operating system
         """
         
@@ -265,20 +687,18 @@ class Wireless:
         logger = self.logger
         
         logger.info("Searching " + wlaninfo["ssid"] + " in the list of nmcli connections...")
-        command_shell = ["nmcli", "connection", "show", wlaninfo["ssid"]]
-        status,p1,errors = self.os.runoscommand(command_shell)
+        status, profile = self.nmcli.profile(wlaninfo["ssid"])
         
-        if status == 20:
-            return [20, False, errors[0], errors[1], errors[2]]
+        if status == 2:
+            return [20, False, "Problem calling nmcli, could NOT read the nmcli connections."]
         
-        if p1.returncode:
+        if status == 3:
             # ssid is not listed in the nmcli configured connections
             logger.info("SSID <" + wlaninfo["ssid"] + "> NOT found in the list of nmcli connections.")
             return [8, False, "SSID <" + wlaninfo["ssid"] + "> NOT found in the list of nmcli connections."]
         
         logger.info("SSID <" + wlaninfo["ssid"] + "> found in the list of nmcli connections.")
         # ssid is IN the list, let's check other parameters
-        p2 = p1.stdout.decode("utf-8").strip()
         
         # if auth_method is "open", return with error, forcing to connect from scratch
         if wlaninfo["auth_method"] == "open":
@@ -286,9 +706,9 @@ class Wireless:
         
         # Let's adapt some formats and variables
         band = wlaninfo["band"]
-        if wlaninfo["band"] == "auto": band = "--"
-        bssid = wlaninfo["bssid"]
-        if wlaninfo["bssid"] == "auto": bssid = "--"
+        if wlaninfo["band"] == "auto": band = ""
+        bssid = wlaninfo["bssid"].upper()
+        if wlaninfo["bssid"] == "auto": bssid = ""
         
         test = {
             "band":False,
@@ -299,38 +719,15 @@ class Wireless:
         }
 
         extract = {
-            "band":"",
-            "bssid":"",
-            "auth_method":"",
-            "eap":"",
-            "phase2-auth":"",
-            "phase2-autheap":""
+            "band":profile.band,
+            "bssid":profile.bssid.upper(),
+            "auth_method":profile.key_mgmt,
+            "eap":profile.eap,
+            "phase2-auth":profile.phase2_auth,
+            "phase2-autheap":profile.phase2_autheap,
+            "interface":profile.interface
         }
         
-        for line in p2.splitlines():
-            
-            if line.startswith("802-11-wireless.band"):
-                extract["band"] = line.split(":")[1].strip()
-                continue
-            if line.startswith("802-11-wireless.bssid"):
-                extract["bssid"] = line.split(":")[1].strip()
-                continue
-            if line.startswith("802-11-wireless-security.key-mgmt"):
-                extract["auth_method"] = line.split(":")[1].strip()
-                continue
-            if line.startswith("802-1x.eap"):
-                extract["eap"] = line.split(":")[1].strip()
-                continue
-            if line.startswith("802-1x.eap"):
-                extract["eap"] = line.split(":")[1].strip()
-                continue
-            if line.startswith("802-1x.phase2-autheap"):
-                extract["phase2-autheap"] = line.split(":")[1].strip()
-                continue
-            if line.startswith("802-1x.phase2-auth"):
-                extract["phase2-auth"] = line.split(":")[1].strip()
-                continue
-        
         # check band
         if extract["band"] == band:
             # band is OK
@@ -415,6 +812,11 @@ class Wireless:
             "phase2-auth":True    
         }
 
+        # check interface, the profile must be bound to the assigned one
+        if ifname != "" and extract["interface"] != ifname:
+            logger.info("Configured interface <" + extract["interface"] + "> in nmcli connection is WRONG, must be <" + ifname + ">.")
+            return [9, False, "Interface is wrong"]
+
         if test == test_ok:
             # PERFECT, connection in nmcli is ok.
             logger.info("The nmcli connection is OK, all connection options are set up according to the requierement !!!")
@@ -432,9 +834,16 @@ class Wireless:
 
 
 
-    def addConnectionnmcli(self, wlaninfo):
+    def addConnectionnmcli(self, wlaninfo, ifname=""):
         """
             Let's configure or modify a connection in nmcli
+            If <ifname> is indicated, the connection is bound to that
+            wireless interface, otherwise the interface is chosen using
+            the band in wlaninfo
+            A connection written before by the sensor, with the same
+            auth_method, is changed with "nmcli connection modify",
+            otherwise it's deleted and added from scratch. The fingerprint
+            of the connection is stored, see checkprofile()
 
             wlaninfo = {
                 "ssid":"Temp",
@@ -473,146 +882,49 @@ class Wireless:
                     20 -> error calling operating system
             
         """
-        import ipaddress
-        
         # Attach to LOCAL SYSLOG
         logger = self.logger
         
         logger.info("Adding or modifying a connection in nmcli...")
         
-        # Let's delete the connection, just in case
-        command_shell = ["nmcli", "connection", "delete", wlaninfo["ssid"]]
-        status,output,errors = self.os.runoscommand(command_shell)
-        
-        if status == 20:
-            # OS error calling nmcli
-            logger.info("Error deleting existing connection in nmcli...")
-
-        
-        # Let's add the connection with the options in wlaninfo
-        command_shell = ["nmcli","connection","add"]
-        command_shell += ["type","wifi"]
-        command_shell += ["con-name",wlaninfo["ssid"]]
-        
         # what interface to use, in case several interfaces
-        if len(self.wirelessinfo) > 1:
-            # Have several WLAN interfaces in the sensor
-            logger.info("Several WLAN interfaces, choosing the right one...")
-            if wlaninfo["band"] == "a":
-                # 5GHz band, have to select a 5GHz capable interface
-                logger.info("Interface must support 5GHz band... searching...")
-                interface_ok = False
-                for wlaninterface in self.wirelessinfo:
-                    if wlaninterface["Bands"] == 2:
-                        # This interface is 5GHz capable
-                        logger.info("Found interface capable of 5GHz: <" + str(wlaninterface["logical name"]) + ">.")
-                        command_shell += ["ifname",wlaninterface["logical name"]]
-                        interface_ok = True
-                        break
-                if not interface_ok:
-                    # It's not possible to run the TEST in 5GHz...
-                    # none of the available interfaces can support 5GHz
-                    # Let's use the first one available
-                    logger.info("None of the available WLAN interfaces support 5GHz, connection will default to <auto>")
-                    logger.info("Interface to use <" + str(self.wirelessinfo[0]["logical name"]) + ">.")
-                    command_shell += ["ifname",self.wirelessinfo[0]["logical name"]]
-                        
-            else: # wlaninfo["band"] == "auto" or "bg"
-                # Choose any (the first for instance) as Band doesn't matter
-                logger.info("Band is auto or bg, interface capabilities are not important, choosing the first available WLAN interface.")
-                logger.info("Interface to use <" + str(self.wirelessinfo[0]["logical name"]) + ">.")
-                command_shell += ["ifname",self.wirelessinfo[0]["logical name"]]
-                
-        else:
-            # Just one WLAN interface
-            logger.info("Only one interface in the SENSOR, using it.")
-            logger.info("Interface to use <" + str(self.wirelessinfo[0]["logical name"]) + ">.")
-            command_shell += ["ifname",self.wirelessinfo[0]["logical name"]]
-        
-        # SSID
-        command_shell += ["ssid",wlaninfo["ssid"]]
-        
-        # BAND
-        if wlaninfo["band"] == "auto":
-            logger.info("Setting BAND to auto...")
-            # No need to add a band, let the OS and AP negotiate
-        else: # Assign the band
-            logger.info("Setting BAND to <" + str(wlaninfo["band"]) + ">...")
-            command_shell += ["802-11-wireless.band", wlaninfo["band"]]
-
-        # BSSID or Virtul-AP or VAP
-        if wlaninfo["bssid"] == "auto":
-            logger.info("Setting BSSID to auto...")
-            # No need to add a BSSID, OS and AP will negotiate
-        else: # Assign the bssid
-            logger.info("Setting BSSID to <" + str(wlaninfo["bssid"]) + ">...")
-            command_shell += ["802-11-wireless.bssid", wlaninfo["bssid"]]
+        ifname = self.profileinterface(wlaninfo, ifname)
+        properties = self.profileproperties(wlaninfo)
+        fingerprint = self.profilefingerprint(wlaninfo, ifname)
         
-        # Authentication
-        if wlaninfo["auth_method"] == "open":
-            logger.info("Setting authentication to OPEN...")
-            # No need to add anything else
-        elif wlaninfo["auth_method"] == "wpa-psk":
-            # Pre-Shared Key with AES
-            logger.info("Setting authentication to PreShared Key and AES (WPA2-PSK)...")
-            command_shell += ["802-11-wireless-security.key-mgmt", wlaninfo["auth_method"]]
-            command_shell += ["802-11-wireless-security.psk", wlaninfo["psk"]]
+        stored = self.profiles.get(wlaninfo["ssid"])
+        if stored is not None and stored["auth_method"] == wlaninfo["auth_method"] and wlaninfo["ssid"] in self.nmcliprofiles():
+            # Same kind of profile already in nmcli, modify it in place
+            logger.info("Modifying existing connection <" + str(wlaninfo["ssid"]) + "> in nmcli...")
+            command_shell = ["nmcli","connection","modify",wlaninfo["ssid"]]
+            command_shell += ["connection.interface-name",ifname]
+            command_shell += ["802-11-wireless.ssid",wlaninfo["ssid"]]
+            for name, value in properties:
+                command_shell += [name, value]
         else:
-            # 802.1X Authentication - wpa-eap
-            logger.info("Setting authentication to 802.1X...")
-            command_shell += ["802-11-wireless-security.key-mgmt", wlaninfo["auth_method"]]
-            if wlaninfo["eap"] == "peap":
-                # EAP is PEAP
-                logger.info("Setting EAP method to <" + str(wlaninfo["eap"]) + ">...")
-                command_shell += ["802-1x.eap", wlaninfo["eap"]]
-                logger.info("Setting USERNAME and PASSWORD for PEAP...")
-                command_shell += ["802-1x.identity", wlaninfo["username"]]
-                command_shell += ["802-1x.password", wlaninfo["password"]]
-                logger.info("Setting Phase2 to <" + str(wlaninfo["phase2-auth"]) + ">...")
-                command_shell += ["802-1x.phase2-auth", wlaninfo["phase2-auth"]]
-            else:
-                # EAP is TTLS
-                logger.info("Setting EAP method to <" + str(wlaninfo["eap"]) + ">...")
-                command_shell += ["802-1x.eap", wlaninfo["eap"]]
-                logger.info("Setting USERNAME and PASSWORD for PEAP...")
-                command_shell += ["802-1x.identity", wlaninfo["username"]]
-                command_shell += ["802-1x.password", wlaninfo["password"]]
-                logger.info("Setting Phase2 to <" + str(wlaninfo["phase2-auth"]) + ">...")
-                command_shell += ["802-1x.phase2-autheap", wlaninfo["phase2-auth"]]
+            # Let's delete the connection, just in case
+            command_shell = ["nmcli", "connection", "delete", wlaninfo["ssid"]]
+            status,output,errors = self.os.runoscommand(command_shell, self.timeouts["nmcli"])
             
-        # IPv4 Configuration
-        if wlaninfo["ipconfig"] == "dhcp":
-            # auto configuration
-            logger.info("Setting IPv4 configuration to <" + str(wlaninfo["ipconfig"]) + ">...")
-            command_shell += ["ipv4.method", "auto"]
-        else:
-            # manual configuration
-            logger.info("Setting IPv4 configuration to <" + str(wlaninfo["ipconfig"]) + ">...")
-            command_shell += ["ipv4.method", "manual"]
-            # IPv4 address
-            ip_interface = ipaddress.IPv4Interface(wlaninfo["ipaddress"] + "/" + wlaninfo["netmask"])
-            logger.info("Setting IPv4 address to <" + str(ip_interface) + ">...")
-            command_shell += ["ipv4.addresses", str(ip_interface)]
-            # IPv4 gateway
-            gateway = ipaddress.IPv4Address(wlaninfo["gateway"])
-            logger.info("Setting IPv4 Gateway to <" + str(wlaninfo["gateway"]) + ">...")
-            if not gateway in ip_interface.network:
-                logger.warning("Gateway IPv4 address is not in the network range... Setting gateway in any case.")
-            command_shell += ["ipv4.gateway", str(gateway)]
-            # IPv4 DNS
-            if wlaninfo["dns2"] == "":
-                # Only one DNS server
-                dns = wlaninfo["dns1"]
-            else:
-                # Two DNS servers
-                dns = wlaninfo["dns1"] + "," + wlaninfo["dns2"]
-            logger.info("Setting IPv4 DNS to <" + str(dns) + ">...")
-            command_shell += ["ipv4.dns", dns]
+            if status == 20:
+                # OS error calling nmcli
+                logger.info("Error deleting existing connection in nmcli...")
+            
+            # Let's add the connection with the options in wlaninfo
+            command_shell = ["nmcli","connection","add"]
+            command_shell += ["type","wifi"]
+            command_shell += ["con-name",wlaninfo["ssid"]]
+            command_shell += ["ifname",ifname]
+            command_shell += ["ssid",wlaninfo["ssid"]]
+            for name, value in properties:
+                # Empty values are defaults in a new connection
+                if value != "":
+                    command_shell += [name, value]
         
-        # Command to call nmcli is complete
-        logger.info("nmcli command before calling runOSCommand <" + str(command_shell) + ">.")
+        # Command to call nmcli is complete, don't log it, it has the secrets
         logger.info("Calling Operating System to add connection to nmcli connections list...")
-        status,output,errors = self.os.runoscommand(command_shell)
+        status,output,errors = self.os.runoscommand(command_shell, self.timeouts["nmcli"])
+        self.nmcli.invalidate()
         
         if status > 1:
             # Something went wrong calling the Operating System
@@ -627,92 +939,450 @@ class Wireless:
             if output.returncode == 0:
                 # New connection successfully added to the list of nmcli connections
                 logger.info("SUCCESS - connection <" + str(wlaninfo["ssid"]) + "> added to the list of nmcli connections.")
+                self.storeprofile(wlaninfo, fingerprint)
                 return [1, output, errors]
             else:
                 # Some problem with the call to nmcli
-                logger.info("<" + str(wlaninfo["ssid"]) + "> added to the list of nmcli connections.")
+                logger.info("<" + str(wlaninfo["ssid"]) + "> could NOT be added to the list of nmcli connections.")
                 logger.info(str(output))
+                with self.profilelock:
+                    self.profiles.pop(wlaninfo["ssid"], None)
                 return [2, output, errors]
 
+    def profileinterface(self, wlaninfo, ifname=""):
+        """
+            Returns the interface the nmcli connection of <wlaninfo> is bound to:
+            <ifname> if indicated, otherwise chosen using the band in wlaninfo
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        if ifname != "":
+            # Interface already assigned by the caller
+            logger.info("Interface to use <" + str(ifname) + ">, assigned by caller.")
+            return ifname
+        if len(self.wirelessinfo) > 1 and wlaninfo["band"] == "a":
+            # Have several WLAN interfaces in the sensor
+            # 5GHz band, have to select a 5GHz capable interface
+            logger.info("Several WLAN interfaces, interface must support 5GHz band... searching...")
+            for wlaninterface in self.wirelessinfo:
+                if self.supportsband(wlaninterface, "a"):
+                    # This interface is 5GHz capable
+                    logger.info("Found interface capable of 5GHz: <" + str(wlaninterface["logical name"]) + ">.")
+                    return wlaninterface["logical name"]
+            # It's not possible to run the TEST in 5GHz...
+            # none of the available interfaces can support 5GHz
+            # Let's use the first one available
+            logger.info("None of the available WLAN interfaces support 5GHz, connection will default to <auto>")
+        # Band is auto or bg, or just one interface: choose the first one
+        logger.info("Interface to use <" + str(self.wirelessinfo[0]["logical name"]) + ">.")
+        return self.wirelessinfo[0]["logical name"]
+
+    @staticmethod
+    def profileproperties(wlaninfo):
+        """
+            Returns the LIST of [nmcli property, value] of the connection
+            for <wlaninfo>, apart from the interface and the ssid.
+            Values not used by this configuration are "", so an existing
+            connection can be modified without leftovers
+        """
+        import ipaddress
 
+        properties = []
+        # BAND, "" lets the OS and AP negotiate
+        properties.append(["802-11-wireless.band", "" if wlaninfo["band"] == "auto" else wlaninfo["band"]])
+        # BSSID or Virtul-AP or VAP, "" lets the OS and AP negotiate
+        properties.append(["802-11-wireless.bssid", "" if wlaninfo["bssid"] == "auto" else wlaninfo["bssid"]])
+
+        # Authentication
+        if wlaninfo["auth_method"] == "wpa-psk":
+            # Pre-Shared Key with AES
+            properties.append(["802-11-wireless-security.key-mgmt", wlaninfo["auth_method"]])
+            properties.append(["802-11-wireless-security.psk", wlaninfo["psk"]])
+        elif wlaninfo["auth_method"] != "open":
+            # 802.1X Authentication - wpa-eap, PEAP or TTLS
+            properties.append(["802-11-wireless-security.key-mgmt", wlaninfo["auth_method"]])
+            properties.append(["802-1x.eap", wlaninfo["eap"]])
+            properties.append(["802-1x.identity", wlaninfo["username"]])
+            properties.append(["802-1x.password", wlaninfo["password"]])
+            # Phase2 is stored in phase2-auth for PEAP, phase2-autheap for TTLS
+            if wlaninfo["eap"] == "peap":
+                properties.append(["802-1x.phase2-auth", wlaninfo["phase2-auth"]])
+                properties.append(["802-1x.phase2-autheap", ""])
+            else:
+                properties.append(["802-1x.phase2-auth", ""])
+                properties.append(["802-1x.phase2-autheap", wlaninfo["phase2-auth"]])
 
-    def checkSSIDair(self, wlaninfo, force_scan=False):
+        # IPv4 Configuration
+        if wlaninfo["ipconfig"] == "dhcp":
+            # auto configuration
+            properties.append(["ipv4.method", "auto"])
+            properties.append(["ipv4.addresses", ""])
+            properties.append(["ipv4.gateway", ""])
+            properties.append(["ipv4.dns", ""])
+        else:
+            # manual configuration
+            ip_interface = ipaddress.IPv4Interface(wlaninfo["ipaddress"] + "/" + wlaninfo["netmask"])
+            gateway = ipaddress.IPv4Address(wlaninfo["gateway"])
+            # Two DNS servers, or only one
+            dns = wlaninfo["dns1"]
+            if wlaninfo["dns2"] != "":
+                dns = wlaninfo["dns1"] + "," + wlaninfo["dns2"]
+            properties.append(["ipv4.method", "manual"])
+            properties.append(["ipv4.addresses", str(ip_interface)])
+            properties.append(["ipv4.gateway", str(gateway)])
+            properties.append(["ipv4.dns", dns])
+        return properties
+
+    def profilefingerprint(self, wlaninfo, ifname):
+        """
+            Returns the fingerprint (sha256) of the nmcli connection for
+            <wlaninfo> bound to <ifname>: what would be written to nmcli
+        """
+        import hashlib
+        import json
+
+        profile = [wlaninfo["ssid"], ifname, self.profileproperties(wlaninfo)]
+        return hashlib.sha256(json.dumps(profile).encode("utf-8")).hexdigest()
+
+    def checkprofile(self, wlaninfo, ifname=""):
+        """
+            Check if the nmcli connection of <wlaninfo> is up to date, using
+            the fingerprint stored when it was written, so no nmcli
+            connection needs to be parsed.
+            Connections without fingerprint (written before, or by hand)
+            are checked once with checkSSIDnmcli() and adopted if right.
+            Returns True if the connection can be used as it is
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        ifname = self.profileinterface(wlaninfo, ifname)
+        fingerprint = self.profilefingerprint(wlaninfo, ifname)
+        stored = self.profiles.get(wlaninfo["ssid"])
+        if stored is not None:
+            if stored["fingerprint"] != fingerprint:
+                logger.info("Configuration of <" + str(wlaninfo["ssid"]) + "> changed, nmcli connection must be updated.")
+                return False
+            if wlaninfo["ssid"] not in self.nmcliprofiles():
+                logger.info("nmcli connection <" + str(wlaninfo["ssid"]) + "> is gone, must be added again.")
+                return False
+            logger.info("nmcli connection <" + str(wlaninfo["ssid"]) + "> is up to date (fingerprint).")
+            return True
+        if self.checkSSIDnmcli(wlaninfo, ifname)[0] == 1:
+            self.storeprofile(wlaninfo, fingerprint)
+            return True
+        return False
+
+    def nmcliprofiles(self):
+        """
+            Returns the set of names of the nmcli connections
+        """
+        status, connections = self.nmcli.connections()
+        return set(connections)
+
+    def loadprofiles(self):
+        """
+            Returns the DICT {ssid: {"fingerprint", "auth_method"}} of the
+            nmcli connections written by the sensor, from profiles_file
+        """
+        import json
+
+        try:
+            with open(self.profiles_file) as profiles:
+                return json.load(profiles)
+        except (OSError, ValueError):
+            self.logger.info("No fingerprints of nmcli connections in <" + str(self.profiles_file) + ">.")
+            return {}
+
+    def storeprofile(self, wlaninfo, fingerprint):
+        """
+            Store the fingerprint of the nmcli connection of <wlaninfo>, in
+            memory and in profiles_file
+            The fingerprints hash the secrets, so the file is only readable
+            by its owner (0600)
+        """
+        import json
+        import os
+
+        with self.profilelock:
+            self.profiles[wlaninfo["ssid"]] = {"fingerprint": fingerprint, "auth_method": wlaninfo["auth_method"]}
+            try:
+                fd = os.open(self.profiles_file + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as profiles:
+                    # In case the temporary file was left with other permissions
+                    os.fchmod(profiles.fileno(), 0o600)
+                    json.dump(self.profiles, profiles, indent=2)
+                os.replace(self.profiles_file + ".tmp", self.profiles_file)
+            except OSError as error:
+                self.logger.warning("Could NOT store the fingerprints of nmcli connections in <" + str(self.profiles_file) + ">: " + str(error))
+
+
+
+    def checkSSIDair(self, wlaninfo, force_scan=False, timeout=None):
         """
             Check if the ssid in wlaninfo is present in the "air"
-            Will use default information from kernel, from last scans
-            If force_scan=True, try to rescan
-            
-            nmcli device wifi rescan
-            nmcli -f signal,ssid,bssid,chan,in-use device wifi
-            
+            Will use the scan table (see scan()), so all the WLANs checked
+            in a cycle share the same scan
+            If force_scan=True, try to rescan, rescans are rate limited,
+            within <timeout> seconds if indicated (see scan())
+            The ssid must match exactly, and the bssid and band too when
+            they are not "auto"
+
+            return [status, message]
+                status:
+                    1 -> SSID visible
+                    2 -> Problem calling the Operating System
+                    3 -> SSID not visible
         """
-        import subprocess
-        import sys
-        
         # Attach to LOCAL SYSLOG
         logger = self.logger
-        
-        # Depending on force_scan will force rescan
-        if force_scan:
-            # Force to scan
-            command_shell = ["nmcli","device","wifi","rescan"]
-            status,output,errors = self.os.runoscommand(command_shell)
-#            if status > 1:
-#                # Problem with the Operating System
-#                # using information stored in the kernel from last scans
-#            else:
-#                # Call OK to Operating System
-#                if output.returncode == 1:
-#                    # Too frequent scans
-
-        # Calling scan results
-        command_shell = ["nmcli","-f","ssid,bssid,signal,chan,in-use","device","wifi"]
-        status,output,errors = self.os.runoscommand(command_shell)
+
+        status, entries = self.scan(force_scan, timeout)
         if status > 1:
             #Problem calling the Operating System
             return [2,"Problem scanning, could NOT receive information from active SSIDs..."]
-        else:
-            p2 = output.stdout.decode("utf-8").strip()
-            if wlaninfo["ssid"] in p2:
-                return [1, "SSID <"+wlaninfo["ssid"]+"> is in the list of visible SSIDs."]
 
-        
-    def checkcurrentwlan(self, wlaninfo):
+        for entry in self.scanbyssid.get(wlaninfo["ssid"], []):
+            if wlaninfo.get("bssid", "auto") != "auto" and entry["bssid"] != wlaninfo["bssid"].upper():
+                continue
+            if wlaninfo.get("band", "auto") != "auto" and entry["band"] != wlaninfo["band"]:
+                continue
+            logger.info("SSID <" + wlaninfo["ssid"] + "> seen with BSSID <" + entry["bssid"] + ">, signal <" + str(entry["signal"]) + ">.")
+            return [1, "SSID <"+wlaninfo["ssid"]+"> is in the list of visible SSIDs."]
+        return [3, "SSID <"+wlaninfo["ssid"]+"> is NOT in the list of visible SSIDs."]
+
+    def scan(self, force_scan=False, timeout=None):
+        """
+            Refresh the scan table, when older than scan_maxage, from
+            "nmcli -t -e yes -f ... device wifi list"
+            If force_scan=True, first ask for a rescan, unless the last one
+            was less than rescan_interval seconds ago: scans are slow and
+            disrupt the traffic of the interfaces. The rescan, and the wait
+            for its results, take <timeout> seconds at most if indicated
+            The table is:
+                self.scanentries: LIST of entries
+                self.scanbyssid:  DICT {ssid: [entries]}
+                self.scanbybssid: DICT {bssid: [entries]}, one per interface
+            entry = {"ssid", "bssid", "signal", "chan", "freq", "band",
+                     "device", "inuse", "seen", "first"}
+                seen is the time.monotonic() of the last read of the table
+                where the BSS was present (see scanage()), first the one of
+                the first read since it's continuously present
+            Returns [status, entries]
+                status:
+                    1 -> OK
+                    2 -> Problem calling the Operating System, the entries
+                         are the last ones available
+        """
+        import time
+
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        with self.scanlock:
+            now = time.monotonic()
+            stale = self.scantime is None or now - self.scantime >= self.scan_maxage
+            if force_scan and (self.lastrescan is None or now - self.lastrescan >= self.rescan_interval):
+                logger.info("Rescanning WLANs...")
+                command_shell = ["nmcli","device","wifi","rescan"]
+                status,output,errors = self.os.runoscommand(command_shell, self.timeouts["scan"] if timeout is None else min(self.timeouts["scan"], timeout))
+                self.lastrescan = time.monotonic()
+                # nmcli returns before the end of the scan, give it some time
+                wait = self.rescan_wait
+                if timeout is not None:
+                    wait = max(0, min(wait, now + timeout - self.lastrescan))
+                time.sleep(wait)
+                stale = True
+            elif force_scan:
+                logger.info("Last rescan <" + str(int(now - self.lastrescan)) + ">s ago, using the scan table.")
+            if not stale:
+                return [1, self.scanentries]
+
+            status, rows = self.nmcli.terse(["SSID","BSSID","SIGNAL","CHAN","FREQ","DEVICE","IN-USE"], ["device","wifi","list"])
+            if status > 1:
+                logger.warning("Could NOT read the scan results from nmcli.")
+                return [2, self.scanentries]
+
+            read = time.monotonic()
+            entries = []
+            byssid = {}
+            bybssid = {}
+            for fields in rows:
+                if len(fields) != 7:
+                    continue
+                ssid, bssid, signal, chan, freq, device, inuse = fields
+                try:
+                    freq = int(freq.split()[0])
+                    entry = {
+                        "ssid": ssid,
+                        "bssid": bssid.upper(),
+                        "signal": int(signal),
+                        "chan": int(chan),
+                        "freq": freq,
+                        "band": self.freqband(freq),
+                        "device": device,
+                        "inuse": inuse.strip() == "*",
+                        "seen": read,
+                        "first": read
+                    }
+                except (ValueError, IndexError):
+                    continue
+                # Keep the age of the BSSs already in the table
+                for previous in self.scanbybssid.get(entry["bssid"], []):
+                    if previous["device"] == device:
+                        entry["first"] = previous["first"]
+                entries.append(entry)
+                byssid.setdefault(ssid, []).append(entry)
+                bybssid.setdefault(entry["bssid"], []).append(entry)
+            self.scanentries = entries
+            self.scanbyssid = byssid
+            self.scanbybssid = bybssid
+            self.scantime = read
+            logger.info("Scan table updated, <" + str(len(entries)) + "> BSSs seen.")
+            return [1, entries]
+
+    @staticmethod
+    def scanage(entry):
+        """
+            Returns the age, in seconds, of a scan table <entry>
+        """
+        import time
+
+        return time.monotonic() - entry["seen"]
+
+    def activeconnections(self):
+        """
+            Returns a DICT {connection name: device} with the active nmcli
+            connections, None if nmcli could not be called
+        """
+        status, active = self.nmcli.active()
+        if status > 1:
+            return None
+        return active
+
+    def checklink(self, wlaninfo, ifname):
+        """
+            Cheap check, with "iw dev <ifname> link", that <ifname> is
+            associated with the SSID of <wlaninfo>, and with its BSSID and
+            band when they are not "auto"
+            Returns True/False
+        """
+        command_shell = self.associationcommands(ifname)["link"]
+        status,output,errors = self.os.runoscommand(command_shell, self.timeouts["iw"])
+        if status > 1:
+            return False
+        link = {}
+        for line in output.stdout.decode("utf-8").splitlines():
+            line = line.strip()
+            if line.startswith("Connected to"):
+                link["bssid"] = line.split()[2].lower()
+            elif line.startswith("SSID:"):
+                link["ssid"] = line.partition(":")[2].strip()
+            elif line.startswith("freq:"):
+                link["band"] = self.freqband(float(line.split()[1]))
+        if link.get("ssid") != wlaninfo["ssid"]:
+            return False
+        if wlaninfo.get("bssid", "auto") != "auto" and link.get("bssid") != wlaninfo["bssid"].lower():
+            return False
+        if wlaninfo.get("band", "auto") != "auto" and link.get("band") != wlaninfo["band"]:
+            return False
+        return True
+
+    def checkcurrentwlan(self, wlaninfo, ifname=""):
         """
         Check if the current, active connection to WLAN is equal to the requested by wlaninfo
+        If <ifname> is indicated, the connection must be on that interface
+        The association state is cached in self.associations after each
+        successful connectWLAN(): while the cached entry is fresh
+        (association_ttl) and the configuration is the same, only the
+        link is checked. Otherwise the active nmcli connection and its
+        profile are checked too.
         :param wlaninfo: WLAN parameters to check
+        :param ifname: interface that must carry the connection, "" any
         :return: [status, message]
+            status:
+                1 -> Already connected with the requested configuration
+                2 -> Problem calling the Operating System
+                3 -> Not connected, or connected with a different configuration
         """
+        import time
+
         # Attach to LOCAL SYSLOG
         logger = self.logger
-        # Instantiate an OSshell object for calling the Operating System
-        os = OSshell(self.logname)
+        # Cached association, if any
+        for cachedifname, association in list(self.associations.items()):
+            if ifname not in ("", cachedifname) or association["wlaninfo"] != wlaninfo:
+                continue
+            if time.monotonic() - association["time"] > self.association_ttl:
+                # Too old, check it again from scratch
+                break
+            if self.checklink(wlaninfo, cachedifname):
+                logger.info("Already connected to SSID <" + str(wlaninfo["ssid"]) + "> on <" + cachedifname + ">, cached association is valid.")
+                return [1, "Already connected to SSID <" + str(wlaninfo["ssid"]) + ">."]
+            # Link changed behind our back
+            self.invalidateassociation(cachedifname)
+            break
+
         # Let's get current wlan
-        command_shell = ["nmcli", "connection", "show", "--active", wlaninfo["ssid"]]
-        status,output,errors = os.runoscommand(command_shell)
-        if status > 1:
+        active = self.activeconnections()
+        if active is None:
             #Problem calling the Operating System
-            return [2, "Problem scanning, could NOT receive information from active SSIDs..."]
-        else:
-            p1 = output.stdout.decode("utf-8").strip()
-            # Check if current ssid match with wlaninfo
-            if wlaninfo["ssid"] in p1:
-                # The ACTIVE ssid IS the one in wlaninfo
-                # get detailed information about the current wlan
-                associatedwlan = self.getAssociationInfo()
-                """
-                Esto tiene mucha miga...
-                """
-            else:
-                # The ACTIVE ssid is NOT the one in wlaninfo
-                logger.info("Current SSID is not equal to needed SSID <" + str(wlaninfo["ssid"]) + ">. Will have to disconnect and connect to the right one.")
-                return [3, "Current SSID is not equal to needed SSID <" + str(wlaninfo["ssid"]) + ">. Will have to disconnect and connect to the right one."]
+            return [2, "Problem calling nmcli, could NOT receive information from active connections..."]
+        device = active.get(wlaninfo["ssid"])
+        if device is None or (ifname != "" and device != ifname):
+            # The ACTIVE ssid is NOT the one in wlaninfo
+            logger.info("Current SSID is not equal to needed SSID <" + str(wlaninfo["ssid"]) + ">. Will have to disconnect and connect to the right one.")
+            return [3, "Current SSID is not equal to needed SSID <" + str(wlaninfo["ssid"]) + ">. Will have to disconnect and connect to the right one."]
+        # The ACTIVE ssid IS the one in wlaninfo, check the profile and the link
+        if not self.checkprofile(wlaninfo, ifname) or not self.checklink(wlaninfo, device):
+            logger.info("Current connection to SSID <" + str(wlaninfo["ssid"]) + "> does not match the requested configuration.")
+            return [3, "Current connection to SSID <" + str(wlaninfo["ssid"]) + "> does not match the requested configuration."]
+        self.cacheassociation(wlaninfo, device)
+        logger.info("Already connected to SSID <" + str(wlaninfo["ssid"]) + "> on <" + device + "> with the requested configuration.")
+        return [1, "Already connected to SSID <" + str(wlaninfo["ssid"]) + ">."]
+
+    def cacheassociation(self, wlaninfo, ifname):
+        """
+            Store in the association cache that <ifname> is connected
+            with the configuration in <wlaninfo>
+        """
+        import time
 
+        # An interface carries one connection, and a profile one interface
+        for cachedifname, association in list(self.associations.items()):
+            if association["wlaninfo"]["ssid"] == wlaninfo["ssid"]:
+                del self.associations[cachedifname]
+        self.associations[ifname] = {
+            "ssid": wlaninfo["ssid"],
+            "wlaninfo": dict(wlaninfo),
+            "time": time.monotonic()
+        }
 
+    def invalidateassociation(self, ifname=""):
+        """
+            Forget the cached association of <ifname>, or of all the
+            interfaces if <ifname> is "", and the cached nmcli connections
+        """
+        self.nmcli.invalidate()
+        if ifname == "":
+            self.associations.clear()
+        else:
+            self.associations.pop(ifname, None)
 
-    def connectWLAN(self, wlaninfo):
+    def connectWLAN(self, wlaninfo, ifname="", timing=None, timeout=None):
         """
-            Connects with indicated wlan network, using wlaninfo:
+            Connects with indicated wlan network, using wlaninfo.
+            If <ifname> is indicated, the connection is made through
+            that wireless interface.
+            If <timeout> is indicated, the scans and the connection end
+            within <timeout> seconds, each one also bounded by its own
+            timeouts[]
+            If <timing> (a DICT) is indicated, it's filled with the epoch
+            when each step ended, see Sensor.connectresult():
+                "start", "checked" (current connection), "profiled" (nmcli
+                profile), "scanned" (SSID seen in the air), "upstart" and
+                "upend" (nmcli connection up), and "ifname" (interface used)
             
             wlaninfo = {
                 "ssid":"Temp",
@@ -727,14 +1397,30 @@ class Wireless:
                 "netmask":"",
                 "gateway":"",
                 "dns1":"",
-                "dns2":""
+                "dns2":"",
+                "connect_mode":"auto",
+                "bssids":[]
             }
+            "connect_mode":"fast" scans only the band and connects straight
+            to its best BSSID (of "bssids" if not empty), see pinnedbssid()
         """
         import subprocess
         import sys
+        import time
         
         # Attach to LOCAL SYSLOG
         logger = self.logger
+        if timing is None:
+            timing = {}
+        timing["start"] = time.time()
+        timing["ifname"] = ifname
+        end = None if timeout is None else time.monotonic() + timeout
+
+        def limit(kind):
+            # Timeout of the next command, bounded by the end of the connection
+            if end is None:
+                return self.timeouts[kind]
+            return max(0, min(self.timeouts[kind], end - time.monotonic()))
         
         # Check if wlaninfo is ENABLED... otherwise return
         if wlaninfo["status"] == "disable":
@@ -742,36 +1428,60 @@ class Wireless:
             logger.info("WLAN <" + str(wlaninfo["ssid"]) + ">, administrative disable. No connection will be made.")
             return [6, "WLAN <" + str(wlaninfo["ssid"]) + ">, administrative disable. No connection will be made."]
         
+        #Check if the current connection is right
+        logger.info("Checking if current connection is ok, so can be used without modification...")
+        current = self.checkcurrentwlan(wlaninfo, ifname)[0]
+        timing["checked"] = time.time()
+        if current == 1:
+            # Nothing to do, no rescan and no reassociation
+            if ifname == "":
+                timing["ifname"] = (self.activeconnections() or {}).get(wlaninfo["ssid"], "")
+            return [1, "Already connected to SSID <" + str(wlaninfo["ssid"]) + ">."]
+
         # Let's check if all configured paramenters for the ssid 
         # are already in the list of nmcli connections
         logger.info("Check if " + wlaninfo["ssid"] + " is in the nmcli already configured connections...")
-        if self.checkSSIDnmcli(wlaninfo)[0] > 1:
+        if not self.checkprofile(wlaninfo, ifname):
             # Not in the list or some parameter is wrong
             logger.info("Let's configure the connection in nmcli...")
-            if self.addConnectionnmcli(wlaninfo)[0] > 1:
+            if self.addConnectionnmcli(wlaninfo, ifname)[0] > 1:
                 # Could NOT add the connection to nmcli... have to return with no results
                 return [2, "Could NOT create a connection in nmcli."]
+        timing["profiled"] = time.time()
         
         # WLAN network in wlaninfo is already available in the list of nmcli connections
         # logger.info("WLAN network <" + str(wlaninfo["ssid"]) + "> available in the list of nmcli connections...")
         
+        # Fast connect mode, straight to the best BSSID of the band
+        ap = ""
+        if wlaninfo.get("connect_mode", "auto") == "fast":
+            ap = self.pinnedbssid(wlaninfo, ifname, limit("scan"))
+        
         # Check that the WLAN network is present in the air
         logger.info("Checking that <" + str(wlaninfo["ssid"]) + "> is seen in the air...")
-        if self.checkSSIDair(wlaninfo, True)[0] > 1:
+        if ap == "" and self.checkSSIDair(wlaninfo)[0] > 1 and self.checkSSIDair(wlaninfo, True, limit("scan"))[0] > 1:
             # SSID not found in the list of visible SSIDs
             logger.warning("SSID <" + str(wlaninfo["ssid"]) + ">, NOT RF visible... CAN'T CONNECT")
             return [3, "SSID <"+wlaninfo["ssid"]+">, NOT visible in the last scanned... CAN'T CONNECT"]
         logger.info("SSID <" + str(wlaninfo["ssid"]) + "> is RF visible... can connect.")
+        timing["scanned"] = time.time()
 
-        #Check if the current connection is right
-        logger.info("Checking if current connection is ok, so can be used without modification...")
-
-
-        # Connect
+        # Connect, if there is time left
+        if limit("connect") <= 0:
+            logger.warning("No time left to connect with the SSID <" + str(wlaninfo["ssid"]) + ">.")
+            return [7, "No time left to connect with the SSID <" + str(wlaninfo["ssid"]) + ">."]
         logger.info("Connecting with the SSID <" + str(wlaninfo["ssid"]) + ">...")
         command_shell = ["nmcli","connection","up",wlaninfo["ssid"]]
-        status,output,errors = self.os.runoscommand(command_shell)
+        if ifname != "":
+            command_shell += ["ifname",ifname]
+        if ap != "":
+            command_shell += ["ap",ap]
+        timing["upstart"] = time.time()
+        status,output,errors = self.os.runoscommand(command_shell, limit("connect"))
+        timing["upend"] = time.time()
         
+        # The interface is (re)associating, the cached state is no longer valid
+        self.invalidateassociation(ifname)
         if status > 1:
             # ERROR calling Operating System
             logger.info("ERROR calling the Operating System for connecting to the right SSID.")
@@ -780,12 +1490,271 @@ class Wireless:
             if output.returncode == 0:
                 # SUCCESS!!! Connected to SSID
                 logger.info("SUCCESS!!! Successfully connected to SSID <" + str(wlaninfo["ssid"]) + ">.")
+                if ifname == "":
+                    ifname = (self.activeconnections() or {}).get(wlaninfo["ssid"], "")
+                    timing["ifname"] = ifname
+                if ifname != "":
+                    self.cacheassociation(wlaninfo, ifname)
                 return [1, output.stdout.decode("utf-8").strip()]
             else:
                 # Problem in nmcli
                 logger.info("Problem in nmcli connecting to SSID <" + str(wlaninfo["ssid"]) + ">.")
                 return [5, output.stdout.decode("utf-8").strip()]
                 
+    def bandfrequencies(self, ifname, band):
+        """
+            Returns the LIST of frequencies (MHz) of <band> ("bg", "a",
+            "6g") enabled in the phy of <ifname>, from the inventory
+            [] if unknown
+        """
+        phy = self.phys.get(self.getinterfaceinfo(ifname).get("phy", ""), {"bands": {}})
+        channels = phy["bands"].get(band, {}).get("channels", [])
+        return [channel["freq"] for channel in channels if not channel["disabled"]]
+
+    @staticmethod
+    def parseiwscan(text):
+        """
+            Parse the output of "iw dev <ifname> scan"
+            Returns a LIST of BSSs {"bssid", "ssid", "freq", "signal"}
+                bssid in upper case, signal in dBm
+        """
+        bsss = []
+        bss = None
+        for line in text.splitlines():
+            stripped = line.strip()
+            if line.startswith("BSS "):
+                bss = {"bssid": stripped[4:21].upper(), "ssid": "", "freq": 0, "signal": -100.0}
+                bsss.append(bss)
+            elif bss is None:
+                continue
+            elif stripped.startswith("freq:"):
+                bss["freq"] = int(float(stripped.split()[1]))
+            elif stripped.startswith("signal:"):
+                bss["signal"] = float(stripped.split()[1])
+            elif stripped.startswith("SSID:"):
+                bss["ssid"] = stripped[5:].strip()
+        return bsss
+
+    def pinnedbssid(self, wlaninfo, ifname="", timeout=None):
+        """
+            Fast connect mode ("connect_mode": "fast" in wlaninfo): scan
+            with "iw dev <ifname> scan" only the channels of the band of
+            wlaninfo (all if "auto") and only its SSID, and choose the BSS
+            with the best signal, among the "bssid"/"bssids" of wlaninfo
+            if indicated. The scan takes a fraction of a full scan, and the
+            connection goes straight to that BSSID in the right band.
+            The scan is killed after <timeout> seconds, timeouts["scan"]
+            if not indicated
+            Returns the BSSID, "" if none was found (or the scan failed)
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        ifname = self.profileinterface(wlaninfo, ifname)
+        band = wlaninfo.get("band", "auto")
+        bssids = [bssid.upper() for bssid in wlaninfo.get("bssids", [])]
+        if wlaninfo.get("bssid", "auto") != "auto":
+            bssids.append(wlaninfo["bssid"].upper())
+
+        command_shell = ["sudo", "/sbin/iw", "dev", ifname, "scan"]
+        freqs = self.bandfrequencies(ifname, band) if band != "auto" else []
+        if freqs:
+            command_shell += ["freq"] + [str(freq) for freq in freqs]
+        command_shell += ["ssid", wlaninfo["ssid"]]
+        logger.info("Scanning <" + str(len(freqs) or "all") + "> channels for <" + wlaninfo["ssid"] + "> on <" + ifname + ">...")
+        status,output,errors = self.os.runoscommand(command_shell, self.timeouts["scan"] if timeout is None else timeout)
+        if status > 1 or output.returncode:
+            # Busy with another scan, or no permission
+            logger.warning("Pinned scan failed on <" + ifname + ">, using the scan table.")
+            return ""
+
+        candidates = []
+        for bss in self.parseiwscan(output.stdout.decode("utf-8")):
+            if bss["ssid"] != wlaninfo["ssid"] or (bssids and bss["bssid"] not in bssids):
+                continue
+            if band != "auto" and band != self.freqband(bss["freq"]):
+                continue
+            candidates.append(bss)
+        if not candidates:
+            logger.info("No BSS of <" + wlaninfo["ssid"] + "> found in band <" + band + ">.")
+            return ""
+        best = max(candidates, key=lambda bss: bss["signal"])
+        logger.info("Best BSS of <" + wlaninfo["ssid"] + "> is <" + best["bssid"] + ">, freq <" + str(best["freq"]) + ">, signal <" + str(best["signal"]) + ">.")
+        return best["bssid"]
+
+    def reachable(self, ifname, timeout):
+        """
+            Ping the default gateway of <ifname>, once a second, until it
+            answers or <timeout> seconds
+            Returns the seconds until the first answer, None if no answer
+            or no gateway
+        """
+        import time
+
+        start = time.time()
+        gateway = self.sysfs.gateway(ifname)
+        if gateway == "":
+            return None
+        command_shell = ["ping", "-n", "-c", "1", "-W", "1", "-I", ifname, gateway]
+        while time.time() - start < timeout:
+            status,output,errors = self.os.runoscommand(command_shell, 2)
+            if status == 20:
+                return None
+            if status == 1 and output.returncode == 0:
+                return time.time() - start
+        return None
+
+    def stationsampler(self, ifname, window):
+        """
+            Returns a StationSampler of <ifname>, not started, at sample_rate
+            Hz with room for a test of <window> seconds
+        """
+        rate = min(10, max(1, self.sample_rate))
+        return StationSampler(self, ifname, rate, window, self.logname)
+
+    def survey(self, ifname):
+        """
+            Read the channel survey of <ifname> with "iw dev <ifname> survey dump"
+            Returns a DICT {freq: counters}, {} if it can't be read
+                counters = {"inuse", "noise", "active", "busy", "rx", "tx"}
+                times in ms, cumulative since the driver started counting
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        command_shell = ["sudo", "/sbin/iw", "dev", ifname, "survey", "dump"]
+        status,p1,errors = self.os.runoscommand(command_shell, self.timeouts["iw"])
+        if status > 1:
+            logger.warning("Could NOT read the channel survey of <" + ifname + ">: " + str(errors))
+            return {}
+        return self.parsesurvey(p1.stdout.decode("utf-8"))
+
+    @staticmethod
+    def parsesurvey(text):
+        """
+            Parse the output of "iw dev <ifname> survey dump"
+            Returns a DICT {freq: counters}, see survey()
+        """
+        keys = {
+            "channel active time": "active",
+            "channel busy time": "busy",
+            "channel receive time": "rx",
+            "channel transmit time": "tx"
+        }
+        channels = {}
+        channel = None
+        for line in text.splitlines():
+            key, _, value = line.strip().partition(":")
+            value = value.strip()
+            if line.startswith("Survey data from"):
+                channel = None
+            elif key == "frequency":
+                channel = {"inuse": "[in use]" in value, "noise": 0, "active": 0, "busy": 0, "rx": 0, "tx": 0}
+                channels[int(float(value.split()[0]))] = channel
+            elif channel is not None and key == "noise":
+                channel["noise"] = int(value.split()[0])
+            elif channel is not None and key in keys:
+                channel[keys[key]] = int(value.split()[0])
+        return channels
+
+    def channelutilization(self, ifname):
+        """
+            Take a channel survey of <ifname> and return the utilization of
+            the channels since the previous survey of <ifname>, the first
+            one only sets the baseline.
+            Only the counters of the last survey are kept, so surveying
+            before and after each test costs one "iw survey dump" per test.
+            Returns a DICT with the channel fields of the result records:
+                "channels": tuple of ChannelSurvey, sorted by frequency
+                "channel_freq", "channel_noise", "channel_busy",
+                "channel_rx", "channel_tx": of the channel in use
+            {} if there is no baseline or the survey can't be read
+        """
+        current = self.survey(ifname)
+        previous = self.surveys.get(ifname)
+        if current:
+            self.surveys[ifname] = current
+        if not current or previous is None:
+            return {}
+        channels = []
+        for freq, counters in sorted(current.items()):
+            before = previous.get(freq, {})
+            delta = {}
+            for key in ("active", "busy", "rx", "tx"):
+                delta[key] = counters[key] - before.get(key, 0)
+            if min(delta.values()) < 0:
+                # The driver restarted the counters
+                delta = {key: counters[key] for key in delta}
+            if delta["active"] <= 0:
+                # The radio was not on this channel
+                continue
+            channels.append(ChannelSurvey(freq, counters["inuse"], counters["noise"], delta["active"],
+                                          delta["busy"] / delta["active"], delta["rx"] / delta["active"],
+                                          delta["tx"] / delta["active"]))
+        utilization = {"channels": tuple(channels)}
+        for channel in channels:
+            if channel.inuse:
+                utilization.update({"channel_freq": channel.freq, "channel_noise": channel.noise,
+                                    "channel_busy": channel.busy, "channel_rx": channel.rx, "channel_tx": channel.tx})
+        return utilization
+
+    def assigninterfaces(self, wlaninfos):
+        """
+            Assign a wireless interface to each WLAN in <wlaninfos>, a LIST
+            of wlaninfo (the "configuration" of each WLAN), so several WLANs
+            can be tested at the same time, one per radio.
+            WLANs in band "a" (5GHz) go to 5GHz capable interfaces when
+            possible, the rest of WLANs are spread over the least loaded
+            interface.
+            Returns a LIST of interface names, in the same order as <wlaninfos>
+        """
+        # Attach to LOCAL SYSLOG
+        logger = self.logger
+
+        interfaces = [wlan_interface["logical name"] for wlan_interface in self.wirelessinfo]
+        dualband = [wlan_interface["logical name"] for wlan_interface in self.wirelessinfo if self.supportsband(wlan_interface, "a")]
+        load = dict.fromkeys(interfaces, 0)
+        assigned = [""] * len(wlaninfos)
+
+        if len(interfaces) == 0:
+            logger.warning("No wireless interfaces available, can NOT assign interfaces to WLANs.")
+            return assigned
+
+        # First 5GHz WLANs, as they have less candidates, then the rest
+        order = sorted(range(len(wlaninfos)), key=lambda i: wlaninfos[i]["band"] != "a")
+        for i in order:
+            candidates = interfaces
+            if wlaninfos[i]["band"] == "a" and len(dualband) > 0:
+                candidates = dualband
+            ifname = min(candidates, key=lambda name: load[name])
+            load[ifname] += 1
+            assigned[i] = ifname
+            logger.info("WLAN <" + str(wlaninfos[i]["ssid"]) + "> assigned to interface <" + ifname + ">.")
+
+        return assigned
+
+    @staticmethod
+    def supportsband(wlan_interface, band):
+        """
+            Returns True if <wlan_interface> supports <band> ("bg", "a"...),
+            with at least one enabled channel
+        """
+        if "phyinfo" not in wlan_interface:
+            # Inventory without phy capabilities, two bands are bg and a
+            return band == "bg" or wlan_interface.get("Bands", 1) == 2
+        channels = wlan_interface["phyinfo"]["bands"].get(band, {}).get("channels", [])
+        return any(not channel["disabled"] for channel in channels)
+
+    def getinterfaceinfo(self, ifname):
+        """
+            Returns the entry of self.wirelessinfo for interface <ifname>,
+            or {} if there is no such interface
+        """
+        for wlan_interface in self.wirelessinfo:
+            if wlan_interface["logical name"] == ifname:
+                return wlan_interface
+        return {}
+
     def pprint(self):
         import json
         return print(json.dumps(self.wirelessinfo, indent=2))